@@ -0,0 +1,174 @@
+"""
+Compares the sync and async redirector views under Django's ASGI handler.
+
+Requests are fed straight into the ASGI application, so the numbers cover
+the full middleware stack and the sync-to-async hop without any network
+noise. Caches are bypassed unless ``--with-cache`` is given, so every
+request waits on the database (with caches on, the sync pass warms them
+for the async one).
+
+Usage (from backend/):
+    python -m benchmarks.async_views --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.utils import (benchmark_database, print_results, setup_django,
+                              summarize, write_results)
+
+# Both view flavours side by side; installed as ROOT_URLCONF while running
+urlpatterns = []
+
+
+def _build_urlpatterns():
+    from django.urls import path
+    from redirector.views import (aprivate_redirect, apublic_redirect,
+                                  private_redirect, public_redirect)
+
+    urlpatterns[:] = [
+        path('sync/public/<str:redirect_identifier>/', public_redirect),
+        path('sync/private/<str:redirect_identifier>/', private_redirect),
+        path('async/public/<str:redirect_identifier>/', apublic_redirect),
+        path('async/private/<str:redirect_identifier>/', aprivate_redirect),
+    ]
+
+
+async def asgi_get(application, path, headers=()):
+    """Performs one GET request against an ASGI application"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), *headers],
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+    }
+    status = None
+    request_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await application(scope, receive, send)
+    disconnected.set()
+    return status
+
+
+async def run_scenario(application, paths, headers, concurrency):
+    latencies = []
+    statuses = {}
+    queue = list(paths)
+    queue.reverse()
+
+    async def worker():
+        while queue:
+            path = queue.pop()
+            started = time.perf_counter()
+            status = await asgi_get(application, path, headers)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started, statuses
+
+
+def create_dataset(rules):
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from url_management.models import RedirectRule
+
+    user = User.objects.create_user(username="benchmark", password="benchmark")
+    RedirectRule.objects.bulk_create([
+        RedirectRule(
+            owner=user,
+            redirect_url=f"https://example.com/{i}",
+            is_private=i % 2 == 1,
+            redirect_identifier=f"{i:08x}",
+        )
+        for i in range(rules)
+    ])
+    client = Client()
+    client.force_login(user)
+    return client.cookies["sessionid"].value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rules", type=int, default=1000)
+    parser.add_argument("--with-cache", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.core.handlers.asgi import ASGIHandler
+    from django.test import override_settings
+
+    _build_urlpatterns()
+    overrides = {
+        "ROOT_URLCONF": __name__,
+        "ALLOWED_HOSTS": ["*"],
+        "DEBUG": False,
+    }
+    if not args.with_cache:
+        overrides.update(
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+            REDIRECTOR_CACHE={"MAX_SIZE": 0, "TTL": 0},
+            REDIRECTOR_NEGATIVE_FILTER={"ENABLED": False},
+        )
+
+    results = []
+    with override_settings(**overrides), benchmark_database():
+        session_key = create_dataset(args.rules)
+        cookie = [(b"cookie", f"sessionid={session_key}".encode())]
+        application = ASGIHandler()
+        rng = random.Random(args.seed)
+        for visibility, remainder, headers in (
+            ("public", 0, []),
+            ("private", 1, cookie),
+        ):
+            identifiers = [
+                f"{rng.randrange(remainder, args.rules, 2):08x}"
+                for _ in range(args.requests)
+            ]
+            for flavour in ("sync", "async"):
+                paths = [f"/{flavour}/{visibility}/{i}/" for i in identifiers]
+                latencies, elapsed, statuses = asyncio.run(
+                    run_scenario(application, paths, headers, args.concurrency)
+                )
+                results.append(summarize(
+                    f"{flavour}_{visibility}_redirect",
+                    latencies,
+                    elapsed,
+                    statuses={str(k): v for k, v in sorted(statuses.items())},
+                ))
+
+        print_results(results)
+        if args.output:
+            write_results(args.output, "async_views", results, vars(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Connection churn benchmark: redirects with and without the connection pool.
+
+Serves uncached redirect lookups through Django's WSGI handler from
+``--threads`` threads, once per connection mode:
+
+- ``none``: a new connection per request (``CONN_MAX_AGE = 0``, no pool),
+- ``persistent``: one connection kept per thread (``CONN_MAX_AGE``),
+- ``pool``: connections checked out of the per-process pool
+  (``main_app.db.postgresql``), with prepared lookup statements.
+
+Each result row reports the physical connections opened next to the
+latencies. Needs PostgreSQL (``ENV=dev`` and the ``DB_*`` variables).
+
+Usage (from backend/):
+    python -m benchmarks.connections --requests 5000 --threads 8
+"""
+import argparse
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.dataset import Dataset, HotKeySampler, generate_dataset
+from benchmarks.suite import issue_tokens, redirect_requests, wsgi_request
+from benchmarks.utils import (Timer, benchmark_database, print_results,
+                              setup_django, summarize, write_results)
+
+MODES = ["none", "persistent", "pool"]
+
+
+def counting_connection_factory():
+    from main_app.db.postgresql.base import PreparingConnection
+
+    class CountingConnection(PreparingConnection):
+        opened = 0
+        lock = threading.Lock()
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            with CountingConnection.lock:
+                CountingConnection.opened += 1
+
+    return CountingConnection
+
+
+def configure(connection, mode, pool_options):
+    """Switches the connection mode of the default database"""
+    settings_dict = connection.settings_dict
+    connection.close()
+    connection.close_pool()
+    settings_dict["CONN_MAX_AGE"] = 600 if mode == "persistent" else 0
+    settings_dict["POOL"] = pool_options if mode == "pool" else None
+    settings_dict["PREPARED_STATEMENTS"] = mode == "pool"
+
+
+def run_mode(name, application, requests, threads):
+    """Runs the requests on a thread pool, then closes every thread's connection"""
+    from django.db import connections
+
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def perform(request):
+        method, path, headers, body = request
+        with Timer() as timer:
+            status, _ = wsgi_request(application, method, path, headers, body)
+        with lock:
+            latencies.append(timer.elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    with ThreadPoolExecutor(threads) as executor:
+        with Timer() as timer:
+            list(executor.map(perform, requests))
+        # Persistent connections belong to their thread, so close them there
+        barrier = threading.Barrier(threads)
+
+        def close():
+            barrier.wait()
+            connections.close_all()
+
+        list(executor.map(lambda _: close(), range(threads)))
+    return summarize(
+        name,
+        latencies,
+        timer.elapsed,
+        statuses={str(k): v for k, v in sorted(statuses.items())},
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rules", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000, help="Requests per mode")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=8, help="MAX_SIZE of the pool")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent, 0 is uniform")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+    from django.test import override_settings
+
+    if not hasattr(connection, "connection_pool"):
+        sys.exit("The connection benchmark needs PostgreSQL with the main_app.db.postgresql engine.")
+
+    factory = counting_connection_factory()
+    connection.settings_dict["OPTIONS"]["connection_factory"] = factory
+    pool_options = {
+        **(connection.settings_dict.get("POOL") or {}),
+        "MIN_SIZE": 0,
+        "MAX_SIZE": args.pool_size,
+    }
+    # Every lookup reaches the database
+    overrides = {
+        "ALLOWED_HOSTS": ["*"],
+        "DEBUG": False,
+        "CACHES": {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+        "REDIRECTOR_CACHE": {"MAX_SIZE": 0, "TTL": 0},
+        "REDIRECTOR_NEGATIVE_FILTER": {"ENABLED": False},
+        "REDIRECTOR_CLICKS": {**settings.REDIRECTOR_CLICKS, "ENABLED": False},
+    }
+
+    results = []
+    with override_settings(**overrides), benchmark_database():
+        dataset = Dataset(args.rules, users=args.users, private_ratio=0.2)
+        generate_dataset(dataset)
+        tokens = issue_tokens(dataset)
+        sampler = HotKeySampler(args.rules, skew=args.skew, seed=args.seed)
+        requests = redirect_requests(dataset, sampler, tokens, False, args.requests)
+        application = WSGIHandler()
+
+        for mode in args.modes:
+            configure(connection, mode, pool_options)
+            opened = factory.opened
+            row = run_mode(mode, application, requests, args.threads)
+            row["connections_opened"] = factory.opened - opened
+            if mode == "pool":
+                row["pool"] = connection.connection_pool.stats()
+            results.append(row)
+            print(f"{mode}: {row['connections_opened']} connections opened", file=sys.stderr)
+        configure(connection, "none", pool_options)
+
+    print_results(results)
+    if args.output:
+        write_results(args.output, "connections", results, vars(args))
+
+
+if __name__ == "__main__":
+    main()
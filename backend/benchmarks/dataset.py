@@ -0,0 +1,141 @@
+"""
+Synthetic redirect rule datasets for the benchmarks.
+
+Every rule is derived from its index alone, so a dataset of any size is
+reproducible without keeping it in memory: rule ``i`` has the primary key
+``UUID(int=i + 1)``, the legacy hex identifier ``f"{i:08x}"`` (which the
+identifier allocator never hands out), is owned by user ``i % users`` and
+is private for a fixed share of the indexes. ``HotKeySampler`` draws
+indexes with a Zipf-like skew so a few rules get most of the traffic, the
+way short links do.
+"""
+import math
+import random
+import uuid
+
+__all__ = ["SIZES", "Dataset", "HotKeySampler", "generate_dataset", "parse_size"]
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+# Knuth's multiplicative hash spreads private rules evenly over the indexes
+_PRIVATE_HASH = 2654435761
+
+
+def parse_size(value):
+    """Accepts a named size (10k, 1m, 10m) or a plain number of rules"""
+    value = value.lower()
+    if value in SIZES:
+        return SIZES[value]
+    try:
+        size = int(value.replace("_", ""))
+    except ValueError:
+        raise ValueError(f"invalid dataset size: {value!r}") from None
+    if size < 1:
+        raise ValueError("dataset size must be positive")
+    return size
+
+
+class Dataset:
+    """Describes the rules written by ``generate_dataset``"""
+
+    def __init__(self, rules, users=100, private_ratio=0.2):
+        self.rules = rules
+        self.users = users
+        self.private_ratio = private_ratio
+        self.user_ids = []
+
+    def identifier(self, index):
+        return f"{index:08x}"
+
+    def pk(self, index):
+        return uuid.UUID(int=index + 1)
+
+    def is_private(self, index):
+        return (index * _PRIVATE_HASH) % 1000 < self.private_ratio * 1000
+
+    def owner_id(self, index):
+        return self.user_ids[index % self.users]
+
+    def username(self, number):
+        return f"benchmark-{number}"
+
+    def redirect_url(self, index):
+        return f"https://example.com/{index}"
+
+
+class HotKeySampler:
+    """
+    Draws rule indexes with a bounded Zipf distribution.
+
+    Rank ``r`` (0 is the hottest) is drawn with probability proportional to
+    ``1 / (r + 1) ** skew`` using the inverse of the continuous
+    approximation, then mapped to an index through a multiplicative
+    permutation so hot rules are scattered over the table instead of being
+    the oldest rows. ``skew=0`` samples uniformly.
+    """
+
+    def __init__(self, size, skew=1.1, seed=0):
+        self.size = size
+        self.skew = skew
+        self.random = random.Random(seed)
+        multiplier = max(1, int(size * 0.6180339887)) | 1
+        while math.gcd(multiplier, size) != 1:
+            multiplier += 2
+        self.multiplier = multiplier
+
+    def rank(self):
+        u = self.random.random()
+        if self.skew == 0:
+            return int(u * self.size)
+        if self.skew == 1:
+            rank = math.exp(u * math.log(self.size + 1)) - 1
+        else:
+            exponent = 1 - self.skew
+            rank = ((u * ((self.size + 1) ** exponent - 1)) + 1) ** (1 / exponent) - 1
+        return min(self.size - 1, int(rank))
+
+    def index(self, rank):
+        return rank * self.multiplier % self.size
+
+    def sample(self, predicate=None):
+        """Returns one index, restricted to indexes matching ``predicate``"""
+        while True:
+            index = self.index(self.rank())
+            if predicate is None or predicate(index):
+                return index
+
+
+def generate_dataset(dataset, batch_size=10_000, progress=None):
+    """
+    Writes the users and rules of ``dataset`` to the current database.
+
+    Rows go through ``bulk_create`` directly, so no ``redirect_rules_created``
+    notifications are sent: the caches are empty and the negative filter is
+    built from the table on first use anyway.
+    """
+    from django.contrib.auth.models import User
+    from url_management.models import RedirectRule
+
+    User.objects.bulk_create([
+        User(username=dataset.username(number), password="!")
+        for number in range(dataset.users)
+    ])
+    usernames = [dataset.username(number) for number in range(dataset.users)]
+    user_ids = dict(User.objects.filter(username__in=usernames).values_list("username", "pk"))
+    dataset.user_ids = [user_ids[username] for username in usernames]
+
+    for start in range(0, dataset.rules, batch_size):
+        stop = min(start + batch_size, dataset.rules)
+        RedirectRule.objects.bulk_create([
+            RedirectRule(
+                id=dataset.pk(index),
+                owner_id=dataset.owner_id(index),
+                redirect_url=dataset.redirect_url(index),
+                is_private=dataset.is_private(index),
+                redirect_identifier=dataset.identifier(index),
+            )
+            for index in range(start, stop)
+        ])
+        if progress is not None:
+            progress(stop)
+    return dataset
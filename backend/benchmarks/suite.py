@@ -0,0 +1,267 @@
+"""
+Benchmark suite for redirect resolution, rule management and ingestion.
+
+Generates a synthetic dataset (see ``benchmarks.dataset``) in a throwaway
+database and times, through Django's WSGI handler:
+
+- ``public_redirect`` and ``private_redirect`` on hot-key skewed lookups,
+- rule creation with ``RedirectRuleListCreateAPI`` (``POST /url/``),
+- ``RedirectRuleManageAPI`` updates (``PATCH``) and deletes (``DELETE``),
+- ``load_redirect_rules`` on a generated NDJSON file.
+
+The database is the configured one: run with ``ENV=local`` for SQLite (kept
+in a temporary file, not in memory) and with ``ENV=dev`` and the ``DB_*``
+variables for PostgreSQL. Results are written as JSON with ``--output``
+so runs on different releases or databases can be compared.
+
+Usage (from backend/):
+    python -m benchmarks.suite --size 10k --output results.json
+"""
+import argparse
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.dataset import (Dataset, HotKeySampler, generate_dataset,
+                                parse_size)
+from benchmarks.utils import (Timer, benchmark_database, print_results,
+                              setup_django, summarize, write_results)
+
+SCENARIOS = ["public_redirect", "private_redirect", "create", "update", "delete", "load"]
+
+
+def wsgi_request(application, method, path, headers=None, body=None):
+    """Performs one request against a WSGI application"""
+    payload = b"" if body is None else json.dumps(body).encode()
+    environ = {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "SCRIPT_NAME": "",
+        "QUERY_STRING": "",
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": "127.0.0.1",
+        "HTTP_HOST": "localhost",
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(payload)),
+        "wsgi.input": io.BytesIO(payload),
+        "wsgi.errors": sys.stderr,
+        "wsgi.url_scheme": "http",
+        "wsgi.version": (1, 0),
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in (headers or {}).items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = value
+
+    status = None
+
+    def start_response(status_line, response_headers, exc_info=None):
+        nonlocal status
+        status = int(status_line.split(" ", 1)[0])
+
+    response = application(environ, start_response)
+    try:
+        content = b"".join(response)
+    finally:
+        if hasattr(response, "close"):
+            response.close()
+    return status, content
+
+
+def run_requests(name, application, requests):
+    """Times (method, path, headers, body) requests one after the other"""
+    latencies = []
+    statuses = {}
+    contents = []
+    with Timer() as timer:
+        for method, path, headers, body in requests:
+            with Timer() as request_timer:
+                status, content = wsgi_request(application, method, path, headers, body)
+            latencies.append(request_timer.elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+            contents.append((status, content))
+    row = summarize(
+        name,
+        latencies,
+        timer.elapsed,
+        statuses={str(k): v for k, v in sorted(statuses.items())},
+    )
+    return row, contents
+
+
+def issue_tokens(dataset):
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    users = User.objects.in_bulk(dataset.user_ids)
+    return {
+        user_id: f"Bearer {AccessToken.for_user(users[user_id])}"
+        for user_id in dataset.user_ids
+    }
+
+
+def redirect_requests(dataset, sampler, tokens, private, count):
+    route = "private" if private else "public"
+    requests = []
+    for _ in range(count):
+        index = sampler.sample(lambda i: dataset.is_private(i) == private)
+        headers = {"Authorization": tokens[dataset.owner_id(index)]} if private else {}
+        requests.append(("GET", f"/redirect/{route}/{dataset.identifier(index)}/", headers, None))
+    return requests
+
+
+def write_ndjson(path, count, private_ratio):
+    with open(path, "w") as f:
+        for number in range(count):
+            f.write(json.dumps({
+                "redirect_url": f"https://example.net/loaded/{number}",
+                "is_private": number % 100 < private_ratio * 100,
+            }))
+            f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", default="10k", help="10k, 1m, 10m or a number of rules")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--private-ratio", type=float, default=0.2)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent, 0 is uniform")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per redirect scenario")
+    parser.add_argument("--warmup", type=int, default=200, help="Untimed requests before each redirect scenario")
+    parser.add_argument("--writes", type=int, default=500, help="Requests per write scenario")
+    parser.add_argument("--load-rules", type=int, default=20000, help="Records loaded by load_redirect_rules")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rules per dataset insert")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--no-cache", action="store_true", help="Bypass every redirector cache")
+    parser.add_argument("--fast-path", action="store_true", help="Serve redirects through the fast path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+    try:
+        rules = parse_size(args.size)
+    except ValueError as e:
+        parser.error(str(e))
+
+    setup_django()
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.management import call_command
+    from django.test import override_settings
+    from redirector.clicks import get_click_buffer
+    from redirector.fastpath import RedirectFastPathWSGI
+
+    overrides = {
+        "ALLOWED_HOSTS": ["*"],
+        "DEBUG": False,
+        "REDIRECTOR_FAST_PATH": args.fast_path,
+    }
+    if args.no_cache:
+        overrides.update(
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+            REDIRECTOR_CACHE={"MAX_SIZE": 0, "TTL": 0},
+            REDIRECTOR_NEGATIVE_FILTER={"ENABLED": False},
+        )
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory, override_settings(**overrides):
+        directory = Path(directory)
+        with benchmark_database(sqlite_file=directory / "benchmark.sqlite3"):
+            dataset = Dataset(rules, users=args.users, private_ratio=args.private_ratio)
+            step = max(rules // 10, args.batch_size)
+
+            def progress(done):
+                if done % step == 0 or done == rules:
+                    print(f"{done} rules generated", file=sys.stderr)
+
+            with Timer() as timer:
+                generate_dataset(dataset, batch_size=args.batch_size, progress=progress)
+            results.append({
+                "name": "generate_dataset",
+                "requests": rules,
+                "elapsed_s": round(timer.elapsed, 4),
+                "rps": round(rules / timer.elapsed, 1),
+            })
+
+            application = RedirectFastPathWSGI(WSGIHandler())
+            tokens = issue_tokens(dataset)
+            sampler = HotKeySampler(rules, skew=args.skew, seed=args.seed)
+
+            for private in (False, True):
+                name = "private_redirect" if private else "public_redirect"
+                if name not in args.scenarios:
+                    continue
+                if args.warmup:
+                    run_requests("warmup", application, redirect_requests(
+                        dataset, sampler, tokens, private, args.warmup
+                    ))
+                row, _ = run_requests(name, application, redirect_requests(
+                    dataset, sampler, tokens, private, args.requests
+                ))
+                results.append(row)
+                # Pending clicks would otherwise be written during the next scenario
+                get_click_buffer().flush()
+
+            created = []
+            if {"create", "delete"} & set(args.scenarios):
+                requests = []
+                for number in range(args.writes):
+                    user_id = dataset.user_ids[number % dataset.users]
+                    requests.append(("POST", "/url/", {"Authorization": tokens[user_id]}, {
+                        "redirect_url": f"https://example.org/created/{number}",
+                        "is_private": dataset.is_private(number),
+                    }))
+                row, contents = run_requests("create", application, requests)
+                if "create" in args.scenarios:
+                    results.append(row)
+                created = [
+                    (json.loads(content)["id"], requests[number][2])
+                    for number, (status, content) in enumerate(contents)
+                    if status == 201
+                ]
+
+            if "update" in args.scenarios:
+                requests = []
+                for number in range(args.writes):
+                    index = sampler.sample()
+                    requests.append((
+                        "PATCH",
+                        f"/url/{dataset.pk(index)}/",
+                        {"Authorization": tokens[dataset.owner_id(index)]},
+                        {"redirect_url": f"https://example.org/updated/{number}"},
+                    ))
+                results.append(run_requests("update", application, requests)[0])
+
+            if "delete" in args.scenarios:
+                requests = [("DELETE", f"/url/{pk}/", headers, None) for pk, headers in created]
+                results.append(run_requests("delete", application, requests)[0])
+
+            if "load" in args.scenarios:
+                path = directory / "rules.ndjson"
+                write_ndjson(path, args.load_rules, args.private_ratio)
+                with Timer() as timer:
+                    call_command(
+                        "load_redirect_rules",
+                        username=dataset.username(0),
+                        file=str(path),
+                        format="ndjson",
+                        stdout=io.StringIO(),
+                    )
+                results.append({
+                    "name": "load_redirect_rules",
+                    "requests": args.load_rules,
+                    "elapsed_s": round(timer.elapsed, 4),
+                    "rps": round(args.load_rules / timer.elapsed, 1),
+                })
+
+            print_results(results)
+            if args.output:
+                parameters = {**vars(args), "rules": rules}
+                write_results(args.output, "suite", results, parameters)
+
+
+if __name__ == "__main__":
+    main()
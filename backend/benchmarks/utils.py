@@ -0,0 +1,123 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks run against a throwaway test database created on the configured
+database backend, so they never touch real data.
+"""
+import json
+import logging
+import os
+import platform
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import django
+
+__all__ = [
+    "setup_django",
+    "benchmark_database",
+    "percentile",
+    "summarize",
+    "print_results",
+    "write_results",
+    "Timer",
+]
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main_app.settings")
+    django.setup()
+    # Schema creation and per-query logging would dominate the output
+    logging.getLogger("django.db.backends").setLevel(logging.WARNING)
+
+
+@contextmanager
+def benchmark_database(sqlite_file=None):
+    """
+    Creates a test database for the duration of the block
+
+    SQLite test databases live in memory unless ``sqlite_file`` is given,
+    which flatters SQLite and caps the dataset at the available RAM.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment(debug=False)
+    old_name = connection.settings_dict["NAME"]
+    if sqlite_file and connection.vendor == "sqlite":
+        connection.settings_dict["TEST"]["NAME"] = str(sqlite_file)
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(name, latencies, elapsed, **extra):
+    """Builds a result row from per-request latencies in seconds"""
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "name": name,
+        "requests": count,
+        "elapsed_s": round(elapsed, 4),
+        "rps": round(count / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / count * 1000, 3) if count else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        **extra,
+    }
+
+
+def print_results(results, stream=None):
+    columns = ["name", "requests", "rps", "mean_ms", "p50_ms", "p90_ms", "p99_ms"]
+    widths = {
+        column: max(len(column), *(len(str(row.get(column, ""))) for row in results))
+        for column in columns
+    }
+    lines = ["  ".join(column.ljust(widths[column]) for column in columns)]
+    for row in results:
+        lines.append(
+            "  ".join(str(row.get(column, "")).ljust(widths[column]) for column in columns)
+        )
+    print("\n".join(lines), file=stream)
+
+
+def write_results(path, benchmark, results, parameters):
+    """Writes results with enough metadata to compare runs"""
+    from django.db import connection
+
+    document = {
+        "benchmark": benchmark,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "host": platform.node(),
+        "parameters": parameters,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+
+
+class Timer:
+    """Context manager measuring wall time in seconds"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
@@ -12,5 +12,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main_app.settings')
+os.environ.setdefault('SERVER_INTERFACE', 'asgi')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after setup: public redirects are answered ahead of the middleware
+from redirector.clicks import start_click_flusher  # noqa: E402
+from redirector.fastpath import RedirectFastPathASGI  # noqa: E402
+
+application = RedirectFastPathASGI(django_application)
+start_click_flusher()
@@ -0,0 +1,71 @@
+import hashlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from redirector.authentication import request_user_id
+
+from .routers import routing_state
+
+_SAFE_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "TRACE"])
+
+
+def _client_key(request):
+    """
+    The cache key of the client's primary pin: its user id from a stateless
+    credential (JWT or redirect cookie), else its session.
+    """
+    user_id = request_user_id(request)
+    if user_id is not None:
+        return f"db:primary:user:{user_id}"
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session:
+        return f"db:primary:session:{hashlib.sha256(session.encode()).hexdigest()[:32]}"
+    return None
+
+
+class DatabaseRoutingMiddleware:
+    """
+    Scopes the routing state of ``main_app.db.routers`` to each request.
+
+    Unsafe methods read from the primary. Clients whose request wrote are
+    pinned to the primary for ``DATABASE_REPLICAS['STICKINESS']`` seconds
+    through the shared cache, so owners read their own changes from any
+    worker even when the replicas lag.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS["ALIASES"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        key = _client_key(request)
+        pinned = request.method not in _SAFE_METHODS or (
+            key is not None and cache.get(key) is not None
+        )
+        with routing_state(pinned) as state:
+            response = self.get_response(request)
+        if state.wrote and key is not None:
+            cache.set(key, 1, settings.DATABASE_REPLICAS["STICKINESS"])
+        return response
+
+    async def __acall__(self, request):
+        key = _client_key(request)
+        pinned = request.method not in _SAFE_METHODS or (
+            key is not None and await cache.aget(key) is not None
+        )
+        with routing_state(pinned) as state:
+            response = await self.get_response(request)
+        if state.wrote and key is not None:
+            await cache.aset(key, 1, settings.DATABASE_REPLICAS["STICKINESS"])
+        return response
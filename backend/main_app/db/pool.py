@@ -0,0 +1,285 @@
+"""
+Thread-safe pool of DB-API connections for one process.
+
+Used by the ``main_app.db.postgresql`` backend, which returns its
+connection to the pool at the end of every request instead of closing it,
+so the TCP and authentication handshake is paid once per pooled connection
+rather than once per request.
+"""
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from functools import partial
+
+__all__ = ["ConnectionPool", "PoolTimeout"]
+
+logger = logging.getLogger("main_app.db.pool")
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the pool timeout"""
+
+
+class _Entry:
+    __slots__ = ("connection", "ref", "created", "returned", "suspect")
+
+    def __init__(self, connection, now):
+        self.connection = connection
+        self.ref = None
+        self.created = now
+        self.returned = now
+        self.suspect = False
+
+
+class ConnectionPool:
+    """
+    Keeps between ``min_size`` and ``max_size`` connections made by ``connect``.
+
+    ``getconn`` hands out the most recently returned idle connection (so
+    surplus connections go idle and are closed after ``max_idle`` seconds),
+    opens a new one below ``max_size`` and otherwise waits up to ``timeout``
+    seconds. Connections older than ``max_lifetime`` are replaced.
+
+    ``check`` runs a round trip on connections idle for ``check_interval``
+    seconds or more, and on every idle connection after one failed (the
+    server may have restarted); failing connections are discarded.
+    ``reset`` is called on returned connections, e.g. to roll back an
+    unfinished transaction, and discards them when it raises.
+
+    Connections in use are only referenced weakly when they support it: one
+    that is dropped without being returned, e.g. by a thread that exited,
+    frees its slot when it is garbage collected.
+    """
+
+    def __init__(
+        self,
+        connect,
+        min_size=0,
+        max_size=10,
+        timeout=5.0,
+        max_lifetime=3600.0,
+        max_idle=600.0,
+        check=None,
+        check_interval=30.0,
+        reset=None,
+    ):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size, max_size >= 1")
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check = check
+        self.check_interval = check_interval
+        self.reset = reset
+        self.pid = os.getpid()
+        self.closed = False
+        self._lock = threading.Condition()
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._opened = False
+        self._stats = dict.fromkeys(
+            ["connections_opened", "connections_closed", "checkouts", "waits", "timeouts",
+             "failed_checks", "reclaimed"],
+            0,
+        )
+
+    def open(self):
+        """Opens ``min_size`` connections, once"""
+        with self._lock:
+            if self._opened:
+                return
+            self._opened = True
+            missing = max(0, self.min_size - self._size)
+            self._size += missing
+        for opened in range(missing):
+            try:
+                entry = self._new_entry()
+            except Exception:
+                # Released slots are filled on demand; the next call tries again
+                with self._lock:
+                    self._size -= missing - opened
+                    self._opened = False
+                    self._lock.notify_all()
+                raise
+            with self._lock:
+                self._idle.append(entry)
+                self._lock.notify()
+
+    def _new_entry(self):
+        connection = self.connect()
+        with self._lock:
+            self._stats["connections_opened"] += 1
+        return _Entry(connection, time.monotonic())
+
+    def _expired(self, entry, now):
+        if now - entry.created >= self.max_lifetime:
+            return True
+        return now - entry.returned >= self.max_idle and self._size > self.min_size
+
+    def _discard(self, entry):
+        """Closes a connection whose slot was already released"""
+        try:
+            entry.connection.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._stats["connections_closed"] += 1
+
+    def getconn(self):
+        if self.closed:
+            raise PoolTimeout("The connection pool is closed.")
+        deadline = time.monotonic() + self.timeout
+        while True:
+            entry, expired = self._checkout(deadline)
+            for stale in expired:
+                self._discard(stale)
+            if entry is None:
+                try:
+                    entry = self._new_entry()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            elif not self._healthy(entry):
+                continue
+            connection = entry.connection
+            with self._lock:
+                self._hold(entry)
+                self._stats["checkouts"] += 1
+            return connection
+
+    def _hold(self, entry):
+        """Tracks a checked out entry, weakly where the connection allows it"""
+        key = id(entry.connection)
+        try:
+            entry.ref = weakref.ref(entry.connection, partial(self._reclaim, key))
+        except TypeError:
+            pass
+        else:
+            entry.connection = None
+        self._in_use[key] = entry
+
+    def _reclaim(self, key, ref):
+        """Frees the slot of a checked out connection that was garbage collected"""
+        with self._lock:
+            entry = self._in_use.get(key)
+            if entry is None or entry.ref is not ref:
+                return
+            del self._in_use[key]
+            self._size -= 1
+            self._stats["reclaimed"] += 1
+            self._stats["connections_closed"] += 1
+            self._lock.notify()
+        logger.warning("Reclaimed a pooled connection that was never returned")
+
+    def _checkout(self, deadline):
+        """Takes an idle entry, or a free slot (``None``) to open a connection in"""
+        expired = []
+        waited = False
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    entry = self._idle.pop()
+                    if self._expired(entry, now):
+                        self._size -= 1
+                        expired.append(entry)
+                        continue
+                    return entry, expired
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, expired
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No connection available within {self.timeout}s "
+                        f"({self.max_size} in use)."
+                    )
+                if not waited:
+                    self._stats["waits"] += 1
+                    waited = True
+                self._lock.wait(remaining)
+
+    def _healthy(self, entry):
+        if self.check is None:
+            return True
+        if not entry.suspect and time.monotonic() - entry.returned < self.check_interval:
+            return True
+        try:
+            self.check(entry.connection)
+        except Exception as exc:
+            logger.warning("Discarding pooled connection that failed its check: %s", exc)
+            with self._lock:
+                self._size -= 1
+                self._stats["failed_checks"] += 1
+                for idle in self._idle:
+                    idle.suspect = True
+                self._lock.notify()
+            self._discard(entry)
+            return False
+        entry.suspect = False
+        return True
+
+    def putconn(self, connection, broken=False, suspect=False):
+        """
+        Returns a connection to the pool.
+
+        ``broken`` connections (and connections whose ``reset`` fails) are
+        closed; ``suspect`` ones, e.g. that raised errors, are checked before
+        their next use.
+        """
+        with self._lock:
+            entry = self._in_use.pop(id(connection), None)
+            if entry is not None:
+                entry.connection, entry.ref = connection, None
+        if entry is None:
+            # Not checked out from this pool, e.g. one that was closed and replaced
+            connection.close()
+            return
+        if not broken and self.reset is not None:
+            try:
+                self.reset(connection)
+            except Exception as exc:
+                logger.warning("Discarding pooled connection that failed its reset: %s", exc)
+                broken = True
+        now = time.monotonic()
+        if broken or self.closed or now - entry.created >= self.max_lifetime:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            self._discard(entry)
+            return
+        entry.returned = now
+        entry.suspect = suspect
+        with self._lock:
+            self._idle.append(entry)
+            self._lock.notify()
+
+    def close(self):
+        """Closes the idle connections; connections in use are closed when returned"""
+        with self._lock:
+            self.closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+            }
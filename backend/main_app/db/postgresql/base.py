@@ -0,0 +1,196 @@
+"""
+PostgreSQL backend with a per-process connection pool and prepared statements.
+
+Django's own pool (``OPTIONS["pool"]``) needs psycopg 3; this backend keeps
+psycopg2 and pools connections with ``main_app.db.pool.ConnectionPool``,
+configured by the ``POOL`` key of the database settings::
+
+    'POOL': {'MIN_SIZE': 2, 'MAX_SIZE': 10, 'TIMEOUT': 5, 'MAX_LIFETIME': 3600,
+             'MAX_IDLE': 300, 'CHECK_INTERVAL': 10}
+
+``CONN_MAX_AGE`` must be 0 with a pool: connections go back to the pool
+when Django closes them, i.e. on ``request_finished`` (which the redirect
+fast path sends too) and in ``close_old_connections`` calls of background
+threads. A connection never returned, e.g. by a thread that exited, frees
+its pool slot once garbage collected. ``CONN_HEALTH_CHECKS``
+enables the ``SELECT 1`` check of connections idle for ``CHECK_INTERVAL``
+seconds. Without ``POOL`` the backend behaves like Django's.
+
+With ``PREPARED_STATEMENTS`` set, ``execute_prepared`` prepares a statement
+once per physical connection and executes it by name afterwards, which
+skips parsing and planning of hot queries. Prepared statements do not
+survive transaction-level poolers such as PgBouncer in transaction mode.
+"""
+import os
+import threading
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.extras
+from django.core.exceptions import ImproperlyConfigured
+from django.db import ProgrammingError
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel, is_psycopg3
+from django.utils.asyncio import async_unsafe
+
+from main_app.db.pool import ConnectionPool
+
+if is_psycopg3:
+    raise ImproperlyConfigured(
+        "main_app.db.postgresql requires psycopg2; with psycopg 3 use Django's "
+        "OPTIONS['pool'] and the django.db.backends.postgresql engine."
+    )
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection remembering the statements prepared on it"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def _check(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+def _reset(connection):
+    status = connection.info.transaction_status
+    if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        raise psycopg2.InterfaceError("Connection is broken.")
+    if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The pool the current connection was checked out of
+        self._checked_out_from = None
+
+    @property
+    def prepared_statements(self):
+        return bool(self.settings_dict.get("PREPARED_STATEMENTS"))
+
+    @property
+    def connection_pool(self):
+        """
+        The pool of this process for the current database, or None.
+
+        Pools are keyed by database name as well, as creating the test
+        database switches ``NAME`` under the same alias, and by process, as
+        forked workers must not share connections with their parent.
+        """
+        options = self.settings_dict.get("POOL")
+        if self.alias == NO_DB_ALIAS or not options:
+            return None
+        key = (self.alias, self.settings_dict["NAME"], os.getpid())
+        pool = _pools.get(key)
+        if pool is None:
+            if self.settings_dict.get("CONN_MAX_AGE", 0) != 0:
+                raise ImproperlyConfigured("Pooling doesn't support persistent connections.")
+            with _pools_lock:
+                pool = _pools.get(key)
+                if pool is None:
+                    pool = _pools[key] = self._create_pool(options)
+        return pool
+
+    def _create_pool(self, options):
+        conn_params = self.get_connection_params()
+        isolation_level = self.settings_dict["OPTIONS"].get("isolation_level")
+
+        def connect():
+            connection = psycopg2.connect(**conn_params)
+            if isolation_level is not None:
+                connection.isolation_level = IsolationLevel(isolation_level)
+            psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+            return connection
+
+        return ConnectionPool(
+            connect,
+            min_size=options.get("MIN_SIZE", 0),
+            max_size=options.get("MAX_SIZE", 10),
+            timeout=options.get("TIMEOUT", 5),
+            max_lifetime=options.get("MAX_LIFETIME", 3600),
+            max_idle=options.get("MAX_IDLE", 600),
+            check=_check if self.settings_dict["CONN_HEALTH_CHECKS"] else None,
+            check_interval=options.get("CHECK_INTERVAL", 30),
+            reset=_reset,
+        )
+
+    def close_pool(self):
+        """Closes the pool of this process; call before forking workers"""
+        super().close_pool()
+        with _pools_lock:
+            for key in [key for key in _pools if key[0] == self.alias]:
+                _pools.pop(key).close()
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.setdefault("connection_factory", PreparingConnection)
+        return conn_params
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = self.connection_pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        isolation_level = self.settings_dict["OPTIONS"].get("isolation_level")
+        self.isolation_level = (
+            IsolationLevel.READ_COMMITTED if isolation_level is None
+            else IsolationLevel(isolation_level)
+        )
+        pool.open()
+        connection = pool.getconn()
+        self._checked_out_from = pool
+        return connection
+
+    def _close(self):
+        pool = self._checked_out_from
+        if self.connection is None or pool is None:
+            return super()._close()
+        self._checked_out_from = None
+        with self.wrap_database_errors:
+            pool.putconn(
+                self.connection,
+                broken=self.connection.closed != 0,
+                suspect=self.errors_occurred,
+            )
+        # Connection can no longer be used, even inside an atomic block
+        self.connection = None
+
+    def close_if_health_check_failed(self):
+        if self._checked_out_from is not None:
+            # The pool checks connections when handing them out
+            return
+        return super().close_if_health_check_failed()
+
+    def execute_prepared(self, name, sql, params):
+        """
+        Runs ``sql`` (with ``$1``-style placeholders) as the prepared statement
+        ``name`` and returns the rows.
+
+        Goes through Django's cursor, so execute wrappers and query logging
+        see the ``EXECUTE`` statements. A custom ``connection_factory`` in
+        ``OPTIONS`` must subclass ``PreparingConnection``.
+        """
+        with self.cursor() as cursor:
+            prepared = self.connection.prepared
+            if name not in prepared:
+                cursor.execute(f"PREPARE {self.ops.quote_name(name)} AS {sql}")
+                prepared.add(name)
+            placeholders = ", ".join(["%s"] * len(params))
+            try:
+                cursor.execute(f"EXECUTE {self.ops.quote_name(name)} ({placeholders})", params)
+            except ProgrammingError as exc:
+                if isinstance(exc.__cause__, psycopg2.errors.InvalidSqlStatementName):
+                    # Deallocated behind our back (DISCARD ALL); prepared again next time
+                    prepared.discard(name)
+                raise
+            return cursor.fetchall()
@@ -0,0 +1,81 @@
+"""
+Primary/replica routing.
+
+Writes go to the primary (``default``) and reads to a random replica from
+``DATABASE_REPLICAS['ALIASES']``, except for reads
+
+- inside a transaction on the primary,
+- after a write in the same request (read-your-writes),
+- in requests pinned to the primary by ``DatabaseRoutingMiddleware``:
+  unsafe methods, whose reads feed their writes, and clients that wrote
+  during the last ``DATABASE_REPLICAS['STICKINESS']`` seconds.
+
+Without replicas every query goes to the primary.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+__all__ = ["PrimaryReplicaRouter", "RoutingState", "get_routing_state", "routing_state"]
+
+_state = ContextVar("db_routing_state", default=None)
+
+
+class RoutingState:
+    """What the current request may read from and what it wrote"""
+
+    __slots__ = ("pinned", "wrote")
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def get_routing_state():
+    return _state.get()
+
+
+@contextmanager
+def routing_state(pinned=False):
+    """
+    Scopes a routing state to the block, e.g. a request.
+
+    The state is mutable, so writes made by ``sync_to_async`` threads, which
+    run in a copy of the context, still pin the rest of the request.
+    """
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS["ALIASES"]
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if state is not None and (state.pinned or state.wrote):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,289 @@
+"""
+Production server: preforked uvicorn workers sharing one listening socket.
+
+The parent binds the socket with the configured backlog and imports the
+ASGI application once (Django setup, URLconf, views), then forks the
+workers, so they start from a warm interpreter and share its memory pages.
+Workers that die are replaced. SIGTERM or SIGINT stops the workers
+gracefully, and any still running after ``--graceful-timeout`` are killed.
+
+Usage (from backend/):
+    python -m main_app.server --workers 4 --keep-alive 5 --backlog 2048
+"""
+import argparse
+import atexit
+import glob
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger("main_app.server")
+
+# Workers dying sooner than this after start count as crash loops
+MIN_WORKER_UPTIME = 5
+MAX_QUICK_DEATHS = 5
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default=os.environ.get("BIND_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int("BIND_PORT", 8000))
+    parser.add_argument(
+        "--workers", type=int, default=_env_int("WEB_WORKERS", os.cpu_count() or 1)
+    )
+    parser.add_argument(
+        "--keep-alive",
+        type=int,
+        default=_env_int("WEB_KEEP_ALIVE", 5),
+        help="Seconds an idle keep-alive connection stays open",
+    )
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=_env_int("WEB_BACKLOG", 2048),
+        help="Pending connections queued by the kernel",
+    )
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        default=_env_int("WEB_MAX_REQUESTS", 0),
+        help="Recycle a worker after this many requests, 0 never",
+    )
+    parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=_env_int("WEB_GRACEFUL_TIMEOUT", 30),
+        help="Seconds workers get to finish requests on shutdown",
+    )
+    parser.add_argument(
+        "--no-preload",
+        dest="preload",
+        action="store_false",
+        default=os.environ.get("WEB_PRELOAD", "true").lower() != "false",
+        help="Import the application in each worker instead of once before forking",
+    )
+    return parser.parse_args(argv)
+
+
+def bind_socket(host, port, backlog):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def load_application():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main_app.settings")
+    from main_app.asgi import application
+
+    return application
+
+
+def check_shared_cache(workers):
+    """
+    Refuses to fork several workers over a process-local cache: the shared
+    read-through cache, its invalidations and the negative filter would each
+    stay inside one worker, which then serves redirects another has changed.
+    """
+    if workers < 2:
+        return
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main_app.settings")
+    from django.conf import settings
+
+    for alias, options in settings.CACHES.items():
+        if options["BACKEND"].endswith(".LocMemCache"):
+            sys.exit(
+                f"The {alias!r} cache is local to each process; set CACHE_URL "
+                f"to a shared cache (redis://...) or run a single worker"
+            )
+
+
+def prepare_fork():
+    """Drops what forked workers must not share with the parent"""
+    from django.core.cache import caches
+    from django.db import connections
+
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+        # Pooled connections (see main_app.db.postgresql) are closed as well
+        if hasattr(connection, "close_pool"):
+            connection.close_pool()
+    for cache in caches.all(initialized_only=True):
+        cache.close()
+
+
+def reset_metrics_dir():
+    """
+    Starts the multiprocess metrics from empty, as their files are per
+    worker pid. Without ``PROMETHEUS_MULTIPROC_DIR``, a private directory is
+    created and exported to the workers (and returned, to be removed on
+    exit): each worker would otherwise answer scrapes with its own counts.
+    Must run before ``prometheus_client`` is imported.
+    """
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        path = tempfile.mkdtemp(prefix="prometheus-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+        return path
+    os.makedirs(path, exist_ok=True)
+    for filename in glob.glob(os.path.join(path, "*.db")):
+        os.remove(filename)
+    return None
+
+
+def worker_died(pid):
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid, path)
+
+
+def run_worker(sock, application, options):
+    import uvicorn
+
+    if application is None:
+        application = load_application()
+    config = uvicorn.Config(
+        application,
+        lifespan="off",
+        timeout_keep_alive=options.keep_alive,
+        backlog=options.backlog,
+        limit_max_requests=options.max_requests or None,
+        timeout_graceful_shutdown=options.graceful_timeout,
+        # Requests are logged by monitoring.middleware through Django's LOGGING
+        access_log=False,
+        log_config=None,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Arbiter:
+    """Forks and supervises the workers"""
+
+    def __init__(self, sock, application, options):
+        self.sock = sock
+        self.application = application
+        self.options = options
+        self.workers = {}
+        self.stopping = False
+        self.quick_deaths = 0
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return
+        # Child: uvicorn installs its own handlers for a graceful stop
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 0
+        try:
+            run_worker(self.sock, self.application, self.options)
+        except BaseException:
+            logger.exception("Worker %d failed", os.getpid())
+            code = 1
+        finally:
+            # os._exit skips the atexit handlers, which flush the buffered
+            # redirect clicks among others
+            try:
+                atexit._run_exitfuncs()
+            finally:
+                logging.shutdown()
+                os._exit(code)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def reap(self):
+        while self.workers:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            started = self.workers.pop(pid, None)
+            if started is None:
+                continue
+            worker_died(pid)
+            if not self.stopping:
+                uptime = time.monotonic() - started
+                self.quick_deaths = self.quick_deaths + 1 if uptime < MIN_WORKER_UPTIME else 0
+                logger.warning("Worker %d exited after %.1fs, replacing it", pid, uptime)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.options.workers):
+            self.spawn()
+        logger.info(
+            "Serving on %s:%d with %d workers", self.options.host, self.options.port,
+            self.options.workers,
+        )
+        while not self.stopping:
+            self.reap()
+            if self.quick_deaths >= MAX_QUICK_DEATHS:
+                logger.error("Workers keep dying on start, giving up")
+                self.stopping = True
+                break
+            while not self.stopping and len(self.workers) < self.options.workers:
+                self.spawn()
+            time.sleep(0.2)
+        return self.shutdown()
+
+    def shutdown(self):
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.options.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            os.waitpid(pid, 0)
+            worker_died(pid)
+        self.workers.clear()
+        return 1 if self.quick_deaths >= MAX_QUICK_DEATHS else 0
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.workers < 1:
+        sys.exit("--workers must be positive")
+    metrics_dir = reset_metrics_dir()
+    try:
+        check_shared_cache(options.workers)
+        sock = bind_socket(options.host, options.port, options.backlog)
+        application = None
+        if options.preload:
+            application = load_application()
+            prepare_fork()
+        code = Arbiter(sock, application, options).run()
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
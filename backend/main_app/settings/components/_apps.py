@@ -16,6 +16,7 @@ INSTALLED_APPS = [
     # Local apps
     'url_management.apps.UrlManagementConfig',
     'users.apps.UsersConfig',
-    'redirector.apps.RedirectorConfig'
+    'redirector.apps.RedirectorConfig',
+    'monitoring.apps.MonitoringConfig',
 
 ]
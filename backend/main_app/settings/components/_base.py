@@ -6,6 +6,13 @@ ROOT_URLCONF = 'main_app.urls'
 WSGI_APPLICATION = 'main_app.wsgi.application'
 ASGI_APPLICATION = 'main_app.asgi.application'
 
+# Native async redirector views by default when served through main_app.asgi
+REDIRECTOR_ASYNC_VIEWS = config(
+    'REDIRECTOR_ASYNC_VIEWS',
+    cast=bool,
+    default=config('SERVER_INTERFACE', default='wsgi') == 'asgi',
+)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
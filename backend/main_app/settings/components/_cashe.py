@@ -0,0 +1,49 @@
+from main_app.settings import config
+
+# locmemcache:// by default, redis://host:6379/0 in production
+CACHES = {
+    'default': config.cache_url('CACHE_URL', default='locmemcache://'),
+}
+
+# In-process LRU cache in front of the redirector lookups
+REDIRECTOR_CACHE = {
+    'MAX_SIZE': config('REDIRECTOR_CACHE_MAX_SIZE', cast=int, default=10000),
+    'TTL': config('REDIRECTOR_CACHE_TTL', cast=float, default=60),
+}
+
+# Read-through cache shared by all workers
+REDIRECTOR_SHARED_CACHE = {
+    'ALIAS': 'default',
+    # Bump to discard every entry written by a previous release
+    # (2: resolutions carry the redirect status and max-age)
+    'VERSION': config('REDIRECTOR_SHARED_CACHE_VERSION', cast=int, default=2),
+    'TTL': config('REDIRECTOR_SHARED_CACHE_TTL', cast=int, default=300),
+    'JITTER': 0.1,
+    'NEGATIVE_TTL': config('REDIRECTOR_SHARED_CACHE_NEGATIVE_TTL', cast=int, default=5),
+    'LOCK_TIMEOUT': 5,
+    'POLL_INTERVAL': 0.02,
+}
+
+# Bloom filter of existing identifiers that answers guaranteed misses
+REDIRECTOR_NEGATIVE_FILTER = {
+    'ENABLED': config('REDIRECTOR_NEGATIVE_FILTER_ENABLED', cast=bool, default=True),
+    'ERROR_RATE': 0.01,
+    # Room for rules created between rebuilds
+    'HEADROOM': 2.0,
+    'MIN_CAPACITY': 100000,
+    # Batches of created identifiers kept apart from the filter; the filter
+    # is republished with them merged in when there are more
+    'MAX_DELTAS': 1000,
+}
+
+# Memory-mapped snapshot of the public rules, written by build_redirect_snapshot.
+# Public lookups it answers skip the database; rules changed since the build
+# are marked in the shared cache, so every process changing rules needs PATH
+REDIRECTOR_SNAPSHOT = {
+    'PATH': config('REDIRECTOR_SNAPSHOT_PATH', default='') or None,
+    # Seconds between checks for a new generation of the file
+    'CHECK_INTERVAL': config('REDIRECTOR_SNAPSHOT_CHECK_INTERVAL', cast=float, default=1),
+    # Generations older than this are ignored; more than the rebuild interval
+    # plus the build time, as the change markers only last this long
+    'MAX_AGE': config('REDIRECTOR_SNAPSHOT_MAX_AGE', cast=float, default=600),
+}
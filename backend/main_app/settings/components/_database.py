@@ -1,12 +1,76 @@
 from main_app.settings import config
 
+# Per-process connection pool (see main_app.db.postgresql). Without it every
+# request opens and closes its own connection, unless DB_CONN_MAX_AGE keeps
+# one per thread (which ASGI workers, running each request in a new thread,
+# do not reuse)
+_pool = {
+    'MIN_SIZE': config('DB_POOL_MIN_SIZE', cast=int, default=2),
+    'MAX_SIZE': config('DB_POOL_MAX_SIZE', cast=int, default=10),
+    # Seconds a request waits for a connection when all are in use
+    'TIMEOUT': config('DB_POOL_TIMEOUT', cast=float, default=5),
+    'MAX_LIFETIME': config('DB_POOL_MAX_LIFETIME', cast=float, default=3600),
+    # Connections above MIN_SIZE idle this long are closed
+    'MAX_IDLE': config('DB_POOL_MAX_IDLE', cast=float, default=300),
+    # Connections idle this long get a SELECT 1 before reuse
+    'CHECK_INTERVAL': config('DB_POOL_CHECK_INTERVAL', cast=float, default=10),
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'main_app.db.postgresql',
         'NAME': config('DB_NAME'),
         'USER': config('DB_USER'),
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': config('DB_PORT'),
+        'POOL': _pool if config('DB_POOL_ENABLED', cast=bool, default=True) else None,
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', cast=int, default=0),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', cast=bool, default=True),
+        # The redirect lookups run as prepared statements (see redirector.resolver);
+        # disable behind poolers in transaction mode
+        'PREPARED_STATEMENTS': config('DB_PREPARED_STATEMENTS', cast=bool, default=True),
     },
 }
+
+# Read replicas (hot standbys of DB_HOST) as comma separated host[:port]
+for _number, _replica in enumerate(config('DB_REPLICA_HOSTS', cast=list, default=[]), 1):
+    _host, _, _port = _replica.partition(':')
+    DATABASES[f'replica_{_number}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Shards of the redirect rules (see url_management.sharding) as comma separated
+# host[:port][/name]; the order matters, append new shards at the end
+for _number, _shard in enumerate(config('DB_SHARDS', cast=list, default=[])):
+    _location, _, _name = _shard.partition('/')
+    _host, _, _port = _location.partition(':')
+    DATABASES[f'shard_{_number}'] = {
+        **DATABASES['default'],
+        'NAME': _name or DATABASES['default']['NAME'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'SHARD': True,
+    }
+
+DATABASE_SHARDS = {
+    'ALIASES': [alias for alias in DATABASES if alias.startswith('shard_')],
+    # Aliases the rules were spread over before, while reshard_redirect_rules
+    # moves them ("default" when enabling sharding)
+    'PREVIOUS_ALIASES': config('DB_SHARDS_PREVIOUS', cast=list, default=[]),
+}
+
+# Sharded rules go to their shard; redirect lookups, lists and exports read
+# from the replicas (see main_app.db.routers)
+DATABASE_ROUTERS = [
+    'url_management.sharding.ShardRouter',
+    'main_app.db.routers.PrimaryReplicaRouter',
+]
+DATABASE_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias.startswith('replica_')],
+    # Seconds clients read from the primary after writing; cover the replication lag
+    'STICKINESS': config('DB_REPLICA_STICKINESS', cast=float, default=5),
+}
@@ -1,16 +1,78 @@
+from main_app.settings import config
+
+_production = config('ENV') == 'prod'
+
+# text: plain lines written by the request threads (development)
+# json: structured records written by a background thread (see monitoring.logs)
+_log_format = config('LOG_FORMAT', default='json' if _production else 'text')
+_log_level = config('LOG_LEVEL', default='INFO')
+# Share of successful requests in the access log; warnings and errors are kept
+_requests_sample_rate = config(
+    'LOG_REQUESTS_SAMPLE_RATE', cast=float, default=0.01 if _production else 1.0
+)
+# Records per second per logger before dropping them, 0 disables; errors always pass
+_rate_limit = config('LOG_RATE_LIMIT', cast=float, default=100)
+
+_handlers = {
+    'text': {
+        'class': 'logging.StreamHandler',
+        'formatter': 'text',
+        'filters': ['request_id', 'rate_limit'],
+    },
+    'json': {
+        '()': 'monitoring.logs.QueueHandler',
+        'stream': 'ext://sys.stderr',
+        'queue_size': config('LOG_QUEUE_SIZE', cast=int, default=10000),
+        'formatter': 'json',
+        'filters': ['request_id', 'rate_limit'],
+    },
+}
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
-    "handlers": {
-        "console": {
-            "class": "logging.StreamHandler",
+    "formatters": {
+        "text": {
+            "format": "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s",
+        },
+        "json": {
+            "()": "monitoring.logs.JSONFormatter",
+        },
+    },
+    "filters": {
+        "request_id": {
+            "()": "monitoring.logs.RequestIDFilter",
         },
+        "rate_limit": {
+            "()": "monitoring.logs.RateLimitFilter",
+            "rate": _rate_limit,
+        },
+        "sample_requests": {
+            "()": "monitoring.logs.SamplingFilter",
+            "rates": {"INFO": _requests_sample_rate},
+        },
+    },
+    "handlers": {
+        "default": _handlers[_log_format],
     },
-    # inspect db queries
+    "root": {
+        "handlers": ["default"],
+        "level": _log_level,
+    },
+    # Per-statement logging is replaced by sampled per-request instrumentation
+    # (see monitoring.db); only slow statements are logged
     "loggers": {
-        "django.db.backends": {
-            "handlers": ["console"],
-            "level": "DEBUG",
+        # Through the root handler instead of Django's DEBUG-only console
+        "django": {
+            "handlers": [],
+            "level": "INFO",
+        },
+        "monitoring.requests": {
+            "filters": ["sample_requests"],
+            "level": "INFO",
+        },
+        "monitoring.db": {
+            "level": "WARNING",
         },
     },
 }
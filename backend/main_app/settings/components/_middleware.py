@@ -3,6 +3,10 @@ from main_app.settings import config
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', cast=list)
 
 MIDDLEWARE = [
+    'monitoring.middleware.RequestLogMiddleware',
+    'monitoring.middleware.MetricsMiddleware',
+    'monitoring.middleware.QueryInstrumentationMiddleware',
+    'main_app.db.middleware.DatabaseRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -13,3 +17,6 @@ MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
 ]
+
+# Serve public redirects from redirector.fastpath, ahead of MIDDLEWARE
+REDIRECTOR_FAST_PATH = config('REDIRECTOR_FAST_PATH', cast=bool, default=True)
@@ -0,0 +1,20 @@
+from main_app.settings import config
+
+# Per-request query count and DB time (see monitoring.db)
+MONITORING_QUERIES = {
+    'ENABLED': config('MONITORING_QUERIES_ENABLED', cast=bool, default=True),
+    # Share of requests instrumented, 1.0 tracks every request
+    'SAMPLE_RATE': config('MONITORING_QUERIES_SAMPLE_RATE', cast=float, default=0.01),
+    'SERVER_TIMING': config('MONITORING_QUERIES_SERVER_TIMING', cast=bool, default=True),
+    # The slowest statement of a sampled request is logged above this, 0 disables
+    'SLOW_QUERY_MS': config('MONITORING_QUERIES_SLOW_QUERY_MS', cast=float, default=100),
+}
+
+# Prometheus metrics served at /metrics (see monitoring.metrics). Multi-worker
+# servers need PROMETHEUS_MULTIPROC_DIR, an empty shared directory, which
+# main_app.server creates when unset; other servers must set it
+MONITORING_METRICS = {
+    'ENABLED': config('MONITORING_METRICS_ENABLED', cast=bool, default=True),
+    # Bearer token required from scrapers, empty for none
+    'TOKEN': config('MONITORING_METRICS_TOKEN', default=''),
+}
@@ -0,0 +1,30 @@
+from main_app.settings import config
+
+# Write-behind click counting (see redirector.clicks)
+REDIRECTOR_CLICKS = {
+    'ENABLED': config('REDIRECTOR_CLICKS_ENABLED', cast=bool, default=True),
+    'FLUSH_INTERVAL': config('REDIRECTOR_CLICKS_FLUSH_INTERVAL', cast=float, default=5),
+    # Distinct identifiers buffered before an early flush
+    'MAX_PENDING': config('REDIRECTOR_CLICKS_MAX_PENDING', cast=int, default=10000),
+    'BATCH_SIZE': 500,
+}
+
+# Retention of the traffic rollups (see compact_redirect_traffic)
+REDIRECTOR_TRAFFIC = {
+    'HOURLY_RETENTION_DAYS': config('REDIRECTOR_TRAFFIC_HOURLY_RETENTION_DAYS', cast=int, default=31),
+    # None keeps daily buckets forever
+    'DAILY_RETENTION_DAYS': config('REDIRECTOR_TRAFFIC_DAILY_RETENTION_DAYS', cast=int, default=None),
+}
+
+# Allocation of redirect identifiers (see url_management.identifiers)
+REDIRECT_IDENTIFIERS = {
+    'ALLOCATOR': config(
+        'REDIRECT_IDENTIFIERS_ALLOCATOR', default='url_management.identifiers.SequenceAllocator'
+    ),
+    'ALPHABET': '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
+    'LENGTH': config('REDIRECT_IDENTIFIERS_LENGTH', cast=int, default=8),
+    # Numbers each process reserves from the sequence at a time
+    'BLOCK_SIZE': 1000,
+    # Leading characters of identifiers generated before the allocator
+    'LEGACY_ALPHABET': '0123456789abcdef',
+}
@@ -56,3 +56,16 @@ SIMPLE_JWT = {
     "ALGORITHM": "HS256",
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
+
+# Signed cookie that authenticates private redirects without a session lookup
+REDIRECTOR_AUTH_COOKIE = {
+    "NAME": "redirect_auth",
+    "MAX_AGE": config("REDIRECTOR_AUTH_COOKIE_MAX_AGE", cast=int, default=60 * 60),
+    "PATH": "/redirect/private/",
+}
+
+# Bulk creation of redirect rules (url/bulk/)
+REDIRECT_RULES_BULK = {
+    "MAX_ITEMS": config("REDIRECT_RULES_BULK_MAX_ITEMS", cast=int, default=10000),
+    "BATCH_SIZE": 1000,
+}
@@ -6,5 +6,24 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # Stand-in read replica on the same file, mirroring default in tests;
+    # list it in DATABASE_REPLICAS['ALIASES'] to route reads to it
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+    # Stand-in shards; list them in DATABASE_SHARDS['ALIASES'] to spread the
+    # redirect rules over them
+    'shard_0': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'shard_0.sqlite3',
+        'SHARD': True,
+    },
+    'shard_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'shard_1.sqlite3',
+        'SHARD': True,
+    },
 }
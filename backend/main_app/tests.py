@@ -0,0 +1,230 @@
+import gc
+import sqlite3
+import threading
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from url_management.models import RedirectRule
+
+from .db.pool import ConnectionPool, PoolTimeout
+from .db.routers import routing_state
+
+
+class Connections:
+    """Opens in-memory SQLite connections and counts them"""
+
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self):
+        connection = sqlite3.connect(':memory:', check_same_thread=False)
+        self.opened.append(connection)
+        return connection
+
+
+def _check(connection):
+    connection.execute('SELECT 1')
+
+
+def test_pool_reuses_connections():
+    connect = Connections()
+    pool = ConnectionPool(connect, min_size=1, max_size=2)
+    pool.open()
+    assert len(connect.opened) == 1
+
+    for _ in range(100):
+        connection = pool.getconn()
+        connection.execute('SELECT 1')
+        pool.putconn(connection)
+    assert len(connect.opened) == 1
+
+    stats = pool.stats()
+    assert stats['checkouts'] == 100
+    assert stats['connections_opened'] == 1
+    assert (stats['size'], stats['idle'], stats['in_use']) == (1, 1, 0)
+
+
+def test_pool_waits_for_a_connection_up_to_the_timeout():
+    pool = ConnectionPool(Connections(), max_size=1, timeout=0.05)
+    connection = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+    pool.timeout = 5
+    threading.Timer(0.05, pool.putconn, [connection]).start()
+    assert pool.getconn() is connection
+    assert pool.stats()['waits'] == 2
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_pool_replaces_expired_and_broken_connections():
+    connect = Connections()
+    pool = ConnectionPool(connect, max_size=2, max_lifetime=0)
+    connection = pool.getconn()
+    pool.putconn(connection)
+    assert pool.getconn() is not connection
+    assert pool.stats()['connections_closed'] == 1
+
+    pool = ConnectionPool(Connections(), max_size=2)
+    connection = pool.getconn()
+    pool.putconn(connection, broken=True)
+    assert pool.stats()['size'] == 0
+    assert pool.getconn() is not connection
+
+
+def test_pool_health_checks_discard_dead_connections():
+    """Tests that a failed check gets every idle connection checked"""
+    connect = Connections()
+    pool = ConnectionPool(connect, max_size=3, check=_check, check_interval=3600)
+    connections = [pool.getconn() for _ in range(3)]
+    pool.putconn(connections[0])
+    pool.putconn(connections[1])
+    # The server went away; the last connection saw the error
+    for connection in connections:
+        connection.close()
+    pool.putconn(connections[2], suspect=True)
+
+    # The others were idle for less than check_interval but are checked too
+    connection = pool.getconn()
+    assert connection not in connections
+    assert pool.stats()['failed_checks'] == 3
+    assert len(connect.opened) == 4
+
+    pool.putconn(connection)
+    assert pool.getconn() is connection
+    assert pool.stats()['failed_checks'] == 3
+
+
+def test_pool_resets_returned_connections():
+    def reset(connection):
+        if connection.in_transaction:
+            raise RuntimeError('Unfinished transaction')
+
+    pool = ConnectionPool(Connections(), max_size=1, reset=reset)
+    connection = pool.getconn()
+    connection.execute('CREATE TABLE t (id INTEGER)')
+    connection.execute('INSERT INTO t VALUES (1)')
+    pool.putconn(connection)
+    assert pool.stats()['size'] == 0
+    assert pool.getconn() is not connection
+
+
+def test_closed_pool_closes_returned_connections():
+    pool = ConnectionPool(Connections(), max_size=2)
+    idle, in_use = pool.getconn(), pool.getconn()
+    pool.putconn(idle)
+    pool.close()
+    pool.putconn(in_use)
+    assert pool.stats()['size'] == 0
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+
+class WeakConnection(sqlite3.Connection):
+    """SQLite connection that can be referenced weakly, like psycopg2's"""
+
+
+def test_pool_reclaims_connections_that_are_never_returned(caplog):
+    pool = ConnectionPool(
+        lambda: sqlite3.connect(':memory:', factory=WeakConnection), max_size=1, timeout=0.05
+    )
+    connection = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    del connection
+    # SQLite connections are part of a reference cycle with their statement cache
+    gc.collect()
+    assert pool.stats()['in_use'] == 0
+    assert pool.stats()['reclaimed'] == 1
+    assert 'never returned' in caplog.text
+
+    connection = pool.getconn()
+    pool.putconn(connection)
+    assert pool.getconn() is connection
+
+
+def test_pool_open_failures_release_their_slots():
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        raise sqlite3.OperationalError('Connection refused')
+
+    pool = ConnectionPool(connect, min_size=2, max_size=2)
+    for _ in range(2):
+        with pytest.raises(sqlite3.OperationalError):
+            pool.open()
+    with pytest.raises(sqlite3.OperationalError):
+        pool.getconn()
+    assert len(attempts) == 3
+    assert pool.stats()['size'] == 0
+
+
+@pytest.fixture
+def replica(settings):
+    """Routes reads to the stand-in replica, which mirrors default in tests"""
+    settings.DATABASE_REPLICAS = {'ALIASES': ['replica'], 'STICKINESS': 5}
+    cache.clear()
+    yield 'replica'
+    cache.clear()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_router_reads_from_replicas_until_a_write(replica):
+    assert RedirectRule.objects.all().db == 'replica'
+    with transaction.atomic():
+        assert RedirectRule.objects.all().db == 'default'
+
+    with routing_state() as state:
+        assert RedirectRule.objects.all().db == 'replica'
+        User.objects.create_user(username='writer')
+        assert state.wrote
+        assert RedirectRule.objects.all().db == 'default'
+    with routing_state(pinned=True):
+        assert RedirectRule.objects.all().db == 'default'
+    assert RedirectRule.objects.all().db == 'replica'
+
+
+@pytest.mark.django_db
+def test_router_without_replicas():
+    assert RedirectRule.objects.all().db == 'default'
+
+
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+def test_clients_that_wrote_stick_to_the_primary(replica, settings):
+    """Tests that owners read their own writes from the primary for a while"""
+    user = User.objects.create_user(username='owner', password='password123')
+    client = APIClient(headers={'Authorization': f'Bearer {AccessToken.for_user(user)}'})
+
+    def queries(method, *args, **kwargs):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as secondary:
+            response = getattr(client, method)(*args, **kwargs)
+        return response, len(primary), len(secondary)
+
+    response, primary, secondary = queries('get', '/url/')
+    assert response.status_code == 200
+    assert (primary, secondary) == (0, 2)
+
+    response, primary, secondary = queries(
+        'post', '/url/', {'redirect_url': 'https://example.com/new'}, format='json'
+    )
+    assert response.status_code == 201
+    assert primary > 0 and secondary == 0
+
+    response, primary, secondary = queries('get', '/url/')
+    assert [rule['redirect_url'] for rule in response.json()['results']] == [
+        'https://example.com/new'
+    ]
+    assert primary > 0 and secondary == 0
+
+    # The stickiness window expired
+    cache.clear()
+    response, primary, secondary = queries('get', '/url/')
+    assert len(response.json()['results']) == 1
+    assert primary == 0 and secondary > 0
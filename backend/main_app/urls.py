@@ -32,6 +32,7 @@ urlpatterns = [
     #     ),
     # ),
     path('redirect/', include('redirector.urls')),
+    path('', include('monitoring.urls')),
 ]
 
 if settings.DEBUG:
@@ -13,4 +13,11 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main_app.settings')
 
-application = get_wsgi_application()
+django_application = get_wsgi_application()
+
+# Imported after setup: public redirects are answered ahead of the middleware
+from redirector.clicks import start_click_flusher  # noqa: E402
+from redirector.fastpath import RedirectFastPathWSGI  # noqa: E402
+
+application = RedirectFastPathWSGI(django_application)
+start_click_flusher()
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'monitoring'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .metrics import multiprocess_dir, remove_dead_processes
+
+        if multiprocess_dir():
+            remove_dead_processes(multiprocess_dir())
@@ -0,0 +1,153 @@
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .metrics import DB_QUERIES, DB_QUERY_DURATION, DB_SAMPLED_REQUESTS
+
+__all__ = [
+    "QueryStats",
+    "install_query_wrapper",
+    "track_queries",
+    "should_sample",
+    "get_query_totals",
+]
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("monitoring_query_stats", default=None)
+
+
+class QueryStats:
+    """Queries executed while handling one request"""
+
+    __slots__ = ("count", "duration", "slowest_sql", "slowest_duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_sql = None
+        self.slowest_duration = 0.0
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        if duration >= self.slowest_duration:
+            self.slowest_sql = sql
+            self.slowest_duration = duration
+
+    def server_timing(self, total=None):
+        """``Server-Timing`` value; the SQL itself is never sent to clients"""
+        metrics = [f'db;dur={self.duration * 1000:.3f};desc="{self.count} queries"']
+        if self.count:
+            metrics.append(f"db-slowest;dur={self.slowest_duration * 1000:.3f}")
+        if total is not None:
+            metrics.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(metrics)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record(sql, time.perf_counter() - started)
+
+
+def install_query_wrapper(connection):
+    """
+    Adds the recording execute wrapper to ``connection`` (idempotent).
+
+    The wrapper stays installed for the life of the connection and only
+    does work while a sampled request is being tracked in the current
+    context, which ``sync_to_async`` carries over to the thread running
+    the ORM calls of async views.
+    """
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class _QueryTotals:
+    """Per-process counters over all sampled requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.queries = 0
+            self.duration = 0.0
+            self.slow_requests = 0
+
+    def add(self, stats, slow):
+        with self._lock:
+            self.requests += 1
+            self.queries += stats.count
+            self.duration += stats.duration
+            self.slow_requests += slow
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "sampled_requests": self.requests,
+                "queries": self.queries,
+                "duration_s": self.duration,
+                "slow_requests": self.slow_requests,
+            }
+
+
+_totals = _QueryTotals()
+
+
+def get_query_totals():
+    """Aggregated counters of this process since it started"""
+    return _totals.snapshot()
+
+
+def should_sample():
+    options = settings.MONITORING_QUERIES
+    rate = options["SAMPLE_RATE"]
+    return options["ENABLED"] and rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+class track_queries:
+    """
+    Records the queries executed inside the block.
+
+    On exit the counts are added to the process totals and the metrics,
+    and the slowest statement is logged if it took over ``SLOW_QUERY_MS``.
+    """
+
+    def __init__(self, label=""):
+        self.label = label
+        self.stats = QueryStats()
+
+    def __enter__(self):
+        self._token = _current.set(self.stats)
+        return self.stats
+
+    def __exit__(self, *exc_info):
+        _current.reset(self._token)
+        stats = self.stats
+        threshold = settings.MONITORING_QUERIES["SLOW_QUERY_MS"] / 1000
+        slow = threshold > 0 and stats.slowest_duration > threshold
+        _totals.add(stats, slow)
+        if settings.MONITORING_METRICS["ENABLED"]:
+            DB_SAMPLED_REQUESTS.inc()
+            DB_QUERIES.inc(stats.count)
+            DB_QUERY_DURATION.inc(stats.duration)
+        if slow:
+            logger.warning(
+                "Slow query (%.1f ms) in %s: %s",
+                stats.slowest_duration * 1000,
+                self.label,
+                stats.slowest_sql,
+            )
@@ -0,0 +1,65 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+__all__ = ["check_readiness"]
+
+logger = logging.getLogger("monitoring.health")
+
+# Set once no migration is pending; migrations are not rolled back under a
+# running server, so the plan is not computed again
+_migrated = False
+
+
+def check_database():
+    for alias in [
+        DEFAULT_DB_ALIAS,
+        *settings.DATABASE_REPLICAS["ALIASES"],
+        *settings.DATABASE_SHARDS["ALIASES"],
+    ]:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+
+def check_cache():
+    cache = caches[settings.REDIRECTOR_SHARED_CACHE["ALIAS"]]
+    cache.get("monitoring:health")
+
+
+def check_migrations():
+    global _migrated
+    if _migrated:
+        return
+    executor = MigrationExecutor(connections[DEFAULT_DB_ALIAS])
+    if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+        raise RuntimeError("Unapplied migrations")
+    _migrated = True
+
+
+CHECKS = {
+    "database": check_database,
+    "cache": check_cache,
+    "migrations": check_migrations,
+}
+
+
+def check_readiness():
+    """
+    Runs the readiness checks and returns ``(ready, results)``.
+
+    Failures are reported by exception class only; details go to the log, as
+    the endpoint is unauthenticated.
+    """
+    results = {}
+    for name, check in CHECKS.items():
+        try:
+            check()
+        except Exception as exc:
+            logger.warning("Readiness check %s failed: %s", name, exc)
+            results[name] = type(exc).__name__
+        else:
+            results[name] = "ok"
+    return all(result == "ok" for result in results.values()), results
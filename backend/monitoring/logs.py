@@ -0,0 +1,225 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+__all__ = [
+    "get_request_id",
+    "set_request_id",
+    "reset_request_id",
+    "log_request",
+    "JSONFormatter",
+    "QueueHandler",
+    "RequestIDFilter",
+    "SamplingFilter",
+    "RateLimitFilter",
+]
+
+request_logger = logging.getLogger("monitoring.requests")
+
+_request_id = ContextVar("monitoring_request_id", default=None)
+
+# Accepted from the X-Request-ID header of upstream proxies
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+# Attributes every LogRecord has; anything else was passed in ``extra``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "suppressed",
+}
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def set_request_id(value=None):
+    """Sets the id of the current request, generating one if ``value`` is not usable"""
+    if not value or not _REQUEST_ID.match(value):
+        value = uuid.uuid4().hex
+    return value, _request_id.set(value)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def log_request(view, method, path, status, duration):
+    """Writes the access log record of one request"""
+    level = logging.ERROR if status >= 500 else logging.WARNING if status >= 400 else logging.INFO
+    if request_logger.isEnabledFor(level):
+        request_logger.log(
+            level,
+            "%s %s %s",
+            method,
+            path,
+            status,
+            extra={
+                "view": view,
+                "method": method,
+                "path": path,
+                "status": status,
+                "duration_ms": round(duration * 1000, 3),
+            },
+        )
+
+
+class RequestIDFilter(logging.Filter):
+    """Adds the id of the current request to records, in the calling thread"""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = _request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a share of the records of each level.
+
+    ``rates`` maps level names to the kept fraction, e.g. ``{"INFO": 0.01}``
+    keeps 1% of the info records and every warning and error.
+    """
+
+    def __init__(self, rates=None, name=""):
+        super().__init__(name)
+        self.rates = {
+            logging.getLevelName(level) if isinstance(level, str) else level: rate
+            for level, rate in (rates or {}).items()
+        }
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1 or random.random() < rate
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per logger name: at most ``rate`` records per second with
+    bursts of ``burst``. Records above ``max_level`` are never limited. The
+    next record let through carries the number suppressed before it.
+    """
+
+    def __init__(self, rate=100.0, burst=None, max_level="WARNING", name=""):
+        super().__init__(name)
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def filter(self, record):
+        if self.rate <= 0 or record.levelno > self.max_level:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, suppressed = self._buckets.get(record.name, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[record.name] = (tokens, now, suppressed + 1)
+                return False
+            self._buckets[record.name] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the ``extra`` fields of the record"""
+
+    def format(self, record):
+        document = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None) or _request_id.get()
+        if request_id:
+            document["request_id"] = request_id
+        if getattr(record, "suppressed", None):
+            document["suppressed"] = record.suppressed
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                document[key] = value
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            document["exception"] = record.exc_text
+        if record.stack_info:
+            document["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(document, default=str)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a background thread that writes them to ``stream``.
+
+    Request threads only copy the record into a bounded queue, so a slow
+    stdout or log collector cannot stall them; when the queue is full the
+    record is dropped and counted in ``dropped``. Filters and the request id
+    run in the caller, formatting (the formatter configured for this
+    handler) in the writer thread. The writer is restarted in forked
+    workers, which do not inherit threads.
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self.listener = None
+        self._pid = None
+        self._start()
+        atexit.register(self._stop)
+
+    def _start(self):
+        self._pid = os.getpid()
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def _stop(self):
+        if self.listener is not None and self._pid == os.getpid():
+            try:
+                self.listener.stop()
+            except queue.Full:
+                # No room for the stop sentinel; the daemon writer dies with the process
+                pass
+        self.listener = None
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # The record stays in this process, so exc_info can be kept for the writer
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if not hasattr(record, "request_id"):
+            record.request_id = _request_id.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+    def close(self):
+        self._stop()
+        super().close()
@@ -0,0 +1,136 @@
+import glob
+import os
+import re
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Gauge, Histogram, generate_latest,
+                               multiprocess)
+
+__all__ = [
+    "CONTENT_TYPE_LATEST",
+    "REQUESTS",
+    "REQUESTS_IN_PROGRESS",
+    "REDIRECT_DURATION",
+    "DB_SAMPLED_REQUESTS",
+    "DB_QUERIES",
+    "DB_QUERY_DURATION",
+    "multiprocess_dir",
+    "record_request",
+    "render_metrics",
+    "view_name",
+]
+
+# Redirects are answered in well under a millisecond from the caches
+REDIRECT_BUCKETS = (
+    0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+REQUESTS = Counter(
+    "http_requests",
+    "HTTP requests by view, method and status code",
+    ["view", "method", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being handled",
+    multiprocess_mode="livesum",
+)
+REDIRECT_DURATION = Histogram(
+    "redirect_duration_seconds",
+    "Time to answer redirect requests, by outcome (public, private, not_found)",
+    ["outcome"],
+    buckets=REDIRECT_BUCKETS,
+)
+DB_SAMPLED_REQUESTS = Counter(
+    "db_sampled_requests",
+    "Requests whose queries were instrumented (see MONITORING_QUERIES)",
+)
+DB_QUERIES = Counter(
+    "db_queries",
+    "SQL statements executed by sampled requests",
+)
+DB_QUERY_DURATION = Counter(
+    "db_query_duration_seconds",
+    "Time spent in SQL statements by sampled requests",
+)
+
+# Sync and async redirect views share their labels: (view, outcome)
+REDIRECT_VIEWS = {
+    "public_redirect": ("public_redirect", "public"),
+    "apublic_redirect": ("public_redirect", "public"),
+    "private_redirect": ("private_redirect", "private"),
+    "aprivate_redirect": ("private_redirect", "private"),
+}
+
+# Anything else is counted as "other" to bound the label values
+METHODS = frozenset(["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
+
+_LIVE_FILE = re.compile(r"gauge_live\w*_(\d+)\.db$")
+
+
+def multiprocess_dir():
+    """The shared metrics directory of the workers, or None in single-process mode"""
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or None
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_dead_processes(path):
+    """
+    Drops the live gauges of workers that exited.
+
+    uvicorn has no child-exit hook to call ``mark_process_dead`` from, so
+    each worker sweeps the directory when it starts; without this the
+    in-progress gauge would keep the last value of every dead worker.
+    Counters and histograms of dead workers are kept, as they must be.
+    """
+    pids = set()
+    for filename in glob.glob(os.path.join(path, "gauge_live*.db")):
+        match = _LIVE_FILE.search(filename)
+        if match:
+            pids.add(int(match.group(1)))
+    for pid in pids:
+        if pid != os.getpid() and not _process_alive(pid):
+            multiprocess.mark_process_dead(pid, path)
+
+
+def render_metrics(path=None):
+    """
+    Returns the text exposition of all metrics.
+
+    With a multiprocess directory the values are merged from the
+    memory-mapped files of every worker, so any worker answers a scrape
+    with the same totals.
+    """
+    path = path or multiprocess_dir()
+    if path is None:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=path)
+    return generate_latest(registry)
+
+
+def record_request(view, method, status, duration):
+    """Counts one request and, for the redirect views, observes its latency"""
+    redirect = REDIRECT_VIEWS.get(view)
+    if redirect is not None:
+        view, outcome = redirect
+        REDIRECT_DURATION.labels("not_found" if status == 404 else outcome).observe(duration)
+    REQUESTS.labels(view, method if method in METHODS else "other", str(status)).inc()
+
+
+def view_name(request):
+    """The view class or function name used as the ``view`` label"""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    view = getattr(match.func, "view_class", match.func)
+    return getattr(view, "__name__", type(view).__name__)
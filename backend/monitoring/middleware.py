@@ -0,0 +1,143 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .db import should_sample, track_queries
+from .logs import log_request, reset_request_id, set_request_id
+from .metrics import REQUESTS_IN_PROGRESS, record_request, view_name
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records query count and DB time of a sample of requests.
+
+    Sampled responses carry them in a ``Server-Timing`` header (see
+    ``MONITORING_QUERIES``) and every sampled request feeds the process
+    totals of ``monitoring.db``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not should_sample():
+            return self.get_response(request)
+        started = time.perf_counter()
+        with track_queries(request.path) as stats:
+            response = self.get_response(request)
+        return self.add_server_timing(response, stats, started)
+
+    async def __acall__(self, request):
+        if not should_sample():
+            return await self.get_response(request)
+        started = time.perf_counter()
+        with track_queries(request.path) as stats:
+            response = await self.get_response(request)
+        return self.add_server_timing(response, stats, started)
+
+    def add_server_timing(self, response, stats, started):
+        if settings.MONITORING_QUERIES["SERVER_TIMING"]:
+            timing = stats.server_timing(total=time.perf_counter() - started)
+            if response.has_header("Server-Timing"):
+                timing = f"{response['Server-Timing']}, {timing}"
+            response["Server-Timing"] = timing
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Counts requests by view and status, tracks the requests in progress and
+    times the redirect views (see ``monitoring.metrics``).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.MONITORING_METRICS["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with REQUESTS_IN_PROGRESS.track_inprogress():
+            response = self.get_response(request)
+        record_request(
+            view_name(request), request.method, response.status_code, time.perf_counter() - started
+        )
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with REQUESTS_IN_PROGRESS.track_inprogress():
+            response = await self.get_response(request)
+        record_request(
+            view_name(request), request.method, response.status_code, time.perf_counter() - started
+        )
+        return response
+
+
+class RequestLogMiddleware:
+    """
+    Assigns each request an id (kept from a valid ``X-Request-ID`` header),
+    which log records carry while the request is handled and which is
+    returned in the response, and writes the access log record of the
+    request to the ``monitoring.requests`` logger.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        request_id, token = set_request_id(request.headers.get("X-Request-ID"))
+        try:
+            response = self.get_response(request)
+            response["X-Request-ID"] = request_id
+            self.log(request, response, started)
+        finally:
+            reset_request_id(token)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        request_id, token = set_request_id(request.headers.get("X-Request-ID"))
+        try:
+            response = await self.get_response(request)
+            response["X-Request-ID"] = request_id
+            self.log(request, response, started)
+        finally:
+            reset_request_id(token)
+        return response
+
+    def log(self, request, response, started):
+        log_request(
+            view_name(request),
+            request.method,
+            request.path,
+            response.status_code,
+            time.perf_counter() - started,
+        )
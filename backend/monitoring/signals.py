@@ -0,0 +1,10 @@
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .db import install_query_wrapper
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Lets sampled requests record the queries of every connection"""
+    install_query_wrapper(connection)
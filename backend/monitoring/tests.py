@@ -0,0 +1,476 @@
+import atexit
+import http.client
+import io
+import json
+import logging
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import AsyncClient
+from main_app import server
+from prometheus_client import REGISTRY
+from redirector.cache import get_local_cache, get_shared_cache
+from redirector.clicks import ClickBuffer
+from redirector.fastpath import RedirectFastPathWSGI
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from url_management.models import RedirectRule
+
+from . import health, logs
+from .db import QueryStats, get_query_totals, track_queries
+from .logs import (JSONFormatter, QueueHandler, RateLimitFilter, SamplingFilter,
+                   set_request_id)
+from .metrics import remove_dead_processes, render_metrics
+
+TIMING = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+@pytest.fixture(autouse=True)
+def sample_everything(settings):
+    """Instruments every request unless a test says otherwise"""
+    settings.MONITORING_QUERIES = {
+        'ENABLED': True,
+        'SAMPLE_RATE': 1.0,
+        'SERVER_TIMING': True,
+        'SLOW_QUERY_MS': 100,
+    }
+    get_local_cache().clear()
+    get_shared_cache().clear()
+    yield
+    get_local_cache().clear()
+    get_shared_cache().clear()
+
+
+@pytest.fixture
+def user():
+    """Creates a test user"""
+    return User.objects.create_user(username='testuser', password='password123')
+
+
+@pytest.fixture
+def private_rule(user):
+    """Creates a private redirect rule"""
+    return RedirectRule.objects.create(
+        owner=user, redirect_url='https://example.com/private', is_private=True
+    )
+
+
+@pytest.fixture
+def public_rule(user):
+    """Creates a public redirect rule"""
+    return RedirectRule.objects.create(owner=user, redirect_url='https://example.com/public')
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def _query_count(response):
+    match = TIMING.search(response['Server-Timing'])
+    assert match, response['Server-Timing']
+    return int(match.group(1))
+
+
+@pytest.mark.django_db
+def test_server_timing_reports_request_queries(user, django_assert_num_queries):
+    """Tests that the header counts the same queries Django executes"""
+    client = APIClient()
+    client.force_authenticate(user=user)
+    RedirectRule.objects.create(owner=user, redirect_url='https://example.com')
+    before = get_query_totals()
+
+    with django_assert_num_queries(1):
+        response = client.get('/url/')
+    assert response.status_code == 200
+    assert _query_count(response) == 1
+    assert 'total;dur=' in response['Server-Timing']
+
+    after = get_query_totals()
+    assert after['sampled_requests'] == before['sampled_requests'] + 1
+    assert after['queries'] == before['queries'] + 1
+
+
+@pytest.mark.django_db
+def test_unsampled_requests_are_not_instrumented(user, settings):
+    settings.MONITORING_QUERIES = {**settings.MONITORING_QUERIES, 'SAMPLE_RATE': 0}
+    client = APIClient()
+    client.force_authenticate(user=user)
+    before = get_query_totals()
+
+    response = client.get('/url/')
+    assert response.status_code == 200
+    assert not response.has_header('Server-Timing')
+    assert get_query_totals() == before
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_views_are_instrumented(private_rule, user, settings):
+    """Tests that queries run through sync_to_async reach the request's stats"""
+    settings.ROOT_URLCONF = 'redirector.tests'
+    path = f'/redirect/private/{private_rule.redirect_identifier}/'
+    response = async_to_sync(AsyncClient().get)(
+        path, headers={'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+    )
+    assert response.status_code == 302
+    assert _query_count(response) >= 1
+
+
+# The fast path closes the connection when it is done, as Django requests do
+@pytest.mark.django_db(transaction=True)
+def test_fast_path_is_instrumented(private_rule, user):
+    def fallback(environ, start_response):
+        start_response('299 Fallback', [])
+        return [b'']
+
+    captured = {}
+
+    def start_response(status, headers):
+        captured['status'], captured['headers'] = status, dict(headers)
+
+    application = RedirectFastPathWSGI(fallback)
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': f'/redirect/private/{private_rule.redirect_identifier}/',
+        'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}',
+    }
+    b''.join(application(environ, start_response))
+    assert captured['status'] == '302 Found'
+    assert TIMING.search(captured['headers']['server-timing'])
+
+
+@pytest.mark.django_db
+def test_slow_queries_are_logged(user, settings, caplog):
+    settings.MONITORING_QUERIES = {**settings.MONITORING_QUERIES, 'SLOW_QUERY_MS': 1e-6}
+    before = get_query_totals()
+    with caplog.at_level(logging.WARNING, logger='monitoring.db'):
+        with track_queries('/slow/') as stats:
+            User.objects.filter(pk=user.pk).exists()
+    assert stats.count == 1
+    assert 'FROM "auth_user"' in stats.slowest_sql
+    assert 'Slow query' in caplog.text and '/slow/' in caplog.text
+    assert get_query_totals()['slow_requests'] == before['slow_requests'] + 1
+
+
+def test_server_timing_never_includes_sql():
+    stats = QueryStats()
+    stats.record('SELECT secret FROM passwords', 0.002)
+    stats.record('SELECT 1', 0.001)
+    timing = stats.server_timing()
+    assert timing == 'db;dur=3.000;desc="2 queries", db-slowest;dur=2.000'
+    assert stats.slowest_sql == 'SELECT secret FROM passwords'
+
+
+@pytest.mark.django_db
+def test_metrics_count_requests_by_view(user, public_rule, client):
+    """Tests that requests are counted by view and redirects are timed by outcome"""
+    api_client = APIClient()
+    api_client.force_authenticate(user=user)
+    created = _sample(
+        'http_requests_total', view='RedirectRuleListCreateAPI', method='POST', status='201'
+    )
+    redirects = _sample('redirect_duration_seconds_count', outcome='public')
+    misses = _sample('redirect_duration_seconds_count', outcome='not_found')
+
+    response = api_client.post('/url/', {'redirect_url': 'https://example.com/new'}, format='json')
+    assert response.status_code == 201
+    assert client.get(f'/redirect/public/{public_rule.redirect_identifier}/').status_code == 302
+    assert client.get('/redirect/public/missing/').status_code == 404
+
+    assert _sample(
+        'http_requests_total', view='RedirectRuleListCreateAPI', method='POST', status='201'
+    ) == created + 1
+    assert _sample('redirect_duration_seconds_count', outcome='public') == redirects + 1
+    assert _sample('redirect_duration_seconds_count', outcome='not_found') == misses + 1
+    assert _sample('http_requests_in_progress') == 0
+    assert _sample('db_sampled_requests_total') > 0
+
+
+# The fast path closes the connection when it is done, as Django requests do
+@pytest.mark.django_db(transaction=True)
+def test_fast_path_requests_are_counted(public_rule):
+    captured = {}
+
+    def start_response(status, headers):
+        captured['status'] = status
+
+    before = _sample('http_requests_total', view='public_redirect', method='GET', status='302')
+    application = RedirectFastPathWSGI(lambda environ, start_response: [])
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': f'/redirect/public/{public_rule.redirect_identifier}/',
+    }
+    b''.join(application(environ, start_response))
+    assert captured['status'] == '302 Found'
+    assert _sample(
+        'http_requests_total', view='public_redirect', method='GET', status='302'
+    ) == before + 1
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client, settings):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain')
+    assert b'# TYPE redirect_duration_seconds histogram' in response.content
+
+    settings.MONITORING_METRICS = {'ENABLED': True, 'TOKEN': 'scrape-token'}
+    assert client.get('/metrics').status_code == 403
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+    assert response.status_code == 200
+
+    settings.MONITORING_METRICS = {'ENABLED': False, 'TOKEN': ''}
+    assert client.get('/metrics').status_code == 404
+
+
+def test_metrics_are_merged_across_processes(tmp_path):
+    """Tests that two worker processes are scraped as one total"""
+    script = (
+        'from monitoring.metrics import REQUESTS, REQUESTS_IN_PROGRESS\n'
+        'REQUESTS.labels("public_redirect", "GET", "302").inc(3)\n'
+        'REQUESTS_IN_PROGRESS.inc()\n'
+    )
+    for _ in range(2):
+        subprocess.run(
+            [sys.executable, '-c', script],
+            cwd=Path(__file__).resolve().parent.parent,
+            env={'PROMETHEUS_MULTIPROC_DIR': str(tmp_path)},
+            check=True,
+        )
+
+    exposition = render_metrics(tmp_path).decode()
+    assert 'http_requests_total{method="GET",status="302",view="public_redirect"} 6.0' in exposition
+    assert 'http_requests_in_progress 2.0' in exposition
+
+    # Both workers exited, so their in-progress requests no longer count
+    remove_dead_processes(tmp_path)
+    exposition = render_metrics(tmp_path).decode()
+    assert 'http_requests_in_progress 2.0' not in exposition
+    assert 'http_requests_total{method="GET",status="302",view="public_redirect"} 6.0' in exposition
+
+
+@pytest.mark.django_db
+def test_requests_get_an_id_and_an_access_log_record(user, public_rule, client, caplog):
+    with caplog.at_level(logging.INFO, logger='monitoring.requests'):
+        response = client.get(f'/redirect/public/{public_rule.redirect_identifier}/')
+        forwarded = client.get('/url/', headers={'X-Request-ID': 'edge-42'})
+        invalid = client.get('/url/', headers={'X-Request-ID': 'not valid\n'})
+
+    assert re.fullmatch(r'[0-9a-f]{32}', response['X-Request-ID'])
+    assert forwarded['X-Request-ID'] == 'edge-42'
+    assert invalid['X-Request-ID'] != 'not valid\n'
+
+    records = [r for r in caplog.records if r.name == 'monitoring.requests']
+    assert [(r.levelname, r.status) for r in records] == [
+        ('INFO', 302), ('WARNING', 401), ('WARNING', 401)
+    ]
+    assert records[0].view == 'public_redirect'
+    assert records[0].path == f'/redirect/public/{public_rule.redirect_identifier}/'
+
+
+def test_sampling_filter_keeps_errors():
+    sampling = SamplingFilter({'INFO': 0})
+
+    def record(level):
+        return logging.LogRecord('monitoring.requests', level, '', 0, 'GET /', (), None)
+
+    assert not sampling.filter(record(logging.INFO))
+    assert sampling.filter(record(logging.WARNING))
+    assert sampling.filter(record(logging.ERROR))
+    assert SamplingFilter({'INFO': 1.0}).filter(record(logging.INFO))
+
+
+def test_rate_limit_filter_per_logger(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(logs.time, 'monotonic', lambda: now[0])
+    limit = RateLimitFilter(rate=1, burst=2)
+
+    def record(name, level=logging.INFO):
+        return logging.LogRecord(name, level, '', 0, 'message', (), None)
+
+    assert [limit.filter(record('a')) for _ in range(4)] == [True, True, False, False]
+    assert limit.filter(record('b'))
+    assert limit.filter(record('a', logging.ERROR))
+
+    now[0] += 1
+    passed = record('a')
+    assert limit.filter(passed)
+    assert passed.suppressed == 2
+
+
+def test_queue_handler_writes_json_in_background():
+    stream = io.StringIO()
+    handler = QueueHandler(stream=stream)
+    handler.setFormatter(JSONFormatter())
+    logger = logging.getLogger('monitoring.tests.queue')
+    logger.addHandler(handler)
+    logger.propagate = False
+    _, token = set_request_id('req-1')
+    try:
+        logger.warning('hello %s', 'world', extra={'rule': 7})
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logger.exception('failed')
+    finally:
+        logs.reset_request_id(token)
+        logger.removeHandler(handler)
+        handler.close()
+
+    first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert first['message'] == 'hello world'
+    assert first['request_id'] == 'req-1'
+    assert first['rule'] == 7
+    assert second['level'] == 'ERROR'
+    assert 'ValueError: boom' in second['exception']
+
+
+def test_queue_handler_drops_records_when_full():
+    handler = QueueHandler(stream=io.StringIO(), queue_size=1)
+    handler.listener.stop()
+    record = logging.LogRecord('x', logging.INFO, '', 0, 'message', (), None)
+    handler.enqueue(record)
+    handler.enqueue(record)
+    assert handler.dropped == 1
+    handler.listener = None
+    handler.close()
+
+
+@pytest.mark.django_db
+def test_health_endpoints(client, monkeypatch):
+    response = client.get('/health/live')
+    assert response.status_code == 200
+    assert response.json() == {'status': 'ok'}
+
+    monkeypatch.setattr(health, '_migrated', True)
+    response = client.get('/health/ready')
+    assert response.status_code == 200
+    assert response.json()['checks'] == {'database': 'ok', 'cache': 'ok', 'migrations': 'ok'}
+
+    def unavailable():
+        raise ConnectionError('cache is down')
+
+    monkeypatch.setitem(health.CHECKS, 'cache', unavailable)
+    response = client.get('/health/ready')
+    assert response.status_code == 503
+    assert response.json() == {
+        'status': 'unavailable',
+        'checks': {'database': 'ok', 'cache': 'ConnectionError', 'migrations': 'ok'},
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _get(port, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        connection.request('GET', path, headers={'Host': 'localhost'})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def test_production_server_serves_from_preforked_workers():
+    """Tests that the workers answer on the shared socket and stop on SIGTERM"""
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'main_app.server', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', '2', '--graceful-timeout', '5'],
+        cwd=Path(__file__).resolve().parent.parent,
+        # The server makes its own metrics directory, and refuses a
+        # per-process cache for several workers
+        env={
+            **{
+                name: value for name, value in os.environ.items()
+                if name != 'PROMETHEUS_MULTIPROC_DIR'
+            },
+            'CACHE_URL': 'dummycache://',
+        },
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                status, body = _get(port, '/health/live')
+                break
+            except OSError:
+                assert process.poll() is None and time.monotonic() < deadline
+                time.sleep(0.1)
+        assert status == 200
+        assert json.loads(body) == {'status': 'ok'}
+        assert _get(port, '/metrics')[0] == 200
+    finally:
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=15) == 0
+
+
+def test_server_creates_the_metrics_dir(tmp_path, monkeypatch):
+    """Tests that the workers always share a multiprocess metrics directory"""
+    monkeypatch.delenv('PROMETHEUS_MULTIPROC_DIR', raising=False)
+    created = server.reset_metrics_dir()
+    try:
+        assert os.environ['PROMETHEUS_MULTIPROC_DIR'] == created
+        assert os.listdir(created) == []
+    finally:
+        os.rmdir(created)
+
+    (tmp_path / 'counter_123.db').write_bytes(b'')
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+    assert server.reset_metrics_dir() is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_server_refuses_a_local_cache_for_several_workers(settings, tmp_path):
+    """Tests that the workers never each keep their own cache"""
+    settings.CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    }
+    server.check_shared_cache(1)
+    with pytest.raises(SystemExit, match='CACHE_URL'):
+        server.check_shared_cache(2)
+
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': str(tmp_path),
+        },
+    }
+    server.check_shared_cache(2)
+
+
+def test_exiting_workers_flush_buffered_clicks(tmp_path, monkeypatch):
+    """Tests that a worker stopping or recycled runs its shutdown handlers"""
+    flushed = tmp_path / 'flushed'
+
+    def run_worker(sock, application, options):
+        # Leave the handlers of the test process (coverage...) to it
+        atexit._clear()
+        buffer = ClickBuffer(max_pending=100, flush_interval=3600, batch_size=100)
+
+        def write(pending):
+            flushed.write_text(str(sum(pending.values())))
+
+        buffer._write = write
+        buffer.start()
+        buffer.record('abc')
+        buffer.record('abc')
+
+    monkeypatch.setattr(server, 'run_worker', run_worker)
+    arbiter = server.Arbiter(None, None, None)
+    arbiter.spawn()
+    [pid] = arbiter.workers
+    assert os.waitpid(pid, 0)[1] == 0
+    assert flushed.read_text() == '2'
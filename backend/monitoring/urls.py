@@ -0,0 +1,9 @@
+from django.urls import path
+
+from .views import liveness, metrics, readiness
+
+urlpatterns = [
+    path('metrics', metrics, name='metrics'),
+    path('health/live', liveness, name='health-live'),
+    path('health/ready', readiness, name='health-ready'),
+]
@@ -0,0 +1,42 @@
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+
+from .health import check_readiness
+from .metrics import CONTENT_TYPE_LATEST, render_metrics
+
+
+def metrics(request):
+    """
+    Prometheus text exposition of the metrics of every worker
+
+    When ``MONITORING_METRICS['TOKEN']`` is set, scrapers must send it as a
+    bearer token.
+    """
+    options = settings.MONITORING_METRICS
+    if not options["ENABLED"]:
+        raise Http404("Metrics are disabled.")
+    if options["TOKEN"]:
+        expected = f"Bearer {options['TOKEN']}".encode()
+        given = request.headers.get("Authorization", "").encode()
+        if not hmac.compare_digest(given, expected):
+            return HttpResponseForbidden("Invalid metrics token.")
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
+def liveness(request):
+    """Answers as long as the worker serves requests, without touching any backend"""
+    return JsonResponse({"status": "ok"})
+
+
+def readiness(request):
+    """
+    Whether the worker can serve traffic: the database and the cache answer
+    and every migration is applied. Returns 503 when a check fails.
+    """
+    ready, checks = check_readiness()
+    return JsonResponse(
+        {"status": "ok" if ready else "unavailable", "checks": checks},
+        status=200 if ready else 503,
+    )
@@ -0,0 +1,102 @@
+import hashlib
+
+from django.conf import settings
+from django.core import signing
+from django.http.cookie import parse_cookie
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+__all__ = [
+    "stateless_user_id",
+    "request_user_id",
+    "set_auth_cookie",
+]
+
+_COOKIE_SALT = "redirector.authentication"
+
+
+def _token_user_id(authorization):
+    """Returns the user id of a valid ``Bearer`` access token"""
+    parts = authorization.split()
+    if len(parts) != 2 or parts[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        token = AccessToken(parts[1])
+    except TokenError:
+        return None
+    return token.get(api_settings.USER_ID_CLAIM)
+
+
+def _session_digest(session_key):
+    return hashlib.blake2b(session_key.encode(), digest_size=16).hexdigest()
+
+
+def _cookie_user_id(value, session_key):
+    """
+    Returns the user id stored in a valid signed redirect cookie issued to
+    the session ``session_key``
+    """
+    try:
+        payload = signing.loads(
+            value,
+            salt=_COOKIE_SALT,
+            max_age=settings.REDIRECTOR_AUTH_COOKIE["MAX_AGE"],
+        )
+    except signing.BadSignature:
+        return None
+    if not isinstance(payload, list) or len(payload) != 2:
+        return None
+    user_id, session = payload
+    if not session_key or session != _session_digest(session_key):
+        return None
+    return user_id
+
+
+def stateless_user_id(authorization=None, cookie_header=None):
+    """
+    Authenticates from raw headers without touching the database.
+
+    Accepts a SimpleJWT access token in the ``Authorization`` header or the
+    signed cookie set by ``set_auth_cookie``. Returns the user id as a
+    string, or ``None`` if neither is present and valid. Like SimpleJWT's
+    stateless authentication this does not re-check that the user is
+    still active, so credentials stay valid until they expire.
+
+    The cookie is only valid next to the session cookie it was issued
+    with. Logging out or in changes the session key, so the session
+    decides again, and issues a new cookie, after either.
+    """
+    user_id = None
+    if authorization:
+        user_id = _token_user_id(authorization)
+    if user_id is None and cookie_header:
+        cookies = parse_cookie(cookie_header)
+        value = cookies.get(settings.REDIRECTOR_AUTH_COOKIE["NAME"])
+        if value:
+            user_id = _cookie_user_id(value, cookies.get(settings.SESSION_COOKIE_NAME))
+    return str(user_id) if user_id is not None else None
+
+
+def request_user_id(request):
+    return stateless_user_id(
+        request.headers.get("Authorization"),
+        request.META.get("HTTP_COOKIE"),
+    )
+
+
+def set_auth_cookie(response, user_id, session_key):
+    """
+    Lets the user's following private redirects skip the session lookup,
+    as long as the browser sends the session ``session_key``
+    """
+    options = settings.REDIRECTOR_AUTH_COOKIE
+    response.set_cookie(
+        options["NAME"],
+        signing.dumps([str(user_id), _session_digest(session_key)], salt=_COOKIE_SALT),
+        max_age=options["MAX_AGE"],
+        path=options["PATH"],
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite="Lax",
+    )
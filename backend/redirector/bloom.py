@@ -0,0 +1,409 @@
+import hashlib
+import math
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from url_management.models import RedirectRule
+from url_management.sharding import on_each_shard
+
+from .cache import get_shared_cache, shared_lock
+
+__all__ = ["BloomFilter", "NegativeFilter", "get_negative_filter"]
+
+
+class BloomFilter:
+    """
+    Probabilistic set of strings without false negatives.
+
+    Sized for ``capacity`` items at the given false positive rate; bit
+    positions are derived from one BLAKE2b digest by double hashing.
+    """
+
+    def __init__(self, capacity, error_rate, *, num_bits=None, num_hashes=None,
+                 bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        if num_bits is None:
+            num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        if num_hashes is None:
+            num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray(bits) if bits is not None else bytearray((num_bits + 7) // 8)
+        self.count = count
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+    def __len__(self):
+        return self.count
+
+    def to_state(self):
+        return {
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "num_bits": self.num_bits,
+            "num_hashes": self.num_hashes,
+            "bits": bytes(self.bits),
+            "count": self.count,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(**state)
+
+
+class NegativeFilter:
+    """
+    Per-process view of the shared Bloom filter of redirect identifiers.
+
+    The filter is built by the ``rebuild_redirect_filter`` command and
+    stored in the shared cache together with a generation token. Rules
+    created afterwards are appended to a numbered delta log of that
+    generation, which workers merge into their local copy, so the filter
+    itself is only republished by a rebuild, or when ``MAX_DELTAS`` deltas
+    are folded into it. A local negative answer is
+    only trusted after checking that neither the generation nor the delta
+    log has moved on, so identifiers added by other workers are never
+    rejected. Until the filter has been built every identifier is reported
+    as present.
+    """
+
+    FILTER_KEY = "redirector:filter"
+    GENERATION_KEY = "redirector:filter:generation"
+    DELTA_KEY = "redirector:filter:delta"
+    LOCK_KEY = "redirector:filter:lock"
+    REBUILDING_KEY = "redirector:filter:rebuilding"
+    JOURNAL_KEY = "redirector:filter:journal"
+
+    def __init__(self, options, shared_options):
+        self.options = options
+        self.shared_options = shared_options
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._generation = None
+        # Deltas of the generation merged into the local copy
+        self._applied = 0
+        self._loaded = False
+        self.rejections = 0
+
+    @property
+    def _version(self):
+        return self.shared_options["VERSION"]
+
+    def _lock_shared(self, cache):
+        return shared_lock(
+            cache,
+            self.LOCK_KEY,
+            self.shared_options["LOCK_TIMEOUT"],
+            self.shared_options["POLL_INTERVAL"],
+            version=self._version,
+        )
+
+    def _count_key(self, generation):
+        return f"{self.DELTA_KEY}:{generation}"
+
+    def _delta_keys(self, generation, start, stop):
+        return [f"{self.DELTA_KEY}:{generation}:{n}" for n in range(start + 1, stop + 1)]
+
+    def _publish(self, cache, bloom):
+        previous = cache.get(self.GENERATION_KEY, version=self._version)
+        generation = uuid.uuid4().hex
+        cache.set_many(
+            {
+                self.FILTER_KEY: (generation, bloom.to_state()),
+                self.GENERATION_KEY: generation,
+                self._count_key(generation): 0,
+            },
+            None,
+            version=self._version,
+        )
+        if previous is not None:
+            count = cache.get(self._count_key(previous), 0, version=self._version)
+            cache.delete_many(
+                [self._count_key(previous), *self._delta_keys(previous, 0, count)],
+                version=self._version,
+            )
+        with self._lock:
+            self._bloom, self._generation, self._applied = bloom, generation, 0
+            self._loaded = True
+
+    def _merge(self, generation, start, keys, deltas):
+        """
+        Adds the fetched deltas to the local copy, in order and up to the
+        first one missing from the cache
+        """
+        with self._lock:
+            if generation != self._generation or self._bloom is None:
+                return
+            for number, key in enumerate(keys, start + 1):
+                if number <= self._applied:
+                    continue
+                if key not in deltas:
+                    break
+                for redirect_identifier in deltas[key]:
+                    self._bloom.add(redirect_identifier)
+                self._applied = number
+
+    def _loaded_state(self, stored):
+        if stored is None:
+            return None, None
+        generation, state = stored
+        return generation, BloomFilter.from_state(state)
+
+    def reload(self):
+        """
+        Replaces the local copy with the one in the shared cache, and
+        returns whether every delta could be merged into it
+        """
+        cache = get_shared_cache()
+        generation, bloom = self._loaded_state(
+            cache.get(self.FILTER_KEY, version=self._version)
+        )
+        with self._lock:
+            self._bloom, self._generation, self._applied = bloom, generation, 0
+            self._loaded = True
+        if generation is not None:
+            count = cache.get(self._count_key(generation), 0, version=self._version)
+            return self._catch_up(cache, generation, count)
+        return True
+
+    async def areload(self):
+        cache = get_shared_cache()
+        generation, bloom = self._loaded_state(
+            await cache.aget(self.FILTER_KEY, version=self._version)
+        )
+        with self._lock:
+            self._bloom, self._generation, self._applied = bloom, generation, 0
+            self._loaded = True
+        if generation is not None:
+            count = await cache.aget(
+                self._count_key(generation), 0, version=self._version
+            )
+            return await self._acatch_up(cache, generation, count)
+        return True
+
+    def _catch_up(self, cache, generation, count):
+        start = self._applied
+        keys = self._delta_keys(generation, start, count)
+        if keys:
+            self._merge(
+                generation, start, keys, cache.get_many(keys, version=self._version)
+            )
+        return self._applied >= count
+
+    async def _acatch_up(self, cache, generation, count):
+        start = self._applied
+        keys = self._delta_keys(generation, start, count)
+        if keys:
+            self._merge(
+                generation,
+                start,
+                keys,
+                await cache.aget_many(keys, version=self._version),
+            )
+        return self._applied >= count
+
+    def _refresh(self, cache):
+        generation = self._generation
+        stored = cache.get_many(
+            [self.GENERATION_KEY, self._count_key(generation)], version=self._version
+        )
+        if stored.get(self.GENERATION_KEY) != generation:
+            return self.reload()
+        count = stored.get(self._count_key(generation))
+        return count is not None and self._catch_up(cache, generation, count)
+
+    async def _arefresh(self, cache):
+        generation = self._generation
+        stored = await cache.aget_many(
+            [self.GENERATION_KEY, self._count_key(generation)], version=self._version
+        )
+        if stored.get(self.GENERATION_KEY) != generation:
+            return await self.areload()
+        count = stored.get(self._count_key(generation))
+        return count is not None and await self._acatch_up(cache, generation, count)
+
+    def might_contain(self, redirect_identifier):
+        """Returns False only if no rule can have the given identifier"""
+        if not self.options["ENABLED"]:
+            return True
+        if not self._loaded:
+            self.reload()
+        bloom = self._bloom
+        if bloom is None or redirect_identifier in bloom:
+            return True
+
+        # Deltas missing from the cache leave the local copy incomplete
+        if not self._refresh(get_shared_cache()):
+            return True
+        bloom = self._bloom
+        if bloom is None or redirect_identifier in bloom:
+            return True
+        self.rejections += 1
+        return False
+
+    async def amight_contain(self, redirect_identifier):
+        if not self.options["ENABLED"]:
+            return True
+        if not self._loaded:
+            await self.areload()
+        bloom = self._bloom
+        if bloom is None or redirect_identifier in bloom:
+            return True
+
+        if not await self._arefresh(get_shared_cache()):
+            return True
+        bloom = self._bloom
+        if bloom is None or redirect_identifier in bloom:
+            return True
+        self.rejections += 1
+        return False
+
+    def add(self, redirect_identifiers):
+        """
+        Appends newly created identifiers to the delta log of the shared
+        filter.
+
+        If the log cannot be updated the filter is dropped, which disables
+        negative lookups until the next rebuild rather than risking a
+        false 404.
+        """
+        if not self.options["ENABLED"]:
+            return
+        redirect_identifiers = list(redirect_identifiers)
+        cache = get_shared_cache()
+        with self._lock_shared(cache) as acquired:
+            if not acquired:
+                cache.delete_many(
+                    [self.FILTER_KEY, self.GENERATION_KEY], version=self._version
+                )
+                return
+            if cache.get(self.REBUILDING_KEY, version=self._version):
+                journal = cache.get(self.JOURNAL_KEY, [], version=self._version)
+                cache.set(
+                    self.JOURNAL_KEY,
+                    journal + redirect_identifiers,
+                    None,
+                    version=self._version,
+                )
+            generation = cache.get(self.GENERATION_KEY, version=self._version)
+            if generation is None:
+                return
+            count = cache.get(self._count_key(generation), version=self._version)
+            if count is None:
+                # Evicted: the deltas can no longer be numbered reliably
+                cache.delete_many(
+                    [self.FILTER_KEY, self.GENERATION_KEY], version=self._version
+                )
+                return
+            if count >= self.options["MAX_DELTAS"]:
+                self._fold(cache, generation, count, redirect_identifiers)
+                return
+            # The delta before its number, so readers never count past it
+            [key] = self._delta_keys(generation, count, count + 1)
+            cache.set(key, redirect_identifiers, None, version=self._version)
+            cache.set(self._count_key(generation), count + 1, None, version=self._version)
+
+    def _fold(self, cache, generation, count, redirect_identifiers):
+        """Publishes the filter with its deltas merged in, under the shared lock"""
+        stored = cache.get(self.FILTER_KEY, version=self._version)
+        keys = self._delta_keys(generation, 0, count)
+        deltas = cache.get_many(keys, version=self._version)
+        if stored is None or stored[0] != generation or len(deltas) < count:
+            cache.delete_many([self.FILTER_KEY, self.GENERATION_KEY], version=self._version)
+            return
+        bloom = BloomFilter.from_state(stored[1])
+        for key in keys:
+            for redirect_identifier in deltas[key]:
+                bloom.add(redirect_identifier)
+        for redirect_identifier in redirect_identifiers:
+            bloom.add(redirect_identifier)
+        self._publish(cache, bloom)
+
+    def rebuild(self, chunk_size=10000):
+        """
+        Builds a fresh filter from every identifier in the database.
+
+        Identifiers created while the table is being scanned are journaled
+        by ``add`` and merged in before the new filter is published.
+        Returns the number of identifiers in the new filter.
+        """
+        cache = get_shared_cache()
+        cache.set(self.REBUILDING_KEY, True, None, version=self._version)
+        try:
+            querysets = on_each_shard(
+                RedirectRule.objects.order_by().values_list("redirect_identifier", flat=True)
+            )
+            capacity = max(
+                self.options["MIN_CAPACITY"],
+                math.ceil(
+                    sum(queryset.count() for queryset in querysets) * self.options["HEADROOM"]
+                ),
+            )
+            bloom = BloomFilter(capacity, self.options["ERROR_RATE"])
+            for queryset in querysets:
+                for redirect_identifier in queryset.iterator(chunk_size=chunk_size):
+                    bloom.add(redirect_identifier)
+
+            with self._lock_shared(cache) as acquired:
+                if not acquired:
+                    raise RuntimeError("Could not lock the shared redirect filter")
+                for redirect_identifier in cache.get(
+                    self.JOURNAL_KEY, [], version=self._version
+                ):
+                    bloom.add(redirect_identifier)
+                self._publish(cache, bloom)
+                cache.delete(self.JOURNAL_KEY, version=self._version)
+        finally:
+            cache.delete(self.REBUILDING_KEY, version=self._version)
+        return len(bloom)
+
+    def stats(self):
+        bloom = self._bloom
+        return {
+            "enabled": self.options["ENABLED"] and bloom is not None,
+            "count": len(bloom) if bloom is not None else 0,
+            "capacity": bloom.capacity if bloom is not None else 0,
+            "rejections": self.rejections,
+        }
+
+
+_negative_filter = None
+
+
+def get_negative_filter():
+    """Returns the per-process negative lookup filter"""
+    global _negative_filter
+    if _negative_filter is None:
+        _negative_filter = NegativeFilter(
+            settings.REDIRECTOR_NEGATIVE_FILTER,
+            settings.REDIRECTOR_SHARED_CACHE,
+        )
+    return _negative_filter
+
+
+@receiver(setting_changed)
+def _reset_negative_filter(setting, **kwargs):
+    global _negative_filter
+    if setting in ("REDIRECTOR_NEGATIVE_FILTER", "REDIRECTOR_SHARED_CACHE"):
+        _negative_filter = None
@@ -0,0 +1,209 @@
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+__all__ = [
+    "AsyncSingleFlight",
+    "LRUCache",
+    "SingleFlight",
+    "get_local_cache",
+    "get_shared_cache",
+    "jittered",
+    "shared_lock",
+]
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe LRU cache with a per-entry time to live.
+
+    Entries are evicted in least-recently-used order once ``max_size`` is
+    reached and are treated as absent once they are older than ``ttl``
+    seconds.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Returns a snapshot of the cache counters"""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within a process.
+
+    The first caller for a key runs the function; callers that arrive while
+    it is in flight block and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent awaits for the same key on one event loop.
+
+    Async counterpart of ``SingleFlight``: waiters share the leader's task
+    instead of blocking a thread.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, func, *args):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+
+def jittered(ttl, jitter):
+    """Spreads expirations of entries written together over +/- jitter"""
+    return max(1, round(ttl * (1 + random.uniform(-jitter, jitter))))
+
+
+def get_shared_cache():
+    """Returns the Django cache shared by all workers"""
+    return caches[settings.REDIRECTOR_SHARED_CACHE["ALIAS"]]
+
+
+@contextmanager
+def shared_lock(cache, key, timeout, poll_interval, version=None):
+    """
+    Cross-worker mutex built on ``cache.add``.
+
+    Yields whether the lock was acquired within ``timeout`` seconds; the
+    lock itself expires after ``timeout`` seconds if its holder dies.
+    """
+    deadline = time.monotonic() + timeout
+    acquired = cache.add(key, 1, timeout, version=version)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        acquired = cache.add(key, 1, timeout, version=version)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cache.delete(key, version=version)
+
+
+_local_cache = None
+
+
+def get_local_cache():
+    """Returns the per-process redirect resolution cache"""
+    global _local_cache
+    if _local_cache is None:
+        options = settings.REDIRECTOR_CACHE
+        _local_cache = LRUCache(
+            max_size=options["MAX_SIZE"],
+            ttl=options["TTL"],
+        )
+    return _local_cache
+
+
+@receiver(setting_changed)
+def _reset_local_cache(setting, **kwargs):
+    """Rebuilds the cache when its settings are overridden (e.g. in tests)"""
+    global _local_cache
+    if setting == "REDIRECTOR_CACHE":
+        _local_cache = None
@@ -0,0 +1,251 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+from django.db.models import Case, F, Value, When
+from url_management.models import RedirectRule
+from url_management.sharding import group_by_shard, previous_shard_for
+from url_management.traffic import add_traffic
+
+__all__ = ["ClickBuffer", "get_click_buffer", "record_click", "start_click_flusher"]
+
+logger = logging.getLogger(__name__)
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class ClickBuffer:
+    """
+    Per-process write-behind buffer of redirect hits.
+
+    Clicks are counted in memory per identifier and hour, and written with
+    one ``UPDATE ... CASE`` statement per batch of identifiers plus the
+    hourly/daily traffic upserts (see ``url_management.traffic``), either
+    by the background flusher started from the server entry points or when
+    the buffer fills up. Once more than twice ``max_pending`` keys are
+    waiting, further clicks are dropped and counted in ``dropped`` instead
+    of growing the buffer without bound.
+
+    While rules are being resharded, clicks of rules not found on their
+    shard are written to the former one, and kept for the next flush if
+    the rule is on neither (being moved between them). Each shard commits
+    on its own, so only the clicks of a shard that failed are kept for the
+    next flush.
+    """
+
+    def __init__(self, max_pending, flush_interval, batch_size):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = Counter()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._autostart = False
+        self._pid = os.getpid()
+        self.flushed = 0
+        self.dropped = 0
+
+    def _check_fork(self):
+        # A forked worker inherits the parent's counts but not its thread
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            self._flush_lock = threading.Lock()
+            self._pending = Counter()
+            self._wakeup = threading.Event()
+            self._thread = None
+
+    def record(self, redirect_identifier):
+        self._check_fork()
+        if self._autostart and self._thread is None:
+            self.start()
+        key = (redirect_identifier, int(time.time()) // 3600)
+        with self._lock:
+            pending = len(self._pending)
+            if pending >= 2 * self.max_pending and key not in self._pending:
+                self.dropped += 1
+                return
+            self._pending[key] += 1
+        if pending + 1 >= self.max_pending:
+            if self._thread is not None:
+                self._wakeup.set()
+            elif not _in_event_loop():
+                self.flush()
+
+    def pending(self):
+        with self._lock:
+            return sum(self._pending.values())
+
+    def flush(self):
+        """Writes buffered clicks to the database and returns how many"""
+        self._check_fork()
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+            if not pending:
+                return 0
+            try:
+                kept = self._write(pending) or Counter()
+            except Exception:
+                logger.exception("Failed to flush %d redirect clicks", sum(pending.values()))
+                self._requeue(pending)
+                return 0
+            self._requeue(kept)
+            total = sum(pending.values()) - sum(kept.values())
+            self.flushed += total
+            return total
+
+    def _requeue(self, counts):
+        """Keeps counts for the next attempt while there is room"""
+        with self._lock:
+            for key, count in counts.items():
+                if len(self._pending) < 2 * self.max_pending:
+                    self._pending[key] += count
+                else:
+                    self.dropped += count
+
+    def _write(self, pending):
+        """Writes the counts and returns those to retry on the next flush"""
+        totals = Counter()
+        for (redirect_identifier, _), count in pending.items():
+            totals[redirect_identifier] += count
+        groups = group_by_shard(list(totals))
+        missing, failed = self._write_groups(pending, totals, groups)
+        written = {
+            identifier: alias for alias, identifiers in groups.items() for identifier in identifiers
+        }
+        previous = {}
+        for redirect_identifier in missing:
+            alias = previous_shard_for(redirect_identifier)
+            if alias is not None and alias != written[redirect_identifier]:
+                previous.setdefault(alias, []).append(redirect_identifier)
+        # Others are deleted rules
+        if previous:
+            missing, failed_previous = self._write_groups(pending, totals, previous)
+            if missing:
+                logger.info("Requeued clicks of %d redirect rules being moved", len(missing))
+            failed |= missing | failed_previous
+        return Counter({key: count for key, count in pending.items() if key[0] in failed})
+
+    def _write_groups(self, pending, totals, groups):
+        """
+        Writes the counts of the identifiers grouped by database, and
+        returns those without a rule there and those of the databases that
+        failed
+        """
+        missing, failed = set(), set()
+        # One transaction per shard, or a single one without shards
+        for alias, identifiers in groups.items():
+            try:
+                missing |= self._write_group(pending, totals, alias, identifiers)
+            except Exception:
+                logger.exception(
+                    "Failed to write the clicks of %d redirect rules to %s",
+                    len(identifiers), alias,
+                )
+                failed.update(identifiers)
+        return missing, failed
+
+    def _write_group(self, pending, totals, alias, identifiers):
+        missing = set()
+        items = [(identifier, totals[identifier]) for identifier in identifiers]
+        with transaction.atomic(using=alias):
+            for start in range(0, len(items), self.batch_size):
+                batch = items[start:start + self.batch_size]
+                rules = RedirectRule.objects.using(alias).filter(
+                    redirect_identifier__in=[identifier for identifier, _ in batch]
+                )
+                updated = rules.update(
+                    hits=F("hits") + Case(
+                        *[
+                            When(redirect_identifier=identifier, then=Value(count))
+                            for identifier, count in batch
+                        ],
+                        default=Value(0),
+                        output_field=models.PositiveBigIntegerField(),
+                    )
+                )
+                if updated < len(batch):
+                    found = set(rules.values_list("redirect_identifier", flat=True))
+                    missing.update(
+                        identifier for identifier, _ in batch if identifier not in found
+                    )
+            shard = set(identifiers)
+            add_traffic(
+                {key: count for key, count in pending.items() if key[0] in shard},
+                self.batch_size,
+                using=alias,
+            )
+        return missing
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def start(self):
+        """Starts the background flusher of this process (idempotent)"""
+        self._check_fork()
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="redirect-click-flusher", daemon=True
+            )
+        self._thread.start()
+        if not self._autostart:
+            self._autostart = True
+            atexit.register(self.flush)
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+        }
+
+
+_click_buffer = None
+
+
+def get_click_buffer():
+    """Returns the per-process click buffer"""
+    global _click_buffer
+    if _click_buffer is None:
+        options = settings.REDIRECTOR_CLICKS
+        _click_buffer = ClickBuffer(
+            max_pending=options["MAX_PENDING"],
+            flush_interval=options["FLUSH_INTERVAL"],
+            batch_size=options["BATCH_SIZE"],
+        )
+    return _click_buffer
+
+
+def record_click(redirect_identifier):
+    if settings.REDIRECTOR_CLICKS["ENABLED"]:
+        get_click_buffer().record(redirect_identifier)
+
+
+def start_click_flusher():
+    """Called by the WSGI/ASGI entry points of server processes"""
+    if settings.REDIRECTOR_CLICKS["ENABLED"]:
+        get_click_buffer().start()
@@ -0,0 +1,260 @@
+import time
+from contextlib import nullcontext
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from django.utils.encoding import iri_to_uri
+from monitoring.db import should_sample, track_queries
+from monitoring.logs import log_request
+from monitoring.metrics import record_request
+
+from .authentication import stateless_user_id
+from .clicks import record_click
+from .resolver import aresolve, resolve
+from .responses import redirect_headers, status_line
+
+__all__ = ["RedirectFastPathASGI", "RedirectFastPathWSGI"]
+
+_NOT_FOUND_BODY = (
+    b"<!doctype html>\n<html lang=\"en\">\n<head>\n  <title>Not Found</title>\n"
+    b"</head>\n<body>\n  <h1>Not Found</h1><p>The requested resource was not "
+    b"found on this server.</p>\n</body>\n</html>\n"
+)
+
+
+def _common_headers():
+    """Headers SecurityMiddleware and XFrameOptionsMiddleware would add"""
+    headers = []
+    if settings.SECURE_CONTENT_TYPE_NOSNIFF:
+        headers.append((b"x-content-type-options", b"nosniff"))
+    if settings.SECURE_REFERRER_POLICY:
+        policy = settings.SECURE_REFERRER_POLICY
+        if not isinstance(policy, str):
+            policy = ",".join(policy)
+        headers.append((b"referrer-policy", policy.encode()))
+    if settings.SECURE_CROSS_ORIGIN_OPENER_POLICY:
+        headers.append((
+            b"cross-origin-opener-policy",
+            settings.SECURE_CROSS_ORIGIN_OPENER_POLICY.encode(),
+        ))
+    headers.append((b"x-frame-options", settings.X_FRAME_OPTIONS.encode()))
+    return headers
+
+
+def _route_prefix(name):
+    marker = "__identifier__"
+    url = reverse(name, kwargs={"redirect_identifier": marker})
+    return url[:url.index(marker)]
+
+
+class _FastPath:
+    """
+    Serves redirects ahead of Django's request handler.
+
+    Handles ``GET``/``HEAD`` requests for the public redirect route and,
+    when the request carries stateless credentials (see
+    ``redirector.authentication``), for the private one. Everything else,
+    including misses while ``DEBUG`` is on, private rules of other users
+    and targets Django would refuse to redirect to, falls through to the
+    wrapped application. Responses are built from prebuilt header lists,
+    so a hit skips the middleware stack and the request/response objects.
+    Answered requests are still counted in the metrics, access logged and
+    sampled for query instrumentation; being sub-millisecond, they are left
+    out of the in-progress gauge and get no request id. The lookup sends
+    ``request_started`` and ``request_finished``, so database connections
+    are closed, or returned to their pool, as after any Django request.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.enabled = settings.REDIRECTOR_FAST_PATH
+        self._prefixes = None
+        self._common = None
+
+    @property
+    def prefixes(self):
+        if self._prefixes is None:
+            self._prefixes = (
+                (_route_prefix("public-redirect"), False),
+                (_route_prefix("private-redirect"), True),
+            )
+        return self._prefixes
+
+    def route(self, method, path):
+        """Returns (identifier, private) if the request is for a redirect route"""
+        if method not in ("GET", "HEAD"):
+            return None, False
+        for prefix, private in self.prefixes:
+            if path.startswith(prefix):
+                identifier = path[len(prefix):]
+                if not identifier.endswith("/"):
+                    return None, False
+                identifier = identifier[:-1]
+                if not identifier or "/" in identifier:
+                    return None, False
+                return identifier, private
+        return None, False
+
+    @property
+    def common_headers(self):
+        if self._common is None:
+            self._common = _common_headers()
+        return self._common
+
+    def track(self, path):
+        """Samples the lookup like ``QueryInstrumentationMiddleware`` would"""
+        if should_sample():
+            return track_queries(path)
+        return nullcontext()
+
+    def timing_headers(self, stats, started):
+        if stats is None or not settings.MONITORING_QUERIES["SERVER_TIMING"]:
+            return []
+        timing = stats.server_timing(total=time.perf_counter() - started)
+        return [(b"server-timing", timing.encode())]
+
+    def record(self, private, method, path, status, started):
+        """Counts and logs an answered request like the monitoring middleware would"""
+        view = "private_redirect" if private else "public_redirect"
+        duration = time.perf_counter() - started
+        if settings.MONITORING_METRICS["ENABLED"]:
+            record_request(view, method, status, duration)
+        log_request(view, method, path, status, duration)
+
+    def not_found_headers(self):
+        return [
+            (b"content-type", b"text/html; charset=utf-8"),
+            (b"content-length", str(len(_NOT_FOUND_BODY)).encode()),
+            *self.common_headers,
+        ]
+
+    def respond(self, resolution, identifier, private, user_id, method, path, stats, started):
+        """
+        Returns ``(status, headers, body)`` for a lookup, or None to let the
+        wrapped application answer
+        """
+        if private and resolution is not None and str(resolution.owner_id) != user_id:
+            return None
+        if resolution is None:
+            if settings.DEBUG:
+                return None
+            self.record(private, method, path, 404, started)
+            return (
+                404,
+                [*self.not_found_headers(), *self.timing_headers(stats, started)],
+                b"" if method == "HEAD" else _NOT_FOUND_BODY,
+            )
+
+        headers = _redirect_headers(resolution, private)
+        if headers is None:
+            return None
+        record_click(identifier)
+        self.record(private, method, path, resolution.redirect_status, started)
+        return (
+            resolution.redirect_status,
+            [*headers, *self.common_headers, *self.timing_headers(stats, started)],
+            b"",
+        )
+
+
+@lru_cache(maxsize=4096)
+def _redirect_headers(resolution, private):
+    """
+    Encoded Location and caching headers, or None if Django would refuse
+    the target
+    """
+    if urlsplit(resolution.redirect_url).scheme not in HttpResponseRedirect.allowed_schemes:
+        return None
+    return (
+        (b"content-type", b"text/html; charset=utf-8"),
+        (b"location", iri_to_uri(resolution.redirect_url).encode("latin-1")),
+        (b"content-length", b"0"),
+        *(
+            (name.lower().encode(), value.encode())
+            for name, value in redirect_headers(resolution, private)
+        ),
+    )
+
+
+class RedirectFastPathASGI(_FastPath):
+    """ASGI application serving redirects before Django"""
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            return await self.application(scope, receive, send)
+        identifier, private = self.route(scope["method"], scope["path"])
+        if identifier is None:
+            return await self.application(scope, receive, send)
+        user_id = None
+        if private:
+            headers = dict(scope["headers"])
+            user_id = stateless_user_id(
+                headers.get(b"authorization", b"").decode("latin-1"),
+                headers.get(b"cookie", b"").decode("latin-1"),
+            )
+            if user_id is None:
+                return await self.application(scope, receive, send)
+
+        started = time.perf_counter()
+        await request_started.asend(sender=self.__class__, scope=scope)
+        try:
+            with self.track(scope["path"]) as stats:
+                resolution = await aresolve(identifier, private=private)
+            response = self.respond(
+                resolution, identifier, private, user_id, scope["method"], scope["path"],
+                stats, started,
+            )
+        finally:
+            await request_finished.asend(sender=self.__class__)
+        if response is None:
+            return await self.application(scope, receive, send)
+        status, headers, body = response
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+class RedirectFastPathWSGI(_FastPath):
+    """WSGI application serving redirects before Django"""
+
+    def __call__(self, environ, start_response):
+        if not self.enabled:
+            return self.application(environ, start_response)
+        try:
+            path = environ.get("PATH_INFO", "").encode("iso-8859-1").decode()
+        except UnicodeError:
+            return self.application(environ, start_response)
+        identifier, private = self.route(environ["REQUEST_METHOD"], path)
+        if identifier is None:
+            return self.application(environ, start_response)
+        user_id = None
+        if private:
+            user_id = stateless_user_id(
+                environ.get("HTTP_AUTHORIZATION"), environ.get("HTTP_COOKIE")
+            )
+            if user_id is None:
+                return self.application(environ, start_response)
+
+        started = time.perf_counter()
+        request_started.send(sender=self.__class__, environ=environ)
+        try:
+            with self.track(path) as stats:
+                resolution = resolve(identifier, private=private)
+            response = self.respond(
+                resolution, identifier, private, user_id, environ["REQUEST_METHOD"], path,
+                stats, started,
+            )
+        finally:
+            request_finished.send(sender=self.__class__)
+        if response is None:
+            return self.application(environ, start_response)
+        status, headers, body = response
+        start_response(status_line(status), _to_wsgi(headers))
+        return [body]
+
+
+def _to_wsgi(headers):
+    return [(name.decode(), value.decode("latin-1")) for name, value in headers]
@@ -0,0 +1,299 @@
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+__all__ = [
+    "QueryCounter",
+    "create_application",
+    "KeySampler",
+    "LatencyHistogram",
+    "HTTPConnection",
+    "run_load",
+]
+
+# Cumulative query count of the worker that served a response, as "<pid>:<count>"
+QUERIES_HEADER = b"x-loadtest-queries"
+
+
+class QueryCounter:
+    """
+    Counts the SQL statements executed by every connection of the process.
+
+    Installed as an execute wrapper on each connection when it is created,
+    so queries from sync views, async views, the fast path and the click
+    flusher are all included.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def create_application():
+    """
+    ASGI factory used by the load test server (``uvicorn --factory``).
+
+    Wraps the project's application and reports the worker's cumulative
+    query count in a response header, from which the client derives the
+    number of queries per request.
+    """
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+    from main_app.asgi import application
+
+    counter = QueryCounter()
+    connection_created.connect(counter.install, weak=False)
+    for connection in connections.all(initialized_only=True):
+        counter.install(connection)
+    pid = str(os.getpid()).encode()
+
+    async def counted(scope, receive, send):
+        if scope["type"] != "http":
+            return await application(scope, receive, send)
+
+        async def send_counted(message):
+            if message["type"] == "http.response.start":
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", ()),
+                        (QUERIES_HEADER, pid + b":" + str(counter.count).encode()),
+                    ],
+                }
+            await send(message)
+
+        return await application(scope, receive, send_counted)
+
+    return counted
+
+
+class KeySampler:
+    """
+    Picks the identifier of each request.
+
+    ``public`` is a list of identifiers and ``private`` a list of
+    (identifier, Authorization header) pairs. A ``not_found_ratio`` share of
+    requests asks for identifiers that cannot exist and a ``private_ratio``
+    share of the rest for private rules. Within each list, ``zipf`` makes
+    the first keys the hottest (``1 / rank ** skew``), ``uniform`` does not.
+    """
+
+    def __init__(self, public, private, distribution="uniform", skew=1.1,
+                 not_found_ratio=0.0, private_ratio=0.0, seed=0):
+        self.public = public
+        self.private = private
+        self.not_found_ratio = not_found_ratio
+        self.private_ratio = private_ratio if private else 0.0
+        if not public:
+            self.private_ratio = 1.0 if private else 0.0
+        self.random = random.Random(seed)
+        self._weights = {}
+        if distribution == "zipf":
+            for keys in (public, private):
+                self._weights[id(keys)] = list(
+                    itertools.accumulate(1 / rank ** skew for rank in range(1, len(keys) + 1))
+                )
+        self._missing = itertools.count()
+
+    def _pick(self, keys):
+        weights = self._weights.get(id(keys))
+        if weights is None:
+            return keys[self.random.randrange(len(keys))]
+        index = bisect.bisect(weights, self.random.random() * weights[-1])
+        return keys[min(index, len(keys) - 1)]
+
+    def sample(self):
+        """Returns (path, headers, kind) of the next request"""
+        roll = self.random.random()
+        if roll < self.not_found_ratio or not (self.public or self.private):
+            # Dashes are in neither the allocator's alphabets nor legacy hex
+            return f"/redirect/public/missing-{next(self._missing)}/", (), "not_found"
+        roll = (roll - self.not_found_ratio) / (1 - self.not_found_ratio)
+        if roll < self.private_ratio:
+            identifier, authorization = self._pick(self.private)
+            return (
+                f"/redirect/private/{identifier}/",
+                ((b"authorization", authorization.encode()),),
+                "private",
+            )
+        return f"/redirect/public/{self._pick(self.public)}/", (), "public"
+
+
+class LatencyHistogram:
+    """Latencies in seconds with percentiles and log-scale buckets"""
+
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self):
+        self.values = []
+
+    def add(self, value):
+        self.values.append(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def percentile(self, q):
+        # Sorting in place keeps repeated calls cheap
+        self.values.sort()
+        values = self.values
+        if not values:
+            return 0.0
+        # Rounded first so 99.9 / 100 * 1000 ranks 999, not 1000
+        rank = math.ceil(round(q / 100 * len(values), 6))
+        index = min(len(values) - 1, max(0, rank - 1))
+        return values[index]
+
+    def buckets(self, first=0.0001, factor=2):
+        """Returns [(upper bound in seconds, count)] up to the slowest request"""
+        counts = Counter()
+        for value in self.values:
+            bound = first
+            while value > bound:
+                bound *= factor
+            counts[bound] += 1
+        return sorted(counts.items())
+
+    def summary(self):
+        values = self.values
+        return {
+            "count": len(values),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            "max_ms": round(max(values) * 1000, 3) if values else 0.0,
+            **{
+                f"p{str(q).replace('.', '')}_ms": round(self.percentile(q) * 1000, 3)
+                for q in self.PERCENTILES
+            },
+            "histogram": [
+                {"le_ms": round(bound * 1000, 3), "count": count}
+                for bound, count in self.buckets()
+            ],
+        }
+
+
+class HTTPConnection:
+    """Minimal keep-alive HTTP/1.1 client connection for GET requests"""
+
+    def __init__(self, host, port, host_header=None):
+        self.host = host
+        self.port = port
+        self.host_header = host_header or host
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.reader = self.writer = None
+
+    async def get(self, path, headers=()):
+        """Returns (status, headers dict with lowercase byte names)"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        request = [f"GET {path} HTTP/1.1".encode(), f"Host: {self.host_header}".encode()]
+        request.extend(name + b": " + value for name, value in headers)
+        self.writer.write(b"\r\n".join(request) + b"\r\n\r\n")
+        try:
+            status_line = await self.reader.readuntil(b"\r\n")
+            response_headers = {}
+            while True:
+                line = await self.reader.readuntil(b"\r\n")
+                if line == b"\r\n":
+                    break
+                name, _, value = line.partition(b":")
+                response_headers[name.strip().lower()] = value.strip()
+            await self._read_body(response_headers)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            await self.close()
+            raise
+        if response_headers.get(b"connection", b"").lower() == b"close":
+            await self.close()
+        return int(status_line.split()[1]), response_headers
+
+    async def _read_body(self, headers):
+        if headers.get(b"transfer-encoding", b"").lower() == b"chunked":
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    return
+        length = int(headers.get(b"content-length", 0))
+        if length:
+            await self.reader.readexactly(length)
+
+
+async def run_load(host, port, sampler, concurrency, duration, warmup=0.0, host_header=None):
+    """
+    Drives the server with ``concurrency`` connections for ``duration``
+    seconds after ``warmup`` seconds of untimed requests, and returns a dict
+    with the latency histograms, status counts and queries per request.
+    """
+    histograms = {"all": LatencyHistogram()}
+    statuses = Counter()
+    errors = Counter()
+    queries = {}
+    counted = 0
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def worker():
+        nonlocal counted
+        connection = HTTPConnection(host, port, host_header)
+        try:
+            while (now := time.perf_counter()) < stop_at:
+                path, headers, kind = sampler.sample()
+                try:
+                    status, response_headers = await connection.get(path, headers)
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    errors[type(e).__name__] += 1
+                    continue
+                latency = time.perf_counter() - now
+                if now < measure_from:
+                    continue
+                histograms["all"].add(latency)
+                histograms.setdefault(kind, LatencyHistogram()).add(latency)
+                statuses[status] += 1
+                marker = response_headers.get(QUERIES_HEADER)
+                if marker:
+                    pid, _, count = marker.partition(b":")
+                    first, _ = queries.get(pid, (int(count), None))
+                    queries[pid] = (first, int(count))
+                    counted += 1
+        finally:
+            await connection.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - measure_from
+    total = len(histograms["all"])
+    # The first response seen from a worker only serves as its baseline
+    executed = sum(last - first for first, last in queries.values())
+    counted -= len(queries)
+    return {
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1) if elapsed > 0 else 0.0,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "errors": dict(errors),
+        "workers_seen": len(queries),
+        "queries_per_request": round(executed / counted, 3) if counted > 0 else None,
+        "latency": {kind: histogram.summary() for kind, histogram in histograms.items()},
+    }
@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from redirector.snapshot import compile_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Compiles the public redirect rules into the memory-mapped snapshot '
+        'served by the redirector, replacing the previous generation'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Snapshot file (default: REDIRECTOR_SNAPSHOT["PATH"])',
+            default=settings.REDIRECTOR_SNAPSHOT['PATH']
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Number of rules fetched per database round trip',
+            default=10000
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep building a new generation every this many seconds',
+        )
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError('No snapshot file: set REDIRECTOR_SNAPSHOT_PATH or pass --output')
+        max_age = settings.REDIRECTOR_SNAPSHOT['MAX_AGE']
+        if options['interval'] is not None and options['interval'] >= max_age:
+            raise CommandError(
+                f'--interval must be shorter than REDIRECTOR_SNAPSHOT_MAX_AGE ({max_age:g}s), '
+                'or workers stop using the snapshot between builds'
+            )
+
+        while True:
+            started = time.monotonic()
+            try:
+                generation, count = compile_snapshot(
+                    options['output'], chunk_size=options['chunk_size']
+                )
+            except OSError as e:
+                raise CommandError(f'Error writing redirect snapshot: {str(e)}')
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Wrote {count} public redirect rules to {options["output"]} '
+                    f'(generation {generation}) in {time.monotonic() - started:.1f}s'
+                )
+            )
+            if options['interval'] is None:
+                return
+            close_old_connections()
+            time.sleep(max(0.0, options['interval'] - (time.monotonic() - started)))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from redirector.bloom import get_negative_filter
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the negative lookup filter of redirect identifiers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Number of identifiers fetched per database round trip',
+            default=10000
+        )
+
+    def handle(self, *args, **options):
+        negative_filter = get_negative_filter()
+        if not negative_filter.options['ENABLED']:
+            raise CommandError('The negative lookup filter is disabled')
+
+        try:
+            count = negative_filter.rebuild(chunk_size=options['chunk_size'])
+        except Exception as e:
+            raise CommandError(f'Error rebuilding redirect filter: {str(e)}')
+
+        stats = negative_filter.stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully rebuilt redirect filter with {count} identifiers '
+                f'(capacity {stats["capacity"]})'
+            )
+        )
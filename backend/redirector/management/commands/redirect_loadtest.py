@@ -0,0 +1,245 @@
+import asyncio
+import json
+import socket
+import subprocess
+import sys
+import time
+from itertools import islice
+from operator import itemgetter
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http.request import validate_host
+from redirector.loadtest import KeySampler, run_load
+from rest_framework_simplejwt.tokens import AccessToken
+from url_management.models import RedirectRule
+from url_management.sharding import merge_shards, on_each_shard
+
+BACKEND_DIR = Path(__file__).resolve().parents[3]
+
+
+def _free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Starts the service under uvicorn with several workers and drives the '
+        'redirect routes with concurrent keep-alive connections, reporting '
+        'throughput, latency percentiles and DB queries per request. Uses '
+        'the rules already in the configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            type=str,
+            help='Drive an already running server instead (http://host:port)'
+        )
+        parser.add_argument('--host', type=str, default='127.0.0.1')
+        parser.add_argument(
+            '--port',
+            type=int,
+            help='Port of the started server (default: a free one)'
+        )
+        parser.add_argument('--workers', type=int, help='uvicorn worker processes', default=4)
+        parser.add_argument('--concurrency', type=int, help='Open connections', default=64)
+        parser.add_argument('--duration', type=float, help='Measured seconds', default=10)
+        parser.add_argument(
+            '--warmup',
+            type=float,
+            help='Seconds of untimed requests first',
+            default=2
+        )
+        parser.add_argument(
+            '--distribution',
+            choices=['uniform', 'zipf'],
+            help='How requests spread over the sampled identifiers',
+            default='zipf'
+        )
+        parser.add_argument('--skew', type=float, help='Zipf exponent', default=1.1)
+        parser.add_argument(
+            '--not-found-ratio',
+            type=float,
+            help='Share of requests for identifiers that do not exist',
+            default=0.0
+        )
+        parser.add_argument(
+            '--private-ratio',
+            type=float,
+            help='Share of the other requests for private rules',
+            default=0.0
+        )
+        parser.add_argument(
+            '--keys',
+            type=int,
+            help='Identifiers sampled from the database per visibility',
+            default=10000
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--startup-timeout', type=float, default=30)
+        parser.add_argument('--output', type=str, help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        for name in ('not_found_ratio', 'private_ratio'):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be between 0 and 1')
+        if options['concurrency'] < 1 or options['duration'] <= 0:
+            raise CommandError('--concurrency and --duration must be positive')
+
+        public, private = self.sample_keys(options)
+        if not public and not private and options['not_found_ratio'] < 1:
+            raise CommandError(
+                'No redirect rules to request, load some with load_redirect_rules first'
+            )
+        sampler = KeySampler(
+            public,
+            private,
+            distribution=options['distribution'],
+            skew=options['skew'],
+            not_found_ratio=options['not_found_ratio'],
+            private_ratio=options['private_ratio'],
+            seed=options['seed'],
+        )
+
+        server = None
+        if options['url']:
+            url = urlsplit(options['url'])
+            if url.scheme != 'http' or not url.hostname:
+                raise CommandError('--url must look like http://host:port')
+            host, port = url.hostname, url.port or 80
+        else:
+            host = options['host']
+            port = options['port'] or _free_port(host)
+            server = self.start_server(host, port, options)
+        try:
+            report = asyncio.run(run_load(
+                host,
+                port,
+                sampler,
+                concurrency=options['concurrency'],
+                duration=options['duration'],
+                warmup=options['warmup'],
+                host_header=self.host_header(host),
+            ))
+        finally:
+            if server is not None:
+                self.stop_server(server)
+
+        report['parameters'] = {
+            key: options[key] for key in (
+                'url', 'workers', 'concurrency', 'duration', 'warmup', 'distribution',
+                'skew', 'not_found_ratio', 'private_ratio', 'keys', 'seed',
+            )
+        }
+        report['parameters'].update(
+            public_keys=len(public), private_keys=len(private),
+            database=connection.vendor,
+        )
+        self.print_report(report)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+
+    def sample_keys(self, options):
+        # Primary keys are random UUIDs, so the first rows by pk are a random sample
+        def first_rows(queryset):
+            rows = merge_shards(
+                [shard[:options['keys']] for shard in on_each_shard(queryset.order_by('pk'))],
+                key=itemgetter(0),
+            )
+            return [row[1:] for row in islice(rows, options['keys'])]
+
+        public = [
+            identifier for identifier, in first_rows(
+                RedirectRule.objects.filter(is_private=False)
+                .values_list('pk', 'redirect_identifier')
+            )
+        ]
+        private = []
+        if options['private_ratio']:
+            rows = first_rows(
+                RedirectRule.objects.filter(is_private=True)
+                .values_list('pk', 'redirect_identifier', 'owner_id')
+            )
+            owners = User.objects.in_bulk({owner_id for _, owner_id in rows})
+            tokens = {
+                owner_id: f'Bearer {AccessToken.for_user(owner)}'
+                for owner_id, owner in owners.items()
+            }
+            private = [(identifier, tokens[owner_id]) for identifier, owner_id in rows]
+        return public, private
+
+    def host_header(self, host):
+        """A Host the started server accepts, so requests are not rejected with 400"""
+        if validate_host(host, settings.ALLOWED_HOSTS):
+            return host
+        for allowed in settings.ALLOWED_HOSTS:
+            if allowed != '*':
+                return allowed.lstrip('.')
+        return host
+
+    def start_server(self, host, port, options):
+        command = [
+            sys.executable, '-m', 'uvicorn', 'redirector.loadtest:create_application',
+            '--factory', '--host', host, '--port', str(port),
+            '--workers', str(options['workers']),
+            '--lifespan', 'off', '--no-access-log', '--log-level', 'warning',
+        ]
+        server = subprocess.Popen(command, cwd=BACKEND_DIR)
+        deadline = time.monotonic() + options['startup_timeout']
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'uvicorn exited with code {server.returncode}')
+            try:
+                socket.create_connection((host, port), timeout=1).close()
+            except OSError:
+                time.sleep(0.1)
+                continue
+            self.stdout.write(
+                f'Started uvicorn with {options["workers"]} workers on http://{host}:{port}'
+            )
+            return server
+        self.stop_server(server)
+        raise CommandError('uvicorn did not start in time')
+
+    def stop_server(self, server):
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'{report["requests"]} requests in {report["elapsed_s"]}s '
+            f'({report["rps"]} requests/s), statuses {report["statuses"]}'
+        )
+        if report['errors']:
+            self.stdout.write(self.style.WARNING(f'Connection errors: {report["errors"]}'))
+        if report['queries_per_request'] is not None:
+            self.stdout.write(
+                f'{report["queries_per_request"]} DB queries per request '
+                f'({report["workers_seen"]} workers answered)'
+            )
+
+        columns = ['count', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'p999_ms', 'max_ms']
+        self.stdout.write('kind       ' + ''.join(column.rjust(10) for column in columns))
+        for kind, summary in report['latency'].items():
+            self.stdout.write(
+                kind.ljust(11) + ''.join(str(summary[column]).rjust(10) for column in columns)
+            )
+
+        histogram = report['latency']['all']['histogram']
+        peak = max((bucket['count'] for bucket in histogram), default=0)
+        for bucket in histogram:
+            bar = '#' * max(1, round(40 * bucket['count'] / peak))
+            self.stdout.write(
+                f'<= {bucket["le_ms"]:>9} ms {bucket["count"]:>9} {bar}'
+            )
@@ -0,0 +1,346 @@
+import asyncio
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from url_management.models import RedirectRule
+from url_management.sharding import is_sharded, previous_shard_for, shard_for
+
+from .bloom import get_negative_filter
+from .cache import (AsyncSingleFlight, SingleFlight, get_local_cache,
+                    get_shared_cache, jittered)
+from .snapshot import get_snapshot
+
+__all__ = ["Resolution", "resolve", "aresolve", "invalidate", "invalidate_many"]
+
+Resolution = namedtuple(
+    "Resolution", ["redirect_url", "owner_id", "redirect_status", "cache_max_age"]
+)
+
+# Markers stored in the shared cache next to real resolutions. A tombstone is
+# written on invalidation so that a fill started before the change cannot
+# re-populate the key with stale data (fills only ``add``). While it lasts,
+# lookups of the key read the primary, as replicas may not have the change.
+_NOT_FOUND = "__not_found__"
+_TOMBSTONE = "__invalidated__"
+
+_single_flight = SingleFlight()
+_async_single_flight = AsyncSingleFlight()
+
+# Stands for the identifier when compiling the prepared lookup statements
+_IDENTIFIER = "\x00redirect_identifier"
+_prepared_sql = {}
+
+
+def _cache_key(redirect_identifier, private):
+    return (redirect_identifier, private)
+
+
+def _shared_key(redirect_identifier, private):
+    visibility = "private" if private else "public"
+    return f"redirector:rule:{visibility}:{redirect_identifier}"
+
+
+def _changed_key(redirect_identifier):
+    """Marks a rule changed since the snapshot generations still in use"""
+    return f"redirector:snapshot:changed:{redirect_identifier}"
+
+
+def lookup_query(redirect_identifier, private):
+    """
+    The database query behind a resolution.
+
+    Served by an index-only scan of the partial covering indexes on
+    ``RedirectRule`` (one for public, one for private rules).
+    """
+    return RedirectRule.objects.filter(
+        redirect_identifier=redirect_identifier, is_private=private
+    ).values_list(*Resolution._fields)
+
+
+def _prepared_lookup(connection, private):
+    """
+    ``lookup_query`` as a statement to prepare, with the identifier as ``$1``.
+
+    The visibility stays a literal so that the plan keeps using the partial
+    index of its visibility.
+    """
+    key = (connection.alias, private)
+    sql = _prepared_sql.get(key)
+    if sql is None:
+        query = lookup_query(_IDENTIFIER, private).query
+        sql, params = query.get_compiler(connection=connection).as_sql()
+        with connection.cursor() as cursor:
+            values = tuple(
+                "$1" if param == _IDENTIFIER else cursor.mogrify("%s", [param]).decode()
+                for param in params
+            )
+        sql = _prepared_sql[key] = sql % values
+    return sql
+
+
+def _lookup_alias(redirect_identifier, primary):
+    if is_sharded():
+        return shard_for(redirect_identifier)
+    return DEFAULT_DB_ALIAS if primary else router.db_for_read(RedirectRule)
+
+
+def _fetch_from(alias, redirect_identifier, private):
+    connection = connections[alias]
+    if getattr(connection, "prepared_statements", False):
+        rows = connection.execute_prepared(
+            f"redirector_lookup_{'private' if private else 'public'}",
+            _prepared_lookup(connection, private),
+            [redirect_identifier],
+        )
+        return Resolution(*rows[0]) if rows else None
+    try:
+        row = lookup_query(redirect_identifier, private).using(alias).get()
+    except RedirectRule.DoesNotExist:
+        return None
+    return Resolution(*row)
+
+
+def _fetch(redirect_identifier, private, primary=False):
+    """
+    Queries the rule on a replica, or on the primary with ``primary`` (for
+    recently changed rules the replicas may not have yet). With shards it
+    is read from the shard of the identifier, and while resharding from
+    its former shard if it has not moved yet.
+    """
+    alias = _lookup_alias(redirect_identifier, primary)
+    resolution = _fetch_from(alias, redirect_identifier, private)
+    if resolution is None and is_sharded():
+        previous = previous_shard_for(redirect_identifier)
+        if previous is not None and previous != alias:
+            resolution = _fetch_from(previous, redirect_identifier, private)
+    return resolution
+
+
+async def _afetch_from(alias, redirect_identifier, private):
+    if getattr(connections[alias], "prepared_statements", False):
+        return await sync_to_async(_fetch_from)(alias, redirect_identifier, private)
+    try:
+        row = await lookup_query(redirect_identifier, private).using(alias).aget()
+    except RedirectRule.DoesNotExist:
+        return None
+    return Resolution(*row)
+
+
+async def _afetch(redirect_identifier, private, primary=False):
+    alias = _lookup_alias(redirect_identifier, primary)
+    resolution = await _afetch_from(alias, redirect_identifier, private)
+    if resolution is None and is_sharded():
+        previous = previous_shard_for(redirect_identifier)
+        if previous is not None and previous != alias:
+            resolution = await _afetch_from(previous, redirect_identifier, private)
+    return resolution
+
+
+def _decode(value):
+    """Maps a shared cache value to (found_in_cache, resolution)"""
+    if value is None or value == _TOMBSTONE:
+        return False, None
+    if value == _NOT_FOUND:
+        return True, None
+    return True, Resolution(*value)
+
+
+def _load_shared(redirect_identifier, private):
+    """
+    Read-through lookup in the shared cache.
+
+    Only one worker per key queries the database on a miss; the others wait
+    for it to publish the result and fall back to the database themselves
+    if it does not show up before the lock expires.
+    """
+    options = settings.REDIRECTOR_SHARED_CACHE
+    cache = get_shared_cache()
+    version = options["VERSION"]
+    key = _shared_key(redirect_identifier, private)
+
+    value = cache.get(key, version=version)
+    found, resolution = _decode(value)
+    if found:
+        return resolution
+    # Recently changed: replicas may lag behind the primary
+    primary = value == _TOMBSTONE
+
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, 1, options["LOCK_TIMEOUT"], version=version):
+        deadline = time.monotonic() + options["LOCK_TIMEOUT"]
+        while time.monotonic() < deadline:
+            time.sleep(options["POLL_INTERVAL"])
+            found, resolution = _decode(cache.get(key, version=version))
+            if found:
+                return resolution
+            if cache.get(lock_key, version=version) is None:
+                break
+        return _fetch(redirect_identifier, private, primary)
+
+    try:
+        resolution = _fetch(redirect_identifier, private, primary)
+        if resolution is None:
+            cache.add(key, _NOT_FOUND, options["NEGATIVE_TTL"], version=version)
+        else:
+            cache.add(
+                key,
+                tuple(resolution),
+                jittered(options["TTL"], options["JITTER"]),
+                version=version,
+            )
+    finally:
+        cache.delete(lock_key, version=version)
+    return resolution
+
+
+async def _aload_shared(redirect_identifier, private):
+    """Async counterpart of ``_load_shared``"""
+    options = settings.REDIRECTOR_SHARED_CACHE
+    cache = get_shared_cache()
+    version = options["VERSION"]
+    key = _shared_key(redirect_identifier, private)
+
+    value = await cache.aget(key, version=version)
+    found, resolution = _decode(value)
+    if found:
+        return resolution
+    primary = value == _TOMBSTONE
+
+    lock_key = f"{key}:lock"
+    if not await cache.aadd(lock_key, 1, options["LOCK_TIMEOUT"], version=version):
+        deadline = time.monotonic() + options["LOCK_TIMEOUT"]
+        while time.monotonic() < deadline:
+            await asyncio.sleep(options["POLL_INTERVAL"])
+            found, resolution = _decode(await cache.aget(key, version=version))
+            if found:
+                return resolution
+            if await cache.aget(lock_key, version=version) is None:
+                break
+        return await _afetch(redirect_identifier, private, primary)
+
+    try:
+        resolution = await _afetch(redirect_identifier, private, primary)
+        if resolution is None:
+            await cache.aadd(
+                key, _NOT_FOUND, options["NEGATIVE_TTL"], version=version
+            )
+        else:
+            await cache.aadd(
+                key,
+                tuple(resolution),
+                jittered(options["TTL"], options["JITTER"]),
+                version=version,
+            )
+    finally:
+        await cache.adelete(lock_key, version=version)
+    return resolution
+
+
+def resolve(redirect_identifier, private=False):
+    """
+    Resolves an identifier to its redirect target.
+
+    Lookups go through the per-process LRU cache, the snapshot of public
+    rules (unless the rule changed since), the negative lookup filter, then
+    the shared cache and only then the database. Returns a ``Resolution``
+    or ``None`` if there is no rule with the given identifier and
+    visibility.
+    """
+    cache = get_local_cache()
+    key = _cache_key(redirect_identifier, private)
+    resolution = cache.get(key)
+    if resolution is None:
+        if not private:
+            found = get_snapshot().lookup(redirect_identifier)
+            if found is not None and get_shared_cache().get(
+                _changed_key(redirect_identifier),
+                version=settings.REDIRECTOR_SHARED_CACHE["VERSION"],
+            ) is None:
+                resolution = Resolution(*found)
+                cache.set(key, resolution)
+                return resolution
+        if not get_negative_filter().might_contain(redirect_identifier):
+            return None
+        resolution = _single_flight.do(
+            key, _load_shared, redirect_identifier, private
+        )
+        if resolution is not None:
+            cache.set(key, resolution)
+    return resolution
+
+
+async def aresolve(redirect_identifier, private=False):
+    """Async counterpart of ``resolve`` built on the async ORM and cache API"""
+    cache = get_local_cache()
+    key = _cache_key(redirect_identifier, private)
+    resolution = cache.get(key)
+    if resolution is None:
+        if not private:
+            # A stat() per CHECK_INTERVAL at most, then page cache reads
+            found = get_snapshot().lookup(redirect_identifier)
+            if found is not None and await get_shared_cache().aget(
+                _changed_key(redirect_identifier),
+                version=settings.REDIRECTOR_SHARED_CACHE["VERSION"],
+            ) is None:
+                resolution = Resolution(*found)
+                cache.set(key, resolution)
+                return resolution
+        if not await get_negative_filter().amight_contain(redirect_identifier):
+            return None
+        resolution = await _async_single_flight.do(
+            key, _aload_shared, redirect_identifier, private
+        )
+        if resolution is not None:
+            cache.set(key, resolution)
+    return resolution
+
+
+def invalidate(redirect_identifier, created=False):
+    """
+    Drops every cached resolution for the given identifier.
+
+    A newly created rule can only have a cached miss, so its shared entries
+    are simply deleted; changed or deleted rules get tombstones instead.
+    """
+    invalidate_many([redirect_identifier], created=created)
+
+
+def invalidate_many(redirect_identifiers, created=False):
+    """Like ``invalidate`` with one shared cache call for all identifiers"""
+    cache = get_local_cache()
+    keys = []
+    redirect_identifiers = list(redirect_identifiers)
+    for redirect_identifier in redirect_identifiers:
+        cache.delete(_cache_key(redirect_identifier, False))
+        cache.delete(_cache_key(redirect_identifier, True))
+        keys.append(_shared_key(redirect_identifier, False))
+        keys.append(_shared_key(redirect_identifier, True))
+
+    options = settings.REDIRECTOR_SHARED_CACHE
+    replicas = settings.DATABASE_REPLICAS
+    shared_cache = get_shared_cache()
+    if created and not replicas["ALIASES"]:
+        shared_cache.delete_many(keys, version=options["VERSION"])
+    else:
+        # With replicas, new rules get tombstones too, so that their first
+        # lookups do not cache a miss read from a lagging replica
+        timeout = options["LOCK_TIMEOUT"]
+        if replicas["ALIASES"]:
+            timeout = max(timeout, replicas["STICKINESS"])
+        shared_cache.set_many(
+            dict.fromkeys(keys, _TOMBSTONE),
+            timeout,
+            version=options["VERSION"],
+        )
+        snapshot = settings.REDIRECTOR_SNAPSHOT
+        if not created and snapshot["PATH"]:
+            # Outlives every generation built before the change, including
+            # builds that read the rule from a lagging replica
+            shared_cache.set_many(
+                {_changed_key(identifier): 1 for identifier in redirect_identifiers},
+                snapshot["MAX_AGE"] + timeout,
+                version=options["VERSION"],
+            )
@@ -0,0 +1,43 @@
+"""
+HTTP semantics of a resolved redirect: its status and caching headers.
+
+Rules choose their redirect status and how long clients may reuse the
+redirect (``cache_max_age``). Public redirects may be stored by shared
+caches (CDNs), private ones by the browser only; without a max-age they
+are revalidated on every use. The ``ETag`` is derived from the status
+and the target, so it changes with the rule.
+
+There are no ``304`` answers: preconditions are ignored for redirects
+(RFC 9110, section 13.2.1), so a stale redirect is fetched again whole.
+"""
+from hashlib import blake2b
+from http import HTTPStatus
+
+__all__ = ["redirect_etag", "cache_control", "redirect_headers", "status_line"]
+
+
+def redirect_etag(resolution):
+    digest = blake2b(
+        f"{resolution.redirect_status} {resolution.redirect_url}".encode(), digest_size=8
+    )
+    return f'"{digest.hexdigest()}"'
+
+
+def cache_control(resolution, private):
+    scope = "private" if private else "public"
+    if resolution.cache_max_age is None:
+        return f"{scope}, no-cache"
+    return f"{scope}, max-age={resolution.cache_max_age}"
+
+
+def redirect_headers(resolution, private):
+    """The caching headers of a redirect, as ``(name, value)`` pairs"""
+    return [
+        ("Cache-Control", cache_control(resolution, private)),
+        ("ETag", redirect_etag(resolution)),
+    ]
+
+
+def status_line(status):
+    """``301 Moved Permanently`` and the like, for WSGI"""
+    return f"{status} {HTTPStatus(status).phrase}"
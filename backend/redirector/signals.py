@@ -0,0 +1,34 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from url_management.models import RedirectRule
+from url_management.signals import redirect_rules_created
+
+from .bloom import get_negative_filter
+from .resolver import invalidate, invalidate_many
+
+
+@receiver(post_save, sender=RedirectRule)
+def invalidate_saved_redirect_rule(sender, instance, created, using, **kwargs):
+    """Keeps cached resolutions in sync with rule changes"""
+    if created:
+        # Once committed, so that a filter rebuild that has not seen the
+        # rule journals it
+        redirect_identifiers = [instance.redirect_identifier]
+        transaction.on_commit(
+            lambda: get_negative_filter().add(redirect_identifiers), using=using
+        )
+    invalidate(instance.redirect_identifier, created=created)
+
+
+@receiver(post_delete, sender=RedirectRule)
+def invalidate_deleted_redirect_rule(sender, instance, **kwargs):
+    """Drops cached resolutions of deleted rules"""
+    invalidate(instance.redirect_identifier)
+
+
+@receiver(redirect_rules_created, sender=RedirectRule)
+def invalidate_created_redirect_rules(sender, redirect_identifiers, **kwargs):
+    """Makes bulk-inserted rules resolvable right away"""
+    get_negative_filter().add(redirect_identifiers)
+    invalidate_many(redirect_identifiers, created=True)
@@ -0,0 +1,279 @@
+"""
+Memory-mapped snapshot of the public redirect rules.
+
+``build_snapshot`` compiles every public rule into one file::
+
+    header   magic, generation, rule count, key width, section offsets
+    keys     identifiers, NUL padded to the key width, sorted bytewise
+    records  per key: offset and length of its URL, owner id, redirect
+             status, max-age
+    strings  the URLs, UTF-8
+
+Lookups binary search the keys of the mapped file and decode only the
+record they find, so nothing is loaded when a worker starts and the
+workers of a host share one copy of the file in the page cache.
+
+A new generation replaces the file atomically. Workers look for one every
+``CHECK_INTERVAL`` seconds and swap their mapping, and stop using it once
+it is older than ``MAX_AGE`` seconds. Identifiers missing from the
+snapshot, such as rules created since it was built, are resolved as usual.
+Rules changed or deleted since then are marked in the shared cache until
+every generation built before the change has expired (see
+``redirector.resolver``), so they are resolved as usual too.
+"""
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.db.models.functions import Collate
+from django.dispatch import receiver
+from url_management.models import RedirectRule
+from url_management.sharding import merge_shards, on_each_shard
+
+__all__ = ["Snapshot", "SnapshotReader", "build_snapshot", "compile_snapshot", "get_snapshot"]
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RDRSNAP2"
+# magic, generation, count, key width, records offset, strings offset
+HEADER = struct.Struct("<8sQQQQQ")
+# URL offset in the string table, URL length, owner id, status, max-age
+RECORD = struct.Struct("<QIQHI")
+# Stands for a max-age of None
+NO_MAX_AGE = 0xFFFFFFFF
+KEY_WIDTH = RedirectRule._meta.get_field("redirect_identifier").max_length
+
+
+def build_snapshot(path, rows):
+    """
+    Writes ``(redirect_identifier, redirect_url, owner_id, redirect_status,
+    cache_max_age)`` rows, sorted bytewise by identifier, as a new snapshot
+    generation at ``path`` and returns ``(generation, count)``.
+
+    The rows are streamed: the records and URLs go through temporary files
+    until the keys are written. The file is written beside ``path`` and
+    renamed over it, so readers open either the previous generation or the
+    new one, whole. The generation is the time the build started, so rules
+    changed while it runs count as changed since.
+    """
+    generation = time.time_ns()
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    fd, temporary = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        with (
+            os.fdopen(fd, "wb") as f,
+            tempfile.TemporaryFile(dir=directory) as records,
+            tempfile.TemporaryFile(dir=directory) as strings,
+        ):
+            f.seek(HEADER.size)
+            count = offset = 0
+            previous = None
+            for identifier, url, owner_id, status, max_age in rows:
+                key = identifier.encode()
+                if previous is not None and key <= previous:
+                    raise ValueError(f"Snapshot rows are not sorted at {identifier!r}")
+                previous = key
+                if len(key) > KEY_WIDTH:
+                    # Longer than the key width in UTF-8: left to the database
+                    continue
+                url = url.encode()
+                f.write(key.ljust(KEY_WIDTH, b"\0"))
+                records.write(RECORD.pack(
+                    offset, len(url), owner_id, status,
+                    NO_MAX_AGE if max_age is None else max_age,
+                ))
+                strings.write(url)
+                offset += len(url)
+                count += 1
+            for part in (records, strings):
+                part.seek(0)
+                shutil.copyfileobj(part, f)
+            f.seek(0)
+            records_offset = HEADER.size + count * KEY_WIDTH
+            f.write(HEADER.pack(
+                MAGIC, generation, count, KEY_WIDTH,
+                records_offset, records_offset + count * RECORD.size,
+            ))
+            f.flush()
+            os.fsync(f.fileno())
+        # Readable by workers running as other users, like a regular file
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return generation, count
+
+
+def _in_key_order(queryset):
+    """Orders rules bytewise by identifier, like the keys of the snapshot"""
+    if connections[queryset.db].vendor == "postgresql":
+        # The collation of the database need not be bytewise
+        return queryset.order_by(Collate("redirect_identifier", "C"))
+    return queryset.order_by("redirect_identifier")
+
+
+def compile_snapshot(path, chunk_size=10000):
+    """Builds a snapshot of every public rule in the database (on every shard)"""
+    querysets = on_each_shard(
+        RedirectRule.objects.filter(is_private=False).values_list(
+            "redirect_identifier", "redirect_url", "owner_id", "redirect_status", "cache_max_age"
+        )
+    )
+    return build_snapshot(
+        path,
+        merge_shards(
+            [_in_key_order(queryset).iterator(chunk_size=chunk_size) for queryset in querysets],
+            key=lambda row: row[0].encode(),
+        ),
+    )
+
+
+def _identity(stat):
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class Snapshot:
+    """One generation of the snapshot file, mapped read-only"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Identifies the file that was mapped, whatever is at the path now
+        self.identity = _identity(stat)
+        magic, self.generation, self.count, self.key_width, self._records, self._strings = (
+            HEADER.unpack_from(self._map)
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a redirect snapshot")
+        if hasattr(mmap, "MADV_RANDOM"):
+            # Binary searches touch a few scattered pages; skip the read-ahead
+            self._map.madvise(mmap.MADV_RANDOM)
+
+    def age(self):
+        """Seconds since the build of this generation started"""
+        return (time.time_ns() - self.generation) / 1e9
+
+    def get(self, redirect_identifier):
+        """Returns the ``Resolution`` fields of a public rule, or None"""
+        key = redirect_identifier.encode()
+        width = self.key_width
+        # NUL pads the keys, so it cannot be part of one
+        if len(key) > width or b"\0" in key:
+            return None
+        key = key.ljust(width, b"\0")
+        data = self._map
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            start = HEADER.size + middle * width
+            probe = data[start:start + width]
+            if probe < key:
+                low = middle + 1
+            elif probe > key:
+                high = middle
+            else:
+                offset, length, owner_id, status, max_age = RECORD.unpack_from(
+                    data, self._records + middle * RECORD.size
+                )
+                start = self._strings + offset
+                return (
+                    data[start:start + length].decode(),
+                    owner_id,
+                    status,
+                    None if max_age == NO_MAX_AGE else max_age,
+                )
+        return None
+
+
+class SnapshotReader:
+    """
+    The current generation of the snapshot for this process.
+
+    Mappings survive ``fork``, so preloaded workers share their parent's.
+    A replaced mapping is unmapped once no lookup holds it anymore.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self._snapshot = None
+        self._checked = None
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def _refresh(self):
+        interval = self.options["CHECK_INTERVAL"]
+        if self._checked is not None and time.monotonic() - self._checked < interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._checked is not None and now - self._checked < interval:
+                return
+            self._checked = now
+            path = self.options["PATH"]
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self._snapshot = None
+                return
+            current = self._snapshot
+            if current is not None and current.identity == _identity(stat):
+                return
+            try:
+                self._snapshot = Snapshot(path)
+            except (OSError, ValueError, struct.error) as exc:
+                # Keep serving the previous generation
+                logger.warning("Could not load redirect snapshot %s: %s", path, exc)
+
+    def lookup(self, redirect_identifier):
+        """Returns the ``Resolution`` fields from the snapshot, or None"""
+        if not self.options["PATH"]:
+            return None
+        self._refresh()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.age() > self.options["MAX_AGE"]:
+            return None
+        found = snapshot.get(redirect_identifier)
+        if found is not None:
+            self.hits += 1
+        return found
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "enabled": snapshot is not None,
+            "expired": snapshot is not None and snapshot.age() > self.options["MAX_AGE"],
+            "generation": snapshot.generation if snapshot is not None else None,
+            "count": snapshot.count if snapshot is not None else 0,
+            "hits": self.hits,
+        }
+
+
+_snapshot_reader = None
+
+
+def get_snapshot():
+    """Returns the per-process snapshot reader"""
+    global _snapshot_reader
+    if _snapshot_reader is None:
+        _snapshot_reader = SnapshotReader(settings.REDIRECTOR_SNAPSHOT)
+    return _snapshot_reader
+
+
+@receiver(setting_changed)
+def _reset_snapshot(setting, **kwargs):
+    global _snapshot_reader
+    if setting == "REDIRECTOR_SNAPSHOT":
+        _snapshot_reader = None
@@ -1,9 +1,54 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from io import StringIO
+
 import pytest
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User
-from django.urls import reverse
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection, connections
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
 from rest_framework import status
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from url_management.bulk import bulk_create_rules
 from url_management.models import RedirectRule
+from url_management.sharding import shard_for
+
+from . import clicks, resolver
+from .bloom import BloomFilter, NegativeFilter, get_negative_filter
+from .cache import (AsyncSingleFlight, LRUCache, SingleFlight, get_local_cache,
+                    get_shared_cache, jittered)
+from .clicks import ClickBuffer, get_click_buffer
+from .fastpath import RedirectFastPathASGI, RedirectFastPathWSGI
+from .loadtest import (HTTPConnection, KeySampler, LatencyHistogram,
+                       QueryCounter, run_load)
+from .snapshot import Snapshot, SnapshotReader, build_snapshot, get_snapshot
+from .views import aprivate_redirect, apublic_redirect
+
+# URLconf used by the async view tests, mirroring the ASGI default routing
+urlpatterns = [
+    path('redirect/public/<str:redirect_identifier>/', apublic_redirect, name='public-redirect'),
+    path('redirect/private/<str:redirect_identifier>/', aprivate_redirect, name='private-redirect'),
+]
+
+
+@pytest.fixture(autouse=True)
+def clear_redirect_cache():
+    """Isolates the resolution caches between tests"""
+    get_local_cache().clear()
+    get_shared_cache().clear()
+    get_negative_filter().reload()
+    get_click_buffer()._pending.clear()
+    yield
+    get_local_cache().clear()
+    get_shared_cache().clear()
+    get_negative_filter().reload()
+    get_click_buffer()._pending.clear()
 
 
 @pytest.fixture
@@ -144,3 +189,1210 @@ def test_private_redirect_public_rule(auth_client, public_rule):
         })
     )
     assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_public_redirect_is_cached(api_client, public_rule, django_assert_num_queries):
+    """Tests that repeated public redirects are served from the cache"""
+    url = reverse('public-redirect', kwargs={
+        'redirect_identifier': public_rule.redirect_identifier
+    })
+    with django_assert_num_queries(1):
+        api_client.get(url)
+    with django_assert_num_queries(0):
+        response = api_client.get(url)
+    assert response.status_code == status.HTTP_302_FOUND
+    assert response.url == 'https://example.com/public'
+
+
+@pytest.mark.django_db
+def test_redirect_cache_invalidated_on_update(user, public_rule):
+    """Tests that updates through the management API invalidate the cache"""
+    url = reverse('public-redirect', kwargs={
+        'redirect_identifier': public_rule.redirect_identifier
+    })
+    client = APIClient()
+    client.get(url)
+
+    client.force_authenticate(user=user)
+    response = client.patch(
+        f"/url/{public_rule.id}/", {"redirect_url": "https://example.com/changed"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    response = client.get(url)
+    assert response.url == 'https://example.com/changed'
+
+    client.patch(f"/url/{public_rule.id}/", {"is_private": True})
+    response = client.get(url)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_redirect_status_and_caching_headers(user, public_rule, private_rule):
+    """Tests the per-rule status, Cache-Control and ETag of redirects"""
+    url = reverse('public-redirect', kwargs={
+        'redirect_identifier': public_rule.redirect_identifier
+    })
+    client = APIClient()
+    response = client.get(url)
+    assert response.status_code == status.HTTP_302_FOUND
+    assert response['Cache-Control'] == 'public, no-cache'
+    etag = response['ETag']
+
+    public_rule.redirect_status = 308
+    public_rule.cache_max_age = 3600
+    public_rule.save()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_308_PERMANENT_REDIRECT
+    assert response.url == 'https://example.com/public'
+    assert response['Cache-Control'] == 'public, max-age=3600'
+    assert response['ETag'] != etag
+
+    private_rule.redirect_status = 307
+    private_rule.save()
+    client.force_login(user)
+    response = client.get(reverse('private-redirect', kwargs={
+        'redirect_identifier': private_rule.redirect_identifier
+    }))
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    assert response['Cache-Control'] == 'private, no-cache'
+
+
+@pytest.mark.django_db
+def test_redirect_cache_invalidated_on_delete(api_client, public_rule):
+    """Tests that deleted rules are no longer served from the cache"""
+    url = reverse('public-redirect', kwargs={
+        'redirect_identifier': public_rule.redirect_identifier
+    })
+    api_client.get(url)
+    public_rule.delete()
+    response = api_client.get(url)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """Tests LRU eviction order and counters"""
+    cache = LRUCache(max_size=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {
+        'size': 2,
+        'max_size': 2,
+        'hits': 3,
+        'misses': 1,
+        'evictions': 1,
+        'expirations': 0,
+    }
+
+
+def test_lru_cache_expires_entries(monkeypatch):
+    """Tests that entries older than the TTL are dropped"""
+    now = [1000.0]
+    monkeypatch.setattr('redirector.cache.time.monotonic', lambda: now[0])
+    cache = LRUCache(max_size=10, ttl=5)
+    cache.set('a', 1)
+    now[0] += 4
+    assert cache.get('a') == 1
+    now[0] += 2
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+    assert len(cache) == 0
+
+
+@pytest.mark.django_db
+def test_shared_cache_serves_cold_workers(api_client, public_rule, django_assert_num_queries):
+    """Tests that a worker with a cold local cache reads from the shared cache"""
+    url = reverse('public-redirect', kwargs={
+        'redirect_identifier': public_rule.redirect_identifier
+    })
+    api_client.get(url)
+    get_local_cache().clear()
+    with django_assert_num_queries(0):
+        response = api_client.get(url)
+    assert response.url == 'https://example.com/public'
+
+
+@pytest.mark.django_db
+def test_shared_cache_remembers_missing_rules(api_client, django_assert_num_queries):
+    """Tests that unknown identifiers are negatively cached"""
+    url = reverse('public-redirect', kwargs={'redirect_identifier': 'missing'})
+    with django_assert_num_queries(1):
+        api_client.get(url)
+    with django_assert_num_queries(0):
+        response = api_client.get(url)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_shared_cache_negative_entry_cleared_on_create(api_client, user):
+    """Tests that creating a rule drops a cached miss for its identifier"""
+    rule = RedirectRule(owner=user, redirect_url='https://example.com/new')
+    rule.redirect_identifier = 'newrule1'
+    url = reverse('public-redirect', kwargs={'redirect_identifier': 'newrule1'})
+    assert api_client.get(url).status_code == status.HTTP_404_NOT_FOUND
+
+    rule.save()
+    response = api_client.get(url)
+    assert response.status_code == status.HTTP_302_FOUND
+
+
+
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+def test_recently_changed_rules_resolve_from_the_primary(user, settings):
+    """Tests that lookups do not cache what a lagging replica returns"""
+    settings.DATABASE_REPLICAS = {'ALIASES': ['replica'], 'STICKINESS': 5}
+    rule = RedirectRule.objects.create(owner=user, redirect_url='https://example.com/new')
+
+    def lookup():
+        get_local_cache().clear()
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as secondary:
+            resolution = resolver.resolve(rule.redirect_identifier)
+        return resolution, len(primary), len(secondary)
+
+    # Tombstoned on creation, so not cached until it expires
+    for _ in range(2):
+        assert lookup() == (('https://example.com/new', user.pk, 302, None), 1, 0)
+
+    get_shared_cache().clear()
+    assert lookup() == (('https://example.com/new', user.pk, 302, None), 0, 1)
+    assert lookup() == (('https://example.com/new', user.pk, 302, None), 0, 0)
+
+
+@pytest.mark.django_db(databases=['default', 'shard_0', 'shard_1'])
+def test_sharded_rules_resolve_from_one_shard(user, settings):
+    """Tests single-shard lookups, the resharding fallback and sharded clicks"""
+    rules = [
+        RedirectRule.objects.create(owner=user, redirect_url=f'https://example.com/{i}/')
+        for i in range(8)
+    ]
+    settings.DATABASE_SHARDS = {
+        'ALIASES': ['shard_0', 'shard_1'], 'PREVIOUS_ALIASES': ['default'],
+    }
+
+    def lookup(rule):
+        get_local_cache().clear()
+        get_shared_cache().clear()
+        with CaptureQueriesContext(connections['default']) as default, \
+                CaptureQueriesContext(connections['shard_0']) as first, \
+                CaptureQueriesContext(connections['shard_1']) as second:
+            resolution = resolver.resolve(rule.redirect_identifier)
+        return resolution, [len(default), len(first), len(second)]
+
+    # Not moved yet: the shard misses, then the former database is read
+    expected = [1, 0, 0]
+    expected[['default', 'shard_0', 'shard_1'].index(shard_for(rules[0].redirect_identifier))] += 1
+    assert lookup(rules[0]) == (('https://example.com/0/', user.pk, 302, None), expected)
+
+    # Clicks of rules not moved yet are counted on the former database
+    buffer = ClickBuffer(max_pending=100, flush_interval=60, batch_size=2)
+    for rule in rules:
+        buffer.record(rule.redirect_identifier)
+    assert buffer.flush() == 8
+    assert buffer.pending() == 0
+    for rule in rules:
+        assert RedirectRule.objects.using('default').get(pk=rule.pk).hits == 1
+        assert rule.traffic.db_manager('default').count() == 2
+    # On neither database, as while being moved: kept for the next flush
+    buffer.record('moving01')
+    buffer.flush()
+    assert buffer.pending() == 1
+    buffer._pending.clear()
+
+    call_command('reshard_redirect_rules', stdout=StringIO())
+    for rule in rules:
+        queries = [0, 0, 0]
+        queries[['default', 'shard_0', 'shard_1'].index(shard_for(rule.redirect_identifier))] = 1
+        assert lookup(rule) == ((rule.redirect_url, user.pk, 302, None), queries)
+
+    for rule in rules:
+        buffer.record(rule.redirect_identifier)
+    assert buffer.flush() == 8
+    for rule in rules:
+        alias = shard_for(rule.redirect_identifier)
+        assert RedirectRule.objects.using(alias).get(pk=rule.pk).hits == 2
+        assert rule.traffic.db_manager(alias).count() == 2
+
+
+def test_snapshot_lookups(tmp_path):
+    """Tests the binary search over a built snapshot and skipping bad files"""
+    path = tmp_path / 'rules.snapshot'
+    rows = [
+        (f'id{i:03}', f'https://example.com/{i}/é', i, 301 if i % 4 else 308, i if i % 3 else None)
+        for i in range(0, 200, 2)
+    ]
+    generation, count = build_snapshot(path, iter(rows))
+    assert count == 100
+    with pytest.raises(ValueError):
+        build_snapshot(tmp_path / 'unsorted', reversed(rows))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['rules.snapshot']
+
+    snapshot = Snapshot(path)
+    assert snapshot.generation == generation
+    for identifier, *resolution in rows:
+        assert snapshot.get(identifier) == tuple(resolution)
+    for identifier in ['id001', 'id199', 'a', 'zzz', 'id000\x00', 'x' * 17]:
+        assert snapshot.get(identifier) is None
+
+    reader = SnapshotReader({'PATH': str(path), 'CHECK_INTERVAL': 0, 'MAX_AGE': 60})
+    assert reader.lookup('id004') == ('https://example.com/4/é', 4, 308, 4)
+    reader.options = {**reader.options, 'MAX_AGE': 0}
+    assert reader.lookup('id004') is None
+    assert reader.stats()['expired']
+    reader.options = {**reader.options, 'MAX_AGE': 60}
+    # A broken file does not replace the mapped generation
+    (tmp_path / 'broken').write_bytes(b'not a snapshot')
+    (tmp_path / 'broken').replace(path)
+    assert reader.lookup('id004') == ('https://example.com/4/é', 4, 308, 4)
+    path.unlink()
+    assert reader.lookup('id004') is None
+
+
+@pytest.mark.django_db
+def test_public_redirects_resolve_from_the_snapshot(
+    api_client, user, public_rule, private_rule, settings, tmp_path, django_assert_num_queries
+):
+    """Tests snapshot lookups, their fallback and switching generations"""
+    path = tmp_path / 'rules.snapshot'
+    settings.REDIRECTOR_SNAPSHOT = {'PATH': str(path), 'CHECK_INTERVAL': 0, 'MAX_AGE': 60}
+    call_command('build_redirect_snapshot', '--output', str(path), stdout=StringIO())
+    created = RedirectRule.objects.create(owner=user, redirect_url='https://example.com/created')
+    get_shared_cache().clear()
+
+    with django_assert_num_queries(0):
+        response = api_client.get(reverse('public-redirect', args=[public_rule.redirect_identifier]))
+    assert response.url == 'https://example.com/public'
+    # Private rules and rules created since the build come from the database
+    assert resolver.resolve(private_rule.redirect_identifier, private=True) is not None
+    with django_assert_num_queries(1):
+        assert resolver.resolve(created.redirect_identifier) == ('https://example.com/created', user.pk, 302, None)
+
+    # Rules changed since the build are not served from it
+    public_rule.redirect_url = 'https://example.com/changed'
+    public_rule.redirect_status = 308
+    public_rule.save()
+    with django_assert_num_queries(1):
+        assert resolver.resolve(public_rule.redirect_identifier).redirect_url == 'https://example.com/changed'
+    call_command('build_redirect_snapshot', '--output', str(path), stdout=StringIO())
+    get_local_cache().clear()
+    get_shared_cache().clear()
+    with django_assert_num_queries(0):
+        assert async_to_sync(resolver.aresolve)(public_rule.redirect_identifier) == (
+            'https://example.com/changed', user.pk, 308, None,
+        )
+    assert get_snapshot().stats()['count'] == 2
+
+    # Nor are generations older than MAX_AGE
+    settings.REDIRECTOR_SNAPSHOT = {**settings.REDIRECTOR_SNAPSHOT, 'MAX_AGE': 0}
+    with django_assert_num_queries(1):
+        assert resolver.resolve(created.redirect_identifier) is not None
+    settings.REDIRECTOR_SNAPSHOT = {**settings.REDIRECTOR_SNAPSHOT, 'MAX_AGE': 60}
+
+    # Nor rules made private or deleted since
+    get_local_cache().clear()
+    public_rule.is_private = True
+    public_rule.save()
+    created.delete()
+    assert resolver.resolve(public_rule.redirect_identifier) is None
+    assert resolver.resolve(created.redirect_identifier) is None
+
+
+def test_resolve_coalesces_concurrent_misses(monkeypatch):
+    """Tests that concurrent misses on one identifier produce a single fetch"""
+    calls = []
+    release = threading.Event()
+
+    def fetch(redirect_identifier, private, primary=False):
+        calls.append(redirect_identifier)
+        release.wait(5)
+        return resolver.Resolution('https://example.com/hot', 1, 302, None)
+
+    monkeypatch.setattr(resolver, '_fetch', fetch)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(resolver.resolve('hot')))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ['hot']
+    assert [r.redirect_url for r in results] == ['https://example.com/hot'] * 8
+
+
+def test_resolve_waits_for_other_worker(monkeypatch, settings):
+    """Tests that a worker waits for the lock holder instead of querying"""
+    settings.REDIRECTOR_SHARED_CACHE = {
+        **settings.REDIRECTOR_SHARED_CACHE, 'POLL_INTERVAL': 0.01
+    }
+    monkeypatch.setattr(
+        resolver, '_fetch', lambda *args: pytest.fail('unexpected fetch')
+    )
+    cache = get_shared_cache()
+    version = settings.REDIRECTOR_SHARED_CACHE['VERSION']
+    key = resolver._shared_key('busy', False)
+    cache.add(f'{key}:lock', 1, 5, version=version)
+
+    timer = threading.Timer(
+        0.05, cache.set,
+        args=(key, ('https://example.com/busy', 1, 302, None), 60), kwargs={'version': version},
+    )
+    timer.start()
+    resolution = resolver.resolve('busy')
+    timer.join()
+    assert resolution.redirect_url == 'https://example.com/busy'
+
+
+def test_single_flight_propagates_errors():
+    """Tests that the leader's exception is raised and the key released"""
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        flight.do('key', fail)
+    assert flight.do('key', lambda: 42) == 42
+
+
+def test_jittered_ttl_stays_within_bounds():
+    """Tests that jittered TTLs vary within the configured spread"""
+    values = {jittered(100, 0.1) for _ in range(200)}
+    assert min(values) >= 90
+    assert max(values) <= 110
+    assert len(values) > 1
+
+
+def test_bloom_filter_has_no_false_negatives():
+    """Tests membership and the false positive rate of the Bloom filter"""
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    members = [f'id{i}' for i in range(1000)]
+    for member in members:
+        bloom.add(member)
+
+    assert all(member in bloom for member in members)
+    false_positives = sum(f'other{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+
+    restored = BloomFilter.from_state(bloom.to_state())
+    assert all(member in restored for member in members)
+    assert len(restored) == 1000
+
+
+@pytest.mark.django_db
+def test_negative_filter_skips_database_for_unknown_identifiers(
+    api_client, public_rule, django_assert_num_queries
+):
+    """Tests that guaranteed misses are answered without a query"""
+    call_command('rebuild_redirect_filter', stdout=StringIO())
+    url = reverse('public-redirect', kwargs={'redirect_identifier': 'unknown1'})
+    with django_assert_num_queries(0):
+        response = api_client.get(url)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = api_client.get(
+        reverse('public-redirect', kwargs={
+            'redirect_identifier': public_rule.redirect_identifier
+        })
+    )
+    assert response.status_code == status.HTTP_302_FOUND
+    assert get_negative_filter().stats()['rejections'] == 1
+
+
+@pytest.mark.django_db
+def test_negative_filter_updated_on_create(api_client, user, django_capture_on_commit_callbacks):
+    """Tests that rules created after a rebuild are not rejected"""
+    call_command('rebuild_redirect_filter', stdout=StringIO())
+    with django_capture_on_commit_callbacks(execute=True):
+        rule = RedirectRule.objects.create(
+            owner=user, redirect_url='https://example.com/fresh'
+        )
+    response = api_client.get(
+        reverse('public-redirect', kwargs={
+            'redirect_identifier': rule.redirect_identifier
+        })
+    )
+    assert response.status_code == status.HTTP_302_FOUND
+
+
+@pytest.mark.django_db
+def test_negative_filter_follows_other_workers(user):
+    """Tests that a stale local filter reloads before rejecting"""
+    call_command('rebuild_redirect_filter', stdout=StringIO())
+    negative_filter = get_negative_filter()
+    stale = BloomFilter.from_state(negative_filter._bloom.to_state())
+    stale_generation = negative_filter._generation
+
+    negative_filter.add(['added01'])
+    negative_filter._bloom = stale
+    negative_filter._generation = stale_generation
+    assert 'added01' not in stale
+    assert negative_filter.might_contain('added01')
+
+
+@pytest.mark.django_db
+def test_negative_filter_merges_deltas_from_other_workers(settings, user):
+    """Tests that creates append deltas instead of republishing the filter"""
+    call_command('rebuild_redirect_filter', stdout=StringIO())
+    negative_filter = get_negative_filter()
+    cache = get_shared_cache()
+    version = negative_filter._version
+    published = cache.get(negative_filter.FILTER_KEY, version=version)
+    other = NegativeFilter(
+        settings.REDIRECTOR_NEGATIVE_FILTER, settings.REDIRECTOR_SHARED_CACHE
+    )
+    other.reload()
+
+    negative_filter.add(['added01'])
+    negative_filter.add(['added02', 'added03'])
+    assert cache.get(negative_filter.FILTER_KEY, version=version) == published
+    assert other.might_contain('added01')
+    assert async_to_sync(other.amight_contain)('added03')
+    assert other._generation == published[0] and other._applied == 2
+
+    # A delta lost from the cache keeps a reloaded copy from rejecting
+    cache.delete(negative_filter._delta_keys(published[0], 0, 1)[0], version=version)
+    other.reload()
+    assert other.might_contain('missing01')
+    assert other.rejections == 0
+
+    negative_filter.rebuild()
+    assert cache.get(negative_filter._count_key(published[0]), version=version) is None
+    assert not other.might_contain('missing01')
+
+
+@pytest.mark.django_db
+def test_negative_filter_adds_committed_rules(user, django_capture_on_commit_callbacks):
+    """Tests that a rebuild scanning before the commit of a rule journals it"""
+    call_command('rebuild_redirect_filter', stdout=StringIO())
+    negative_filter = get_negative_filter()
+    cache = get_shared_cache()
+    version = negative_filter._version
+    with django_capture_on_commit_callbacks(execute=True):
+        rule = RedirectRule.objects.create(
+            owner=user, redirect_url='https://example.com/fresh'
+        )
+        # A rebuild starts; its scan cannot see the uncommitted rule
+        cache.set(negative_filter.REBUILDING_KEY, True, None, version=version)
+        assert cache.get(negative_filter.JOURNAL_KEY, version=version) is None
+    assert cache.get(negative_filter.JOURNAL_KEY, version=version) == [
+        rule.redirect_identifier
+    ]
+
+
+@pytest.mark.django_db
+def test_negative_filter_folds_long_delta_logs(settings, user):
+    """Tests that the filter is republished with its deltas past MAX_DELTAS"""
+    settings.REDIRECTOR_NEGATIVE_FILTER = {
+        **settings.REDIRECTOR_NEGATIVE_FILTER, 'MAX_DELTAS': 2,
+    }
+    call_command('rebuild_redirect_filter', stdout=StringIO())
+    negative_filter = get_negative_filter()
+    cache = get_shared_cache()
+    version = negative_filter._version
+    generation = cache.get(negative_filter.GENERATION_KEY, version=version)
+
+    negative_filter.add(['added01'])
+    negative_filter.add(['added02'])
+    assert cache.get(negative_filter._count_key(generation), version=version) == 2
+    negative_filter.add(['added03'])
+    folded = cache.get(negative_filter.GENERATION_KEY, version=version)
+    assert folded != generation
+    assert cache.get(negative_filter._count_key(folded), version=version) == 0
+    assert cache.get(negative_filter._count_key(generation), version=version) is None
+
+    other = NegativeFilter(
+        settings.REDIRECTOR_NEGATIVE_FILTER, settings.REDIRECTOR_SHARED_CACHE
+    )
+    other.reload()
+    assert all(
+        identifier in other._bloom for identifier in ['added01', 'added02', 'added03']
+    )
+
+
+@pytest.mark.django_db
+def test_negative_filter_merges_journal_on_rebuild(user):
+    """Tests that identifiers added during a rebuild are not lost"""
+    negative_filter = get_negative_filter()
+    cache = get_shared_cache()
+    version = negative_filter._version
+    cache.set(negative_filter.REBUILDING_KEY, True, None, version=version)
+    negative_filter.add(['during01'])
+
+    negative_filter.rebuild()
+    assert negative_filter.might_contain('during01')
+    assert cache.get(negative_filter.JOURNAL_KEY, version=version) is None
+
+
+@pytest.mark.django_db
+def test_negative_filter_disabled_until_built(api_client, public_rule):
+    """Tests that lookups fall through to the database before a rebuild"""
+    assert get_negative_filter().might_contain('anything')
+    response = api_client.get(
+        reverse('public-redirect', kwargs={
+            'redirect_identifier': public_rule.redirect_identifier
+        })
+    )
+    assert response.status_code == status.HTTP_302_FOUND
+
+
+@pytest.fixture
+def async_client():
+    """Returns an async client that can be driven from sync tests"""
+    return AsyncClient()
+
+
+@pytest.mark.urls('redirector.tests')
+@pytest.mark.django_db
+def test_async_public_redirect(async_client, public_rule, private_rule):
+    """Tests the async public redirect view"""
+    response = async_to_sync(async_client.get)(
+        reverse('public-redirect', kwargs={
+            'redirect_identifier': public_rule.redirect_identifier
+        })
+    )
+    assert response.status_code == status.HTTP_302_FOUND
+    assert response.url == 'https://example.com/public'
+
+    response = async_to_sync(async_client.get)(
+        reverse('public-redirect', kwargs={
+            'redirect_identifier': private_rule.redirect_identifier
+        })
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.urls('redirector.tests')
+@pytest.mark.django_db
+def test_async_private_redirect(async_client, user, other_user, private_rule):
+    """Tests authentication and ownership checks of the async private view"""
+    url = reverse('private-redirect', kwargs={
+        'redirect_identifier': private_rule.redirect_identifier
+    })
+    response = async_to_sync(async_client.get)(url)
+    assert response.status_code == status.HTTP_302_FOUND
+    assert '/accounts/login/' in response.url
+
+    async_to_sync(async_client.aforce_login)(other_user)
+    response = async_to_sync(async_client.get)(url)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    async_to_sync(async_client.aforce_login)(user)
+    response = async_to_sync(async_client.get)(url)
+    assert response.status_code == status.HTTP_302_FOUND
+    assert response.url == 'https://example.com/private'
+
+
+@pytest.mark.django_db
+def test_async_resolve_uses_shared_cache(public_rule, django_assert_num_queries):
+    """Tests that the async resolver shares cache entries with the sync one"""
+    resolver.resolve(public_rule.redirect_identifier)
+    get_local_cache().clear()
+    with django_assert_num_queries(0):
+        resolution = async_to_sync(resolver.aresolve)(public_rule.redirect_identifier)
+    assert resolution.redirect_url == 'https://example.com/public'
+    assert async_to_sync(resolver.aresolve)('missing') is None
+
+
+def test_async_single_flight_coalesces_awaits():
+    """Tests that concurrent awaits for one key share a single load"""
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def run():
+        flight = AsyncSingleFlight()
+        return await asyncio.gather(*(flight.do('key', load) for _ in range(5)))
+
+    assert asyncio.run(run()) == [42] * 5
+    assert calls == [1]
+
+
+@contextmanager
+def _keeping_connections():
+    """
+    Keeps the connection of the test transaction open across requests that
+    bypass the test client, which does the same
+    """
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        yield
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+
+
+def _wsgi_get(application, path, method='GET', **extra):
+    """Calls a WSGI application and returns (status, headers, body)"""
+    captured = {}
+
+    def start_response(status, headers):
+        captured['status'], captured['headers'] = status, dict(headers)
+
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        **extra,
+    }
+    with _keeping_connections():
+        body = b''.join(application(environ, start_response))
+    return captured['status'], captured['headers'], body
+
+
+def _fallback_wsgi(environ, start_response):
+    start_response('299 Fallback', [])
+    return [b'django']
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_serves_public_redirect(public_rule, django_assert_num_queries):
+    """Tests that public redirects are answered without the Django handler"""
+    application = RedirectFastPathWSGI(_fallback_wsgi)
+    path = f'/redirect/public/{public_rule.redirect_identifier}/'
+    status_line, headers, body = _wsgi_get(application, path)
+    assert status_line == '302 Found'
+    assert headers['location'] == 'https://example.com/public'
+    assert headers['x-frame-options'] == 'DENY'
+    assert body == b''
+
+    with django_assert_num_queries(0):
+        assert _wsgi_get(application, path, method='HEAD')[0] == '302 Found'
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_redirect_status(public_rule):
+    """Tests that the fast path answers with the status and headers of the rule"""
+    public_rule.redirect_status = 301
+    public_rule.cache_max_age = 60
+    public_rule.save()
+    application = RedirectFastPathWSGI(_fallback_wsgi)
+    status_line, headers, _ = _wsgi_get(
+        application, f'/redirect/public/{public_rule.redirect_identifier}/'
+    )
+    assert status_line == '301 Moved Permanently'
+    assert headers['cache-control'] == 'public, max-age=60'
+    assert headers['etag'].startswith('"')
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_falls_through(private_rule, settings):
+    """Tests that other routes, methods and private rules reach Django"""
+    settings.DEBUG = False
+    application = RedirectFastPathWSGI(_fallback_wsgi)
+    identifier = private_rule.redirect_identifier
+    for path, method in (
+        (f'/redirect/private/{identifier}/', 'GET'),
+        (f'/redirect/public/{identifier}/', 'POST'),
+        (f'/redirect/public/{identifier}', 'GET'),
+        ('/url/', 'GET'),
+    ):
+        assert _wsgi_get(application, path, method)[0] == '299 Fallback'
+
+    status_line, headers, body = _wsgi_get(application, f'/redirect/public/{identifier}/')
+    assert status_line == '404 Not Found'
+    assert b'Not Found' in body
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_disabled(public_rule, settings):
+    """Tests that the fast path can be switched off"""
+    settings.REDIRECTOR_FAST_PATH = False
+    application = RedirectFastPathWSGI(_fallback_wsgi)
+    path = f'/redirect/public/{public_rule.redirect_identifier}/'
+    assert _wsgi_get(application, path)[0] == '299 Fallback'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_fast_path_closes_database_connections(public_rule, monkeypatch):
+    """Tests that the fast path closes its connections like a Django request"""
+    # Closing the in-memory test database is a no-op, so watch for the calls
+    state = {}
+    close = connection.close
+
+    def closing():
+        state['closed'] = True
+        close()
+
+    def querying(execute, *args):
+        state['closed'] = False
+        return execute(*args)
+
+    monkeypatch.setattr(connection, 'close', closing)
+    path = f'/redirect/public/{public_rule.redirect_identifier}/'
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+    with connection.execute_wrapper(querying):
+        assert RedirectFastPathWSGI(_fallback_wsgi)(environ, lambda *args: None) == [b'']
+    assert state == {'closed': True}
+
+    async def get():
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': []}
+        await RedirectFastPathASGI(None)(scope, None, send)
+        return messages[0]['status']
+
+    get_local_cache().clear()
+    get_shared_cache().clear()
+    state.clear()
+    # async_to_sync runs the lookup on this thread, with this connection
+    with connection.execute_wrapper(querying):
+        assert async_to_sync(get)() == 302
+    assert state == {'closed': True}
+
+
+@pytest.mark.django_db
+def test_asgi_fast_path_serves_public_redirect(public_rule):
+    """Tests the ASGI fast path and its fall through"""
+    fallback_calls = []
+
+    async def fallback(scope, receive, send):
+        fallback_calls.append(scope['path'])
+        await send({'type': 'http.response.start', 'status': 299, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def get(path):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': []}
+        with _keeping_connections():
+            await RedirectFastPathASGI(fallback)(scope, receive, send)
+        return messages[0]['status'], dict(messages[0]['headers'])
+
+    status_code, headers = async_to_sync(get)(
+        f'/redirect/public/{public_rule.redirect_identifier}/'
+    )
+    assert status_code == 302
+    assert headers[b'location'] == b'https://example.com/public'
+
+    assert async_to_sync(get)('/url/')[0] == 299
+    assert fallback_calls == ['/url/']
+
+
+@pytest.mark.django_db
+def test_private_redirect_with_access_token(user, private_rule, django_assert_num_queries):
+    """Tests that a JWT authenticates private redirects with a single query"""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    url = reverse('private-redirect', kwargs={
+        'redirect_identifier': private_rule.redirect_identifier
+    })
+    with django_assert_num_queries(1):
+        response = client.get(url)
+    assert response.status_code == status.HTTP_302_FOUND
+    assert response.url == 'https://example.com/private'
+    assert 'redirect_auth' not in response.cookies
+
+    with django_assert_num_queries(0):
+        assert client.get(url).status_code == status.HTTP_302_FOUND
+
+
+@pytest.mark.django_db
+def test_private_redirect_with_other_users_token(other_user, private_rule):
+    """Tests that ownership is checked against the token's user id"""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(other_user)}')
+    response = client.get(
+        reverse('private-redirect', kwargs={
+            'redirect_identifier': private_rule.redirect_identifier
+        })
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+def test_private_redirect_with_invalid_token(api_client, private_rule):
+    """Tests that an invalid token is treated as unauthenticated"""
+    api_client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+    response = api_client.get(
+        reverse('private-redirect', kwargs={
+            'redirect_identifier': private_rule.redirect_identifier
+        })
+    )
+    assert response.status_code == status.HTTP_302_FOUND
+    assert '/accounts/login/' in response.url
+
+
+@pytest.mark.django_db
+def test_private_redirect_issues_signed_cookie(auth_client, private_rule, django_assert_num_queries):
+    """Tests that a session login is exchanged for a stateless cookie"""
+    url = reverse('private-redirect', kwargs={
+        'redirect_identifier': private_rule.redirect_identifier
+    })
+    response = auth_client.get(url)
+    cookie = response.cookies['redirect_auth']
+    assert cookie['httponly']
+    assert cookie['path'] == '/redirect/private/'
+
+    # The session cookie is sent along, but the session is not loaded
+    client = APIClient()
+    client.cookies['sessionid'] = auth_client.cookies['sessionid'].value
+    client.cookies['redirect_auth'] = cookie.value
+    with django_assert_num_queries(0):
+        response = client.get(url)
+    assert response.status_code == status.HTTP_302_FOUND
+
+    client = APIClient()
+    client.cookies['redirect_auth'] = cookie.value + 'tampered'
+    response = client.get(url)
+    assert '/accounts/login/' in response.url
+
+
+@pytest.mark.django_db
+def test_redirect_cookie_follows_the_session(user, other_user, private_rule):
+    """Tests that the redirect cookie stops working on logout and user switches"""
+    url = reverse('private-redirect', kwargs={
+        'redirect_identifier': private_rule.redirect_identifier
+    })
+    other_rule = RedirectRule.objects.create(
+        owner=other_user, redirect_url='https://example.com/other', is_private=True
+    )
+    other_url = reverse('private-redirect', kwargs={
+        'redirect_identifier': other_rule.redirect_identifier
+    })
+    client = APIClient()
+    client.force_login(user)
+    stale = client.get(url).cookies['redirect_auth'].value
+
+    # Logging out leaves the cookie in the browser
+    client.logout()
+    client.cookies['redirect_auth'] = stale
+    response = client.get(url)
+    assert '/accounts/login/' in response.url
+
+    client.force_login(other_user)
+    client.cookies['redirect_auth'] = stale
+    response = client.get(other_url)
+    assert response.status_code == status.HTTP_302_FOUND
+    assert response.url == 'https://example.com/other'
+    assert client.cookies['redirect_auth'].value != stale
+    assert client.get(url).status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+def test_wsgi_fast_path_serves_private_redirect(user, other_user, private_rule):
+    """Tests private redirects on the fast path with stateless credentials"""
+    application = RedirectFastPathWSGI(_fallback_wsgi)
+    path = f'/redirect/private/{private_rule.redirect_identifier}/'
+    for token_user, expected in ((user, '302 Found'), (other_user, '299 Fallback')):
+        status_line, _, _ = _wsgi_get(
+            application, path, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(token_user)}'
+        )
+        assert status_line == expected
+
+
+@pytest.mark.django_db
+def test_redirect_clicks_are_buffered(api_client, public_rule, django_assert_num_queries):
+    """Tests that redirects are counted in memory and flushed in one statement"""
+    url = reverse('public-redirect', args=[public_rule.redirect_identifier])
+    for _ in range(3):
+        api_client.get(url)
+    public_rule.refresh_from_db()
+    assert public_rule.hits == 0
+
+    buffer = get_click_buffer()
+    assert buffer.pending() == 3
+    # The counter update and one upsert of the hourly and daily buckets,
+    # wrapped in a savepoint
+    with django_assert_num_queries(4):
+        assert buffer.flush() == 3
+    public_rule.refresh_from_db()
+    assert public_rule.hits == 3
+    assert sorted(public_rule.traffic.values_list('granularity', 'hits')) == [
+        ('day', 3), ('hour', 3),
+    ]
+
+
+@pytest.mark.django_db
+def test_click_buffer_batches_identifiers(user):
+    """Tests flushing several rules in batches"""
+    rules = [
+        RedirectRule.objects.create(owner=user, redirect_url=f'https://example.com/{i}/')
+        for i in range(5)
+    ]
+    buffer = ClickBuffer(max_pending=100, flush_interval=60, batch_size=2)
+    for count, rule in enumerate(rules, start=1):
+        for _ in range(count):
+            buffer.record(rule.redirect_identifier)
+    assert buffer.flush() == 15
+    assert [rule.hits for rule in RedirectRule.objects.order_by('hits')] == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.django_db
+def test_click_buffer_flushes_when_full(public_rule, private_rule):
+    """Tests the early flush and the bound on pending identifiers"""
+    buffer = ClickBuffer(max_pending=2, flush_interval=60, batch_size=10)
+    buffer.record(public_rule.redirect_identifier)
+    buffer.record(private_rule.redirect_identifier)
+    assert buffer.pending() == 0
+    public_rule.refresh_from_db()
+    assert public_rule.hits == 1
+
+    buffer.flush = lambda: 0
+    for identifier in ('a', 'b', 'c', 'd', 'a'):
+        buffer.record(identifier)
+    assert buffer.pending() == 5
+    assert buffer.dropped == 0
+    buffer.record('e')
+    assert buffer.dropped == 1
+
+
+@pytest.mark.django_db
+def test_click_buffer_keeps_counts_on_failure(public_rule, monkeypatch):
+    """Tests that a failed flush requeues the clicks"""
+    buffer = ClickBuffer(max_pending=100, flush_interval=60, batch_size=10)
+    buffer.record(public_rule.redirect_identifier)
+
+    def fail(pending):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(buffer, '_write', fail)
+    assert buffer.flush() == 0
+    assert buffer.pending() == 1
+    monkeypatch.undo()
+    assert buffer.flush() == 1
+
+
+@pytest.mark.django_db(databases=['default', 'shard_0', 'shard_1'])
+def test_click_buffer_keeps_counts_of_failed_shards(user, settings, monkeypatch):
+    """Tests that the clicks committed on one shard are not written again"""
+    settings.DATABASE_SHARDS = {'ALIASES': ['shard_0', 'shard_1'], 'PREVIOUS_ALIASES': []}
+    rules = [
+        RedirectRule.objects.create(owner=user, redirect_url=f'https://example.com/{i}/')
+        for i in range(16)
+    ]
+    on_second = sum(shard_for(rule.redirect_identifier) == 'shard_1' for rule in rules)
+    assert 0 < on_second < len(rules)
+    add_traffic = clicks.add_traffic
+
+    def fail_on_second(counts, batch_size, using):
+        if using == 'shard_1':
+            raise RuntimeError('shard unavailable')
+        add_traffic(counts, batch_size, using=using)
+
+    buffer = ClickBuffer(max_pending=100, flush_interval=60, batch_size=10)
+    for rule in rules:
+        buffer.record(rule.redirect_identifier)
+    monkeypatch.setattr(clicks, 'add_traffic', fail_on_second)
+    assert buffer.flush() == len(rules) - on_second
+    assert buffer.pending() == on_second
+    monkeypatch.undo()
+    assert buffer.flush() == on_second
+    for rule in rules:
+        alias = shard_for(rule.redirect_identifier)
+        assert RedirectRule.objects.using(alias).get(pk=rule.pk).hits == 1
+
+
+@pytest.mark.django_db
+def test_rule_update_keeps_flushed_clicks(user, public_rule):
+    """Tests that saving a stale instance does not overwrite the click count"""
+    stale = RedirectRule.objects.get(pk=public_rule.pk)
+    buffer = ClickBuffer(max_pending=100, flush_interval=60, batch_size=10)
+    buffer.record(public_rule.redirect_identifier)
+    buffer.flush()
+
+    stale.redirect_url = 'https://example.com/updated/'
+    stale.save()
+    public_rule.refresh_from_db()
+    assert public_rule.hits == 1
+    assert public_rule.redirect_url == 'https://example.com/updated/'
+
+
+@pytest.mark.django_db
+def test_bulk_created_rules_are_resolvable(
+    api_client, user, django_capture_on_commit_callbacks
+):
+    """Tests that bulk inserts clear cached misses once committed"""
+    rule = RedirectRule(owner=user, redirect_url='https://example.com/bulk/')
+    rule.redirect_identifier = 'b0b0b0b0'
+    url = reverse('public-redirect', args=[rule.redirect_identifier])
+    assert api_client.get(url).status_code == status.HTTP_404_NOT_FOUND
+
+    with django_capture_on_commit_callbacks(execute=True):
+        bulk_create_rules([rule])
+    assert api_client.get(url).status_code == status.HTTP_302_FOUND
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason='INCLUDE indexes are PostgreSQL only')
+@pytest.mark.django_db(transaction=True)
+def test_resolution_uses_index_only_scan(user):
+    """Tests that resolutions are answered from the covering indexes alone"""
+    RedirectRule.objects.bulk_create([
+        RedirectRule(
+            owner=user,
+            redirect_url=f'https://example.com/{i}',
+            is_private=i % 2 == 1,
+            redirect_identifier=f'{i:08x}',
+        )
+        for i in range(2000)
+    ])
+    with connection.cursor() as cursor:
+        # Sets the visibility map, without which every match hits the heap
+        cursor.execute(f'VACUUM ANALYZE {RedirectRule._meta.db_table}')
+
+    for identifier, private, index in (
+        (f'{10:08x}', False, 'redirectrule_public_lookup'),
+        (f'{11:08x}', True, 'redirectrule_private_lookup'),
+    ):
+        plan = resolver.lookup_query(identifier, private).explain()
+        assert f'Index Only Scan using {index}' in plan, plan
+
+
+@pytest.mark.skipif(
+    not getattr(connection, 'prepared_statements', False),
+    reason='Prepared statements need the main_app.db.postgresql backend',
+)
+@pytest.mark.django_db
+def test_resolution_uses_prepared_statements(user, django_assert_num_queries):
+    public = RedirectRule.objects.create(owner=user, redirect_url='https://example.com/p')
+    private = RedirectRule.objects.create(
+        owner=user, redirect_url='https://example.com/s', is_private=True
+    )
+    assert resolver._fetch(public.redirect_identifier, False) == (public.redirect_url, user.pk, 302, None)
+    assert resolver._fetch(private.redirect_identifier, False) is None
+    assert resolver._fetch('missing', True) is None
+
+    # Prepared on the first lookup of each visibility, executed afterwards
+    with django_assert_num_queries(1) as captured:
+        assert resolver._fetch(private.redirect_identifier, True) == (private.redirect_url, user.pk, 302, None)
+    assert captured.captured_queries[0]['sql'].startswith('EXECUTE')
+
+
+@pytest.mark.skipif(
+    getattr(connection, 'connection_pool', None) is None,
+    reason='Connection pools need the main_app.db.postgresql backend with POOL',
+)
+@pytest.mark.django_db(transaction=True)
+def test_fast_path_returns_pooled_connections(public_rule):
+    """Tests that more fast-path requests than pooled connections are served"""
+    pool = connection.connection_pool
+    in_use = pool.stats()['in_use']
+    application = RedirectFastPathWSGI(_fallback_wsgi)
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': f'/redirect/public/{public_rule.redirect_identifier}/',
+    }
+    workers = pool.max_size + 1
+    started, served = threading.Barrier(workers), threading.Barrier(workers + 1)
+    release = threading.Event()
+    statuses = []
+
+    def serve():
+        # Every request on its own server thread, which outlives it
+        try:
+            started.wait(timeout=30)
+            for _ in range(2):
+                get_local_cache().clear()
+                get_shared_cache().clear()
+                application(environ, lambda status, headers: statuses.append(status))
+        finally:
+            served.wait(timeout=30)
+            release.wait(timeout=30)
+
+    threads = [threading.Thread(target=serve) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    served.wait(timeout=30)
+    assert pool.stats()['in_use'] == in_use
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert statuses == ['302 Found'] * 2 * workers
+
+
+def test_key_sampler_mixes_request_kinds():
+    sampler = KeySampler(
+        [f"p{i}" for i in range(100)],
+        [(f"s{i}", "Bearer token") for i in range(100)],
+        distribution="zipf",
+        not_found_ratio=0.2,
+        private_ratio=0.5,
+    )
+    samples = [sampler.sample() for _ in range(10000)]
+    kinds = {kind: sum(1 for *_, k in samples if k == kind) for kind in ("public", "private", "not_found")}
+    assert 1800 < kinds["not_found"] < 2200
+    assert 3700 < kinds["private"] < 4300
+    assert all(headers for _, headers, kind in samples if kind == "private")
+
+    # The hottest key gets far more than its uniform share
+    public = [path for path, _, kind in samples if kind == "public"]
+    assert public.count("/redirect/public/p0/") > len(public) / 10
+
+
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.add(value / 1000)
+    summary = histogram.summary()
+    assert summary["p50_ms"] == 500
+    assert summary["p99_ms"] == 990
+    assert summary["p999_ms"] == 999
+    assert sum(bucket["count"] for bucket in summary["histogram"]) == 1000
+
+
+@pytest.mark.django_db
+def test_query_counter_counts_statements(user):
+    counter = QueryCounter()
+    counter.install(connection)
+    counter.install(connection)
+    try:
+        User.objects.count()
+        RedirectRule.objects.count()
+    finally:
+        connection.execute_wrappers.remove(counter)
+    assert counter.count == 2
+
+
+def test_load_generator_reports_statuses():
+    async def serve(reader, writer):
+        while await reader.readuntil(b"\r\n\r\n"):
+            writer.write(
+                b"HTTP/1.1 302 Found\r\nContent-Length: 2\r\n"
+                b"X-Loadtest-Queries: 1:" + str(serve.queries).encode() + b"\r\n\r\nok"
+            )
+            serve.queries += 2
+            await writer.drain()
+    serve.queries = 0
+
+    async def main():
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            connection = HTTPConnection("127.0.0.1", port)
+            status_code, headers = await connection.get("/redirect/public/x/")
+            await connection.close()
+            report = await run_load(
+                "127.0.0.1", port, KeySampler(["x"], []), concurrency=2, duration=0.2
+            )
+        return status_code, headers, report
+
+    status_code, headers, report = asyncio.run(main())
+    assert status_code == 302
+    assert headers[b"content-length"] == b"2"
+    assert report["requests"] > 0
+    assert report["statuses"] == {"302": report["requests"]}
+    assert report["queries_per_request"] == 2
@@ -1,8 +1,15 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import private_redirect, public_redirect
+from .views import (aprivate_redirect, apublic_redirect, private_redirect,
+                    public_redirect)
+
+if settings.REDIRECTOR_ASYNC_VIEWS:
+    public_view, private_view = apublic_redirect, aprivate_redirect
+else:
+    public_view, private_view = public_redirect, private_redirect
 
 urlpatterns = [
-    path('public/<str:redirect_identifier>/', public_redirect, name='public-redirect'),
-    path('private/<str:redirect_identifier>/', private_redirect, name='private-redirect'),
+    path('public/<str:redirect_identifier>/', public_view, name='public-redirect'),
+    path('private/<str:redirect_identifier>/', private_view, name='private-redirect'),
 ]
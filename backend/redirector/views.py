@@ -1,31 +1,92 @@
-from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden
-from django.shortcuts import get_object_or_404, redirect
-from url_management.models import RedirectRule
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseForbidden, HttpResponseRedirect
+
+from .authentication import request_user_id, set_auth_cookie
+from .clicks import record_click
+from .resolver import aresolve, resolve
+from .responses import redirect_headers
+
+
+def _redirect(resolution, private):
+    """The redirect of a rule, with its status and caching headers"""
+    response = HttpResponseRedirect(resolution.redirect_url)
+    response.status_code = resolution.redirect_status
+    for name, value in redirect_headers(resolution, private):
+        response[name] = value
+    return response
 
 
 def public_redirect(request, redirect_identifier):
     """
     Public redirects - no authentication required
     """
-    rule = get_object_or_404(
-        RedirectRule, redirect_identifier=redirect_identifier, is_private=False
-    )
-    return redirect(rule.redirect_url)
+    resolution = resolve(redirect_identifier, private=False)
+    if resolution is None:
+        raise Http404("No redirect rule matches the given query.")
+    record_click(redirect_identifier)
+    return _redirect(resolution, private=False)
+
+
+def _private_response(redirect_identifier, resolution, user_id, session_key):
+    if resolution is None:
+        raise Http404("No redirect rule matches the given query.")
+
+    # Compare ids so the owner row is never loaded
+    if str(resolution.owner_id) != user_id:
+        return HttpResponseForbidden(
+            "You do not have permission to access this redirect."
+        )
+
+    record_click(redirect_identifier)
+    response = _redirect(resolution, private=True)
+    if session_key:
+        set_auth_cookie(response, user_id, session_key)
+    return response
 
 
-@login_required
 def private_redirect(request, redirect_identifier):
     """
     Private redirects - access only for the owner
+
+    Authenticated by a JWT access token or the signed redirect cookie of
+    the current session when present, otherwise by the session (which then
+    issues the cookie).
     """
-    rule = get_object_or_404(
-        RedirectRule, redirect_identifier=redirect_identifier, is_private=True
-    )
+    user_id = request_user_id(request)
+    session_key = None
+    if user_id is None:
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        user_id = str(request.user.pk)
+        session_key = request.session.session_key
 
-    if rule.owner != request.user:
-        return HttpResponseForbidden(
-            "You do not have permission to access this redirect."
-        )
+    resolution = resolve(redirect_identifier, private=True)
+    return _private_response(redirect_identifier, resolution, user_id, session_key)
+
+
+async def apublic_redirect(request, redirect_identifier):
+    """
+    Public redirects - async variant served under ASGI
+    """
+    resolution = await aresolve(redirect_identifier, private=False)
+    if resolution is None:
+        raise Http404("No redirect rule matches the given query.")
+    record_click(redirect_identifier)
+    return _redirect(resolution, private=False)
+
+
+async def aprivate_redirect(request, redirect_identifier):
+    """
+    Private redirects - async variant served under ASGI
+    """
+    user_id = request_user_id(request)
+    session_key = None
+    if user_id is None:
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        user_id = str(user.pk)
+        session_key = request.session.session_key
 
-    return redirect(rule.redirect_url)
+    resolution = await aresolve(redirect_identifier, private=True)
+    return _private_response(redirect_identifier, resolution, user_id, session_key)
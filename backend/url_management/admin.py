@@ -5,7 +5,9 @@ from .models import RedirectRule
 
 @admin.register(RedirectRule)
 class RedirectRuleAdmin(admin.ModelAdmin):
-    list_display = ('redirect_identifier', 'redirect_url', 'is_private', 'created', 'modified')
+    list_display = (
+        'redirect_identifier', 'redirect_url', 'is_private', 'redirect_status', 'created', 'modified',
+    )
     readonly_fields = ('id', 'created', 'modified', 'redirect_identifier')
     search_fields = ('redirect_identifier', 'redirect_url')
-    list_filter = ('is_private', 'created', 'modified')
+    list_filter = ('is_private', 'redirect_status', 'created', 'modified')
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class UrlManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'url_management'
+
+    def ready(self):
+        from . import sharding  # noqa: F401
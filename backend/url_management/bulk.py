@@ -0,0 +1,122 @@
+import csv
+import io
+from operator import attrgetter
+
+from django.db import IntegrityError, connections, router, transaction
+
+from .identifiers import get_allocator
+from .models import RedirectRule
+from .sharding import atomic_on, get_shards, group_by_shard
+from .signals import redirect_rules_created
+
+__all__ = ["allocate_identifiers", "bulk_create_rules", "copy_rules"]
+
+
+def allocate_identifiers(count):
+    """Returns ``count`` identifiers from the configured allocator"""
+    return get_allocator().allocate(count)
+
+
+def _assign_identifiers(rules):
+    """Allocates identifiers for rules without one and returns those rules"""
+    allocated = [rule for rule in rules if not rule.redirect_identifier]
+    for rule, identifier in zip(allocated, allocate_identifiers(len(allocated))):
+        rule.redirect_identifier = identifier
+    return allocated
+
+
+def _databases():
+    """The databases rules are inserted into: the shards, or the router's"""
+    return get_shards() or [router.db_for_write(RedirectRule)]
+
+
+def _notify_on_commit(rules, using):
+    identifiers = [rule.redirect_identifier for rule in rules]
+    transaction.on_commit(
+        lambda: redirect_rules_created.send(
+            sender=RedirectRule, redirect_identifiers=identifiers
+        ),
+        using=using,
+    )
+
+
+def bulk_create_rules(rules, batch_size=1000, attempts=3):
+    """
+    Inserts unsaved rules with ``bulk_create`` in one transaction.
+
+    Rules without an identifier get one from ``allocate_identifiers``.
+    With the random legacy allocator, a batch that loses an identifier
+    race against a concurrent insert is retried with fresh identifiers.
+    ``redirect_rules_created`` is sent once the transaction commits.
+    Returns the rules.
+
+    With shards, each batch is split by shard and there is one transaction
+    per shard; they commit one after the other, not atomically.
+    """
+    allocated = set(map(id, _assign_identifiers(rules)))
+    databases = _databases()
+
+    with atomic_on(databases):
+        for start in range(0, len(rules), batch_size):
+            batch = rules[start:start + batch_size]
+            for attempt in range(attempts):
+                try:
+                    # Fresh identifiers may belong to other shards, so a
+                    # failed batch is grouped again
+                    groups = group_by_shard(batch, key=attrgetter('redirect_identifier'))
+                    with atomic_on(groups):
+                        for alias, shard_batch in groups.items():
+                            RedirectRule.objects.using(alias).bulk_create(shard_batch)
+                    break
+                except IntegrityError:
+                    retry = [rule for rule in batch if id(rule) in allocated]
+                    if attempt == attempts - 1 or not retry:
+                        raise
+                    for rule, identifier in zip(retry, allocate_identifiers(len(retry))):
+                        rule.redirect_identifier = identifier
+        # The first database commits last
+        _notify_on_commit(rules, databases[0])
+    return rules
+
+
+def copy_rules(rules):
+    """
+    Inserts unsaved rules with PostgreSQL's ``COPY ... FROM STDIN``.
+
+    Much cheaper than ``INSERT`` for large loads, but there is no retry:
+    an identifier taken in the meantime fails the whole call.
+    """
+    databases = _databases()
+    if any(connections[alias].vendor != 'postgresql' for alias in databases):
+        raise NotImplementedError('COPY is only available on PostgreSQL')
+    _assign_identifiers(rules)
+
+    fields = RedirectRule._meta.concrete_fields
+    with atomic_on(databases):
+        groups = group_by_shard(rules, key=attrgetter('redirect_identifier'))
+        for alias, shard_rules in groups.items():
+            _copy(connections[alias], fields, shard_rules)
+        _notify_on_commit(rules, databases[0])
+    for rule in rules:
+        rule._state.adding = False
+    return rules
+
+
+def _copy(connection, fields, rules):
+    payload = io.StringIO()
+    writer = csv.writer(payload)
+    for rule in rules:
+        writer.writerow([
+            field.get_db_prep_save(field.pre_save(rule, add=True), connection)
+            for field in fields
+        ])
+    payload.seek(0)
+
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {quote(RedirectRule._meta.db_table)} ({columns}) "
+            f"FROM STDIN WITH (FORMAT csv)",
+            payload,
+        )
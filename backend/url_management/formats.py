@@ -0,0 +1,217 @@
+import csv
+import json
+
+__all__ = [
+    "FORMATS",
+    "EXPORT_FORMATS",
+    "EXPORT_FIELDS",
+    "CONTENT_TYPES",
+    "guess_format",
+    "iter_records",
+    "iter_export",
+]
+
+FORMATS = ("json", "ndjson", "csv")
+EXPORT_FORMATS = ("ndjson", "csv")
+
+# Columns of exported rules; files load back with load_redirect_rules
+EXPORT_FIELDS = (
+    "id",
+    "created",
+    "modified",
+    "redirect_url",
+    "is_private",
+    "redirect_identifier",
+    "hits",
+    "redirect_status",
+    "cache_max_age",
+)
+
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+_EXTENSIONS = {
+    ".json": "json",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".csv": "csv",
+}
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+def guess_format(path):
+    """Returns the format implied by the file extension, or None"""
+    return _EXTENSIONS.get(path.suffix.lower())
+
+
+class _JSONStream:
+    """
+    Reads consecutive JSON values from a file in chunks.
+
+    A value cut off at the end of the buffer is retried after reading as
+    much again, so a value is decoded a logarithmic number of times, and
+    one still undecodable after ``max_value_size`` characters is reported
+    as malformed instead of buffering the rest of the file.
+    """
+
+    def __init__(self, fp, chunk_size, max_value_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.max_value_size = max_value_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=0):
+        chunk = self.fp.read(max(self.chunk_size, size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found or 'end of file'!r}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # Either cut off at the end of the buffer or malformed
+                pending = len(self.buffer) - self.pos
+                if pending >= self.max_value_size:
+                    raise ValueError(
+                        f"Malformed JSON value, or one over {self.max_value_size}"
+                        f" characters: {e}"
+                    ) from e
+                if self._fill(min(pending, self.max_value_size - pending)):
+                    continue
+                raise
+            # A number may go on in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json(fp, key="redirect_rules", chunk_size=1 << 16, max_value_size=1 << 24):
+    """
+    Yields the items of a JSON array without loading the whole document.
+
+    The array is either the document itself or the value of ``key`` in a
+    top-level object, as in the ``redirect_rules.json`` fixture. Only one
+    item is held in memory at a time, and none may exceed
+    ``max_value_size`` characters.
+    """
+    stream = _JSONStream(fp, chunk_size, max_value_size)
+    if stream.peek() == "{":
+        stream.expect("{")
+        while stream.peek() != "}":
+            name = stream.value()
+            stream.expect(":")
+            if name == key:
+                break
+            stream.value()
+            if stream.peek() == ",":
+                stream.expect(",")
+        else:
+            raise ValueError(f'No "{key}" array found')
+    stream.expect("[")
+    if stream.peek() == "]":
+        return
+    while True:
+        yield stream.value()
+        if stream.peek() == "]":
+            return
+        stream.expect(",")
+
+
+def iter_ndjson(fp):
+    """Yields one record per non-empty line"""
+    for line in fp:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_csv(fp):
+    """Yields rows keyed by the header line, without empty cells"""
+    for row in csv.DictReader(fp):
+        yield {name: value for name, value in row.items() if value not in ("", None)}
+
+
+def iter_records(fp, fmt):
+    return {"json": iter_json, "ndjson": iter_ndjson, "csv": iter_csv}[fmt](fp)
+
+
+def _export_values(row):
+    """JSON-compatible values of one ``values_list(*EXPORT_FIELDS)`` row"""
+    (
+        rule_id, created, modified, redirect_url, is_private, identifier, hits,
+        redirect_status, cache_max_age,
+    ) = row
+    return (
+        str(rule_id), created.isoformat(), modified.isoformat(),
+        redirect_url, is_private, identifier, hits, redirect_status, cache_max_age,
+    )
+
+
+def _ndjson_lines(rows):
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for row in rows:
+        yield dumps(dict(zip(EXPORT_FIELDS, _export_values(row)))) + "\n"
+
+
+class _Echo:
+    """File-like object handing back what the csv writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        values = list(_export_values(row))
+        values[4] = "true" if values[4] else "false"
+        yield writer.writerow(values)
+
+
+def iter_export(rows, fmt, lines_per_block=1000):
+    """
+    Serializes ``values_list(*EXPORT_FIELDS)`` rows lazily.
+
+    Yields blocks of ``lines_per_block`` lines so callers write (or send)
+    a few large strings instead of one per rule, while memory stays
+    bounded by the block size.
+    """
+    lines = _ndjson_lines(rows) if fmt == "ndjson" else _csv_lines(rows)
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) >= lines_per_block:
+            yield "".join(block)
+            block = []
+    if block:
+        yield "".join(block)
@@ -0,0 +1,309 @@
+import os
+import secrets
+import threading
+import uuid
+from collections import deque
+from hashlib import blake2b
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import IdentifierSequence, RedirectRule
+from .sharding import group_by_shard
+
+__all__ = [
+    "IdentifierAllocator",
+    "RandomAllocator",
+    "SequenceAllocator",
+    "get_allocator",
+]
+
+BASE62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+# Stays below SQLite's limit on query parameters
+_LOOKUP_CHUNK = 900
+
+
+class IdentifierAllocator:
+    """
+    Hands out values for ``RedirectRule.redirect_identifier``.
+
+    Subclasses are configured through ``REDIRECT_IDENTIFIERS``; the other
+    keys of that setting are passed as lowercase keyword arguments.
+    """
+
+    def __init__(self, **options):
+        pass
+
+    def allocate(self, count=1):
+        """Returns ``count`` distinct identifiers no rule uses yet"""
+        raise NotImplementedError
+
+    def owns(self, identifier):
+        """Whether ``identifier`` could be handed out by this allocator"""
+        return False
+
+    def reserve(self, identifiers):
+        """Makes sure imported identifiers are never handed out again"""
+
+
+class RandomAllocator(IdentifierAllocator):
+    """
+    The original scheme: the first 8 hex digits of a random UUID.
+
+    Candidates for a whole batch are checked against the database with a
+    few ``IN`` queries and only the collisions are drawn again. A rule
+    inserted concurrently can still take a checked candidate, which then
+    fails the unique constraint.
+    """
+
+    def candidate(self):
+        return str(uuid.uuid4())[:8]
+
+    def allocate(self, count=1):
+        allocated = set()
+        while len(allocated) < count:
+            candidates = set()
+            while len(candidates) < count - len(allocated):
+                candidate = self.candidate()
+                if candidate not in allocated:
+                    candidates.add(candidate)
+            for alias, chunk in group_by_shard(list(candidates)).items():
+                for start in range(0, len(chunk), _LOOKUP_CHUNK):
+                    candidates.difference_update(
+                        RedirectRule.objects.using(alias).filter(
+                            redirect_identifier__in=chunk[start:start + _LOOKUP_CHUNK]
+                        ).values_list('redirect_identifier', flat=True)
+                    )
+            allocated |= candidates
+        return list(allocated)
+
+
+class _Permutation:
+    """
+    Keyed bijection on ``range(size)``: a Feistel network over the next
+    even power of two, cycle-walking back into the range.
+    """
+    ROUNDS = 4
+
+    def __init__(self, size, key):
+        self.size = size
+        self.key = key
+        self.half = (max(size - 1, 1).bit_length() + 1) // 2
+        self.mask = (1 << self.half) - 1
+
+    def _round(self, number, value):
+        digest = blake2b(
+            bytes([number]) + value.to_bytes(8, "big"), key=self.key, digest_size=8
+        ).digest()
+        return int.from_bytes(digest, "big") & self.mask
+
+    def _encrypt(self, value):
+        left, right = value >> self.half, value & self.mask
+        for number in range(self.ROUNDS):
+            left, right = right, left ^ self._round(number, right)
+        return (left << self.half) | right
+
+    def _decrypt(self, value):
+        left, right = value >> self.half, value & self.mask
+        for number in reversed(range(self.ROUNDS)):
+            left, right = right ^ self._round(number, left), left
+        return (left << self.half) | right
+
+    def forward(self, value):
+        value = self._encrypt(value)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def backward(self, value):
+        value = self._decrypt(value)
+        while value >= self.size:
+            value = self._decrypt(value)
+        return value
+
+
+class SequenceAllocator(IdentifierAllocator):
+    """
+    Collision-free identifiers from a database sequence.
+
+    Each process reserves ``BLOCK_SIZE`` sequence numbers at a time (or as
+    many as a bulk insert needs) and turns them into identifiers with a
+    keyed permutation followed by a fixed-length encoding in ``ALPHABET``.
+    Distinct numbers always give distinct identifiers, so nothing is
+    looked up or retried, and consecutive rules still get unrelated
+    identifiers. The first character is never one of ``LEGACY_ALPHABET``,
+    which keeps the namespace apart from identifiers generated before the
+    allocator (8 hex digits).
+
+    On PostgreSQL the numbers come from a real sequence, which is not
+    rolled back with the surrounding transaction. Elsewhere a counter row
+    is used; a block reserved in a transaction that later rolls back is
+    not handed out again by the same process, but other processes may
+    reuse it, which only matters for multi-process SQLite setups.
+    """
+    SEQUENCE = "url_management_identifier_seq"
+    NAME = "redirect_identifier"
+
+    def __init__(self, alphabet=BASE62, length=8, block_size=1000,
+                 legacy_alphabet="0123456789abcdef", **options):
+        max_length = RedirectRule._meta.get_field("redirect_identifier").max_length
+        if not 1 < length <= max_length:
+            raise ImproperlyConfigured(f"Identifier length must be in 2..{max_length}")
+        if len(set(alphabet)) != len(alphabet) or "/" in alphabet:
+            raise ImproperlyConfigured("The identifier alphabet must be unique and URL-safe")
+        self.alphabet = alphabet
+        self.leading = "".join(char for char in alphabet if char not in legacy_alphabet)
+        if not self.leading:
+            raise ImproperlyConfigured("No leading characters left outside the legacy alphabet")
+        self.length = length
+        self.block_size = block_size
+        self.size = len(self.leading) * len(alphabet) ** (length - 1)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._block = deque()
+        self._floor = 0
+        self._permutation = None
+        self._sequence_ready = False
+
+    def _check_fork(self):
+        # A forked worker must not hand out the numbers its parent holds
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            self._block = deque()
+
+    @property
+    def permutation(self):
+        if self._permutation is None:
+            key = self._sequence_row().key
+            self._permutation = _Permutation(self.size, bytes.fromhex(key))
+        return self._permutation
+
+    def _sequence_row(self):
+        # Normally created by the migrations; recreated with the same key
+        key = self._permutation.key.hex() if self._permutation else secrets.token_hex(16)
+        sequence, _ = IdentifierSequence.objects.get_or_create(
+            name=self.NAME, defaults={"key": key}
+        )
+        return sequence
+
+    def _ensure_sequence(self, cursor):
+        if not self._sequence_ready:
+            # Normally created by the migrations
+            cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {self.SEQUENCE} MINVALUE 0 START 0")
+            self._sequence_ready = True
+
+    def encode(self, number):
+        """Identifier of a sequence number"""
+        if number >= self.size:
+            raise OverflowError("Identifier space exhausted; increase the identifier length")
+        value = self.permutation.forward(number)
+        base = len(self.alphabet)
+        chars = []
+        for _ in range(self.length - 1):
+            value, digit = divmod(value, base)
+            chars.append(self.alphabet[digit])
+        chars.append(self.leading[value])
+        return "".join(reversed(chars))
+
+    def decode(self, identifier):
+        """Sequence number of an identifier, or None if it is not ours"""
+        if len(identifier) != self.length or identifier[0] not in self.leading:
+            return None
+        value = self.leading.index(identifier[0])
+        base = len(self.alphabet)
+        for char in identifier[1:]:
+            digit = self.alphabet.find(char)
+            if digit < 0:
+                return None
+            value = value * base + digit
+        return self.permutation.backward(value)
+
+    def owns(self, identifier):
+        return self.decode(identifier) is not None
+
+    def _reserve_numbers(self, count):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                self._ensure_sequence(cursor)
+                cursor.execute(
+                    "SELECT nextval(%s) FROM generate_series(1, %s)", [self.SEQUENCE, count]
+                )
+                return [number for number, in cursor.fetchall()]
+
+        sequences = IdentifierSequence.objects.filter(name=self.NAME)
+        next_value = Greatest(F("next_value"), self._floor) + count
+        # The update locks the row until the read, so no other process can
+        # move the counter in between and be handed the same block
+        with transaction.atomic(savepoint=False):
+            if not sequences.update(next_value=next_value):
+                self._sequence_row()
+                sequences.update(next_value=next_value)
+            end = sequences.values_list("next_value", flat=True).get()
+        self._floor = end
+        return range(end - count, end)
+
+    def allocate(self, count=1):
+        self._check_fork()
+        with self._lock:
+            if len(self._block) < count:
+                needed = count - len(self._block)
+                self._block.extend(self._reserve_numbers(max(needed, self.block_size)))
+            numbers = [self._block.popleft() for _ in range(count)]
+        return [self.encode(number) for number in numbers]
+
+    def reserve(self, identifiers):
+        """
+        Moves the sequence past imported identifiers of our namespace.
+
+        Meant for loading rules exported from another deployment before
+        it serves traffic: blocks already held by other processes are not
+        affected.
+        """
+        numbers = [number for number in map(self.decode, identifiers) if number is not None]
+        if not numbers:
+            return
+        highest = max(numbers)
+        with self._lock:
+            self._block = deque(number for number in self._block if number > highest)
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                self._ensure_sequence(cursor)
+                cursor.execute(
+                    f"SELECT setval(%s, GREATEST(%s, (SELECT last_value FROM {self.SEQUENCE})))",
+                    [self.SEQUENCE, highest],
+                )
+        else:
+            self._floor = max(self._floor, highest + 1)
+            sequences = IdentifierSequence.objects.filter(name=self.NAME)
+            if not sequences.update(next_value=Greatest(F("next_value"), highest + 1)):
+                self._sequence_row()
+                sequences.update(next_value=Greatest(F("next_value"), highest + 1))
+
+
+_allocator = None
+
+
+def get_allocator():
+    """Returns the allocator configured in ``REDIRECT_IDENTIFIERS``"""
+    global _allocator
+    if _allocator is None:
+        options = dict(settings.REDIRECT_IDENTIFIERS)
+        allocator_class = import_string(options.pop("ALLOCATOR"))
+        _allocator = allocator_class(**{name.lower(): value for name, value in options.items()})
+    return _allocator
+
+
+@receiver(setting_changed)
+def _reset_allocator(setting, **kwargs):
+    """Rebuilds the allocator when its settings are overridden (e.g. in tests)"""
+    global _allocator
+    if setting == "REDIRECT_IDENTIFIERS":
+        _allocator = None
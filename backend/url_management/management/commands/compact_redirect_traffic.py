@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from url_management.traffic import compact_traffic
+
+
+class Command(BaseCommand):
+    help = 'Deletes traffic buckets past their retention period (run periodically, e.g. daily)'
+
+    def add_arguments(self, parser):
+        options = settings.REDIRECTOR_TRAFFIC
+        parser.add_argument(
+            '--hourly-days',
+            type=int,
+            help='Days of hourly buckets to keep',
+            default=options['HOURLY_RETENTION_DAYS']
+        )
+        parser.add_argument(
+            '--daily-days',
+            type=int,
+            help='Days of daily buckets to keep (default: keep forever)',
+            default=options['DAILY_RETENTION_DAYS']
+        )
+
+    def handle(self, *args, **options):
+        hourly_days, daily_days = options['hourly_days'], options['daily_days']
+        if hourly_days < 1 or (daily_days is not None and daily_days < hourly_days):
+            raise CommandError('Retention must be at least a day and daily >= hourly')
+
+        hourly, daily = compact_traffic(hourly_days, daily_days)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Deleted {hourly} hourly and {daily} daily traffic buckets'
+            )
+        )
@@ -0,0 +1,72 @@
+from itertools import chain
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from url_management.formats import EXPORT_FIELDS, EXPORT_FORMATS, iter_export
+from url_management.models import RedirectRule
+from url_management.sharding import on_each_shard
+
+
+class Command(BaseCommand):
+    help = (
+        'Exports redirect rules as NDJSON or CSV, streaming them from the '
+        'database with constant memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            type=str,
+            help='Only export the rules of this user'
+        )
+        parser.add_argument(
+            '--format',
+            choices=EXPORT_FORMATS,
+            help='Output format',
+            default='ndjson'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Output file (default: stdout)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Rows fetched from the database cursor at a time',
+            default=2000
+        )
+
+    def handle(self, *args, **options):
+        queryset = RedirectRule.objects.order_by()
+        if options['username']:
+            try:
+                owner = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f'User not found: {options["username"]}')
+            queryset = queryset.filter(owner=owner)
+
+        # A server-side cursor on PostgreSQL; no model instances are built
+        rows = chain.from_iterable(
+            shard.values_list(*EXPORT_FIELDS).iterator(chunk_size=options['chunk_size'])
+            for shard in on_each_shard(queryset)
+        )
+        blocks = iter_export(rows, options['format'])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                lines = self.write(blocks, f)
+            count = lines - 1 if options['format'] == 'csv' else lines
+            self.stderr.write(
+                self.style.SUCCESS(f'Exported {count} redirect rules to {options["output"]}')
+            )
+        else:
+            self.write(blocks, self.stdout)
+
+    def write(self, blocks, out):
+        """Writes the blocks and returns the number of lines"""
+        lines = 0
+        for block in blocks:
+            out.write(block)
+            lines += block.count('\n')
+        return lines
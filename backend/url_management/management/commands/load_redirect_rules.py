@@ -1,13 +1,29 @@
 import json
+import os
+import time
+from itertools import islice
 from pathlib import Path
 
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from url_management.bulk import bulk_create_rules, copy_rules
+from url_management.formats import FORMATS, guess_format, iter_records
+from url_management.identifiers import get_allocator
 from url_management.models import RedirectRule
+from url_management.serializers import RedirectRuleSerializer
+from url_management.sharding import on_each_shard
+
+# Invalid records reported individually before only counting them
+MAX_REPORTED_ERRORS = 10
 
 
 class Command(BaseCommand):
-    help = 'Loads redirect rules from a JSON fixture file'
+    help = (
+        'Loads redirect rules from a JSON, NDJSON or CSV file. The file is '
+        'streamed and inserted in batches, one transaction per batch, and '
+        'an interrupted load can be resumed with --resume.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -19,9 +35,42 @@ class Command(BaseCommand):
         parser.add_argument(
             '--file',
             type=str,
-            help='Path to JSON file with redirect rules',
+            help='Path to the file with redirect rules',
             default='url_management/tests/fixtures/redirect_rules.json'
         )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='File format (default: from the file extension, else json)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Rules inserted per transaction',
+            default=5000
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            default=None,
+            help='Insert with COPY (default on PostgreSQL)'
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_false',
+            dest='copy',
+            help='Insert with bulk INSERT statements'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Skip the records committed by a previous interrupted run'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            help='Checkpoint file (default: <file>.checkpoint)'
+        )
 
     def handle(self, *args, **options):
         try:
@@ -37,29 +86,128 @@ class Command(BaseCommand):
                     self.style.SUCCESS(f'Created new user: {options["username"]}')
                 )
 
-            # Load fixture file
-            fixture_path = Path(options['file'])
-            if not fixture_path.exists():
+            file_path = Path(options['file'])
+            if not file_path.exists():
                 raise CommandError(f'File not found: {options["file"]}')
+            if options['batch_size'] < 1:
+                raise CommandError('--batch-size must be positive')
+            fmt = options['format'] or guess_format(file_path) or 'json'
+            use_copy = options['copy']
+            if use_copy is None:
+                use_copy = connection.vendor == 'postgresql'
+            checkpoint = Path(options['checkpoint'] or f'{file_path}.checkpoint')
+            self.source = str(file_path.resolve())
+            skip = self.read_checkpoint(checkpoint) if options['resume'] else 0
 
-            with open(fixture_path, 'r') as f:
-                data = json.load(f)
-
-            # Create redirect rules
-            created_count = 0
-            for rule_data in data['redirect_rules']:
-                RedirectRule.objects.create(
-                    owner=user,
-                    redirect_url=rule_data['redirect_url'],
-                    is_private=rule_data['is_private']
-                )
-                created_count += 1
+            with open(file_path, 'r', encoding='utf-8', newline='') as f:
+                records = iter_records(f, fmt)
+                if skip:
+                    self.stdout.write(f'Resuming after {skip} records')
+                    for _ in islice(records, skip):
+                        pass
+                totals = self.load(records, user, skip, checkpoint, use_copy, options)
 
+            checkpoint.unlink(missing_ok=True)
+            created_count, invalid_count, elapsed = totals
             self.stdout.write(
                 self.style.SUCCESS(
                     f'Successfully created {created_count} redirect rules'
+                    f' in {elapsed:.1f}s ({created_count / max(elapsed, 1e-9):.0f} rules/s)'
                 )
             )
+            if invalid_count:
+                self.stdout.write(
+                    self.style.WARNING(f'Skipped {invalid_count} invalid records')
+                )
 
+        except CommandError:
+            raise
         except Exception as e:
-            raise CommandError(f'Error loading redirect rules: {str(e)}')
+            raise CommandError(
+                f'Error loading redirect rules: {str(e)} '
+                f'(run again with --resume to continue)'
+            )
+
+    def load(self, records, user, position, checkpoint, use_copy, options):
+        created_count = invalid_count = 0
+        started = time.monotonic()
+        while True:
+            batch = list(islice(records, options['batch_size']))
+            if not batch:
+                break
+            rules, errors = self.build_rules(batch, user, position)
+            for number, error in errors:
+                if invalid_count < MAX_REPORTED_ERRORS:
+                    self.stderr.write(f'Record {number}: {error}')
+                invalid_count += 1
+
+            end = position + len(batch)
+            if rules:
+                # Imported identifiers from our own namespace must not be allocated again
+                get_allocator().reserve(
+                    [rule.redirect_identifier for rule in rules if rule.redirect_identifier]
+                )
+                # The first rule's pk tells a resumed run whether this batch committed
+                self.write_checkpoint(checkpoint, position, pending=(end, str(rules[0].pk)))
+                if use_copy:
+                    copy_rules(rules)
+                else:
+                    bulk_create_rules(rules)
+            position = end
+            self.write_checkpoint(checkpoint, position)
+
+            created_count += len(rules)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{position} records read, {created_count} rules created '
+                f'({created_count / max(elapsed, 1e-9):.0f} rules/s)'
+            )
+        return created_count, invalid_count, time.monotonic() - started
+
+    def build_rules(self, batch, user, position):
+        """Validates a batch of records like the API does"""
+        serializer = RedirectRuleSerializer(data=batch, many=True)
+        serializer.is_valid(raise_exception=True)
+        errors = [
+            (position + index + 1, detail)
+            for index, detail in sorted(serializer.item_errors.items())
+        ]
+        valid = (index for index in range(len(batch)) if index not in serializer.item_errors)
+
+        rules = []
+        max_length = RedirectRule._meta.get_field('redirect_identifier').max_length
+        for index, data in zip(valid, serializer.validated_data):
+            # Identifiers from the old system are kept so its links keep working
+            identifier = batch[index].get('redirect_identifier')
+            if identifier is not None and not (
+                isinstance(identifier, str) and 0 < len(identifier) <= max_length
+                and '/' not in identifier
+            ):
+                errors.append((position + index + 1, {'redirect_identifier': 'Invalid identifier'}))
+                continue
+            rules.append(RedirectRule(owner=user, redirect_identifier=identifier or '', **data))
+        errors.sort(key=lambda error: error[0])
+        return rules, errors
+
+    def read_checkpoint(self, checkpoint):
+        if not checkpoint.exists():
+            self.stdout.write('No checkpoint found, starting from the beginning')
+            return 0
+        state = json.loads(checkpoint.read_text())
+        if state['file'] != self.source:
+            raise CommandError(f'Checkpoint {checkpoint} belongs to {state["file"]}')
+        pending = state.get('pending')
+        if pending and any(
+            shard.exists()
+            for shard in on_each_shard(RedirectRule.objects.filter(pk=pending['marker']))
+        ):
+            return pending['records']
+        return state['records']
+
+    def write_checkpoint(self, checkpoint, records, pending=None):
+        state = {'file': self.source, 'records': records}
+        if pending:
+            state['pending'] = {'records': pending[0], 'marker': pending[1]}
+        temporary = checkpoint.with_name(checkpoint.name + '.tmp')
+        temporary.write_text(json.dumps(state))
+        os.replace(temporary, checkpoint)
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from url_management.models import RedirectRule, TrafficBucket
+from url_management.sharding import get_shards, shard_for
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves redirect rules, with their traffic, to the shard of their '
+        'identifier in DATABASE_SHARDS (after adding or removing shards, or '
+        'to enable sharding with --from default)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from',
+            dest='sources',
+            nargs='+',
+            help=(
+                'Databases to move rules out of (default: the current and '
+                'previous shards)'
+            ),
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Rules moved per transaction',
+            default=1000
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the rules that would move',
+        )
+
+    def handle(self, *args, **options):
+        shards = get_shards()
+        if not shards:
+            raise CommandError('No shards configured in DATABASE_SHARDS')
+        sources = options['sources'] or list(dict.fromkeys(
+            [*shards, *settings.DATABASE_SHARDS['PREVIOUS_ALIASES']]
+        ))
+        unknown = [alias for alias in sources if alias not in connections.settings]
+        if unknown:
+            raise CommandError(f'Unknown databases: {", ".join(unknown)}')
+
+        scanned = moved = 0
+        for source in sources:
+            for batch in self.batches(source, options['batch_size']):
+                scanned += len(batch)
+                targets = {}
+                for pk, redirect_identifier in batch:
+                    target = shard_for(redirect_identifier)
+                    if target != source:
+                        targets.setdefault(target, []).append(pk)
+                for target, pks in targets.items():
+                    if not options['dry_run']:
+                        self.move(source, target, pks)
+                    moved += len(pks)
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(
+            self.style.SUCCESS(f'{verb} {moved} of {scanned} redirect rules')
+        )
+
+    def batches(self, source, batch_size):
+        """Yields the (pk, identifier) pairs of the source in pk order"""
+        queryset = RedirectRule.objects.using(source).order_by('pk')
+        last = None
+        while True:
+            page = queryset if last is None else queryset.filter(pk__gt=last)
+            batch = list(page.values_list('pk', 'redirect_identifier')[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last = batch[-1][0]
+
+    def move(self, source, target, pks):
+        """
+        Copies rules and their buckets to the target, then deletes them from
+        the source. Writes to the rules wait for the move on databases with
+        row locks. Rules left on both by an interrupted move keep the copy
+        already on the target.
+        """
+        with transaction.atomic(using=source), transaction.atomic(using=target):
+            rules = list(
+                RedirectRule.objects.using(source).select_for_update().filter(pk__in=pks)
+            )
+            buckets = list(TrafficBucket.objects.using(source).filter(rule__in=pks))
+            for bucket in buckets:
+                # Bucket ids are only unique within a database
+                bucket.pk = None
+            RedirectRule.objects.using(target).bulk_create(rules, ignore_conflicts=True)
+            TrafficBucket.objects.using(target).bulk_create(buckets, ignore_conflicts=True)
+            # Cascades to the buckets and drops the cached resolutions
+            RedirectRule.objects.using(source).filter(pk__in=pks).delete()
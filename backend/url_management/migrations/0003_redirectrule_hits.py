@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('url_management', '0002_alter_redirectrule_owner_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='redirectrule',
+            name='hits',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
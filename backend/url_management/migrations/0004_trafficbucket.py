@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('url_management', '0003_redirectrule_hits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrafficBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('hits', models.PositiveBigIntegerField(default=0)),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='traffic', to='url_management.redirectrule')),
+            ],
+            options={
+                'ordering': ['start'],
+                'constraints': [models.UniqueConstraint(fields=('rule', 'granularity', 'start'), name='unique_traffic_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:10
+
+import secrets
+
+from django.db import migrations, models
+
+SEQUENCE = 'url_management_identifier_seq'
+
+
+def create_sequence(apps, schema_editor):
+    """Creates the allocator's permutation key and, on PostgreSQL, its sequence"""
+    IdentifierSequence = apps.get_model('url_management', 'IdentifierSequence')
+    IdentifierSequence.objects.using(schema_editor.connection.alias).get_or_create(
+        name='redirect_identifier', defaults={'key': secrets.token_hex(16)}
+    )
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE} MINVALUE 0 START 0')
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('url_management', '0004_trafficbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdentifierSequence',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=64)),
+                ('next_value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='redirectrule',
+            name='redirect_identifier',
+            field=models.CharField(editable=False, max_length=16, unique=True),
+        ),
+        # Existing rules keep their hex identifiers, which the allocator never
+        # produces (its first character is outside the hex digits)
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+from url_management.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # The indexes are built concurrently, outside a transaction
+    atomic = False
+
+    dependencies = [
+        ('url_management', '0005_identifier_allocator'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='redirectrule',
+            index=models.Index(fields=['owner', 'created', 'id'], name='redirectrule_owner_created'),
+        ),
+    ]
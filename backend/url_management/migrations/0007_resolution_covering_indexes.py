@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+from url_management.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # The indexes are built concurrently, outside a transaction
+    atomic = False
+
+    dependencies = [
+        ('url_management', '0006_redirectrule_owner_created'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='redirectrule',
+            index=models.Index(condition=models.Q(('is_private', False)), fields=['redirect_identifier'], include=('redirect_url', 'owner'), name='redirectrule_public_lookup'),
+        ),
+        AddIndexConcurrently(
+            model_name='redirectrule',
+            index=models.Index(condition=models.Q(('is_private', True)), fields=['redirect_identifier'], include=('redirect_url', 'owner'), name='redirectrule_private_lookup'),
+        ),
+    ]
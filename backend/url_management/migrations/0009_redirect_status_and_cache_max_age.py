@@ -0,0 +1,46 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:55
+
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+
+from url_management.operations import AddIndexConcurrently, RemoveIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # The indexes are built concurrently, outside a transaction
+    atomic = False
+
+    dependencies = [
+        ('url_management', '0008_redirectrule_owner_without_constraint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='redirectrule',
+            name='redirectrule_public_lookup',
+        ),
+        RemoveIndexConcurrently(
+            model_name='redirectrule',
+            name='redirectrule_private_lookup',
+        ),
+        migrations.AddField(
+            model_name='redirectrule',
+            name='cache_max_age',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[django.core.validators.MaxValueValidator(31536000)]),
+        ),
+        migrations.AddField(
+            model_name='redirectrule',
+            name='redirect_status',
+            field=models.PositiveSmallIntegerField(choices=[(301, 'Moved Permanently'), (302, 'Found'), (307, 'Temporary Redirect'), (308, 'Permanent Redirect')], default=302),
+        ),
+        AddIndexConcurrently(
+            model_name='redirectrule',
+            index=models.Index(condition=models.Q(('is_private', False)), fields=['redirect_identifier'], include=('redirect_url', 'owner', 'redirect_status', 'cache_max_age'), name='redirectrule_public_lookup'),
+        ),
+        AddIndexConcurrently(
+            model_name='redirectrule',
+            index=models.Index(condition=models.Q(('is_private', True)), fields=['redirect_identifier'], include=('redirect_url', 'owner', 'redirect_status', 'cache_max_age'), name='redirectrule_private_lookup'),
+        ),
+    ]
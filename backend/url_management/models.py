@@ -2,30 +2,134 @@ import uuid
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.validators import URLValidator
+from django.core.validators import MaxValueValidator, URLValidator
 from django.db import models
 
 
+class ShardedQuerySet(models.QuerySet):
+    """
+    ``create`` leaves the database to the router when none was chosen with
+    ``using``, so that it can route by the new instance (see
+    url_management.sharding) instead of by model alone.
+    """
+
+    def create(self, **kwargs):
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+
 class RedirectRule(models.Model):
     """
     Model for storing redirect rules.
     """
+    class RedirectStatus(models.IntegerChoices):
+        MOVED_PERMANENTLY = 301, 'Moved Permanently'
+        FOUND = 302, 'Found'
+        TEMPORARY_REDIRECT = 307, 'Temporary Redirect'
+        PERMANENT_REDIRECT = 308, 'Permanent Redirect'
+
+    # A year, the longest max-age worth sending
+    MAX_CACHE_AGE = 365 * 24 * 3600
+
     # owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    # No foreign key constraint: rules may live on other databases than
+    # their owners (see url_management.sharding)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
     redirect_url = models.URLField(max_length=200, validators=[URLValidator()])
     is_private = models.BooleanField(default=False)
-    redirect_identifier = models.CharField(max_length=8, unique=True, editable=False)
+    redirect_status = models.PositiveSmallIntegerField(
+        choices=RedirectStatus.choices, default=RedirectStatus.FOUND
+    )
+    # Seconds browsers, and for public rules shared caches, may reuse the
+    # redirect (see redirector.responses); None has them revalidate every time
+    cache_max_age = models.PositiveIntegerField(
+        null=True, blank=True, validators=[MaxValueValidator(MAX_CACHE_AGE)]
+    )
+    # See url_management.identifiers; rules created before it have 8 hex digits
+    redirect_identifier = models.CharField(max_length=16, unique=True, editable=False)
+    # Maintained by the redirector's buffered click counter
+    hits = models.PositiveBigIntegerField(default=0, editable=False)
+
+    objects = ShardedQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.redirect_identifier} -> {self.redirect_url}"
 
     def save(self, *args, **kwargs):
         if not self.redirect_identifier:
-            self.redirect_identifier = str(uuid.uuid4())[:8]
+            from .identifiers import get_allocator
+            self.redirect_identifier = get_allocator().allocate()[0]
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back a stale click count over flushed increments
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'hits'
+            ]
         super().save(*args, **kwargs)
 
     class Meta:
         ordering = ["-created"]
+        indexes = [
+            # Keyset pagination of a user's rules (see KeysetPagination)
+            models.Index(fields=['owner', 'created', 'id'], name='redirectrule_owner_created'),
+            # Index-only scans for redirector.resolver.lookup_query; INCLUDE
+            # is PostgreSQL only, elsewhere these are plain partial indexes
+            models.Index(
+                fields=['redirect_identifier'],
+                include=['redirect_url', 'owner', 'redirect_status', 'cache_max_age'],
+                condition=models.Q(is_private=False),
+                name='redirectrule_public_lookup',
+            ),
+            models.Index(
+                fields=['redirect_identifier'],
+                include=['redirect_url', 'owner', 'redirect_status', 'cache_max_age'],
+                condition=models.Q(is_private=True),
+                name='redirectrule_private_lookup',
+            ),
+        ]
+
+
+class TrafficBucket(models.Model):
+    """
+    Redirect hits of a rule aggregated over one UTC hour or day.
+    """
+    class Granularity(models.TextChoices):
+        HOUR = 'hour', 'Hour'
+        DAY = 'day', 'Day'
+
+    rule = models.ForeignKey(RedirectRule, on_delete=models.CASCADE, related_name='traffic')
+    granularity = models.CharField(max_length=4, choices=Granularity.choices)
+    start = models.DateTimeField()
+    hits = models.PositiveBigIntegerField(default=0)
+
+    objects = ShardedQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.rule_id} {self.granularity} {self.start:%Y-%m-%d %H:%M}: {self.hits}"
+
+    class Meta:
+        ordering = ["start"]
+        constraints = [
+            # Also serves the range scans of the stats API
+            models.UniqueConstraint(
+                fields=['rule', 'granularity', 'start'], name='unique_traffic_bucket'
+            ),
+        ]
+
+
+class IdentifierSequence(models.Model):
+    """
+    State of the identifier allocator: the key of its permutation and,
+    on databases without sequences, the next free number.
+    """
+    name = models.CharField(max_length=32, primary_key=True)
+    key = models.CharField(max_length=64)
+    next_value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
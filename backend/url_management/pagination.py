@@ -0,0 +1,128 @@
+import base64
+import binascii
+import json
+import uuid
+from collections import OrderedDict
+from itertools import islice
+from operator import attrgetter
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .sharding import merge_shards, on_each_shard
+
+__all__ = ["KeysetPagination"]
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first pagination over ``(created, id)``.
+
+    The cursor holds the key of the last row of the previous page, and the
+    next page is read with ``(created, id) < cursor`` straight from the
+    ``(owner, created, id)`` index. Unlike ``LimitOffsetPagination`` there
+    is no ``COUNT(*)`` and no ``OFFSET`` scan, so every page costs the same
+    however deep it is. Only forward links are provided.
+
+    With shards, each shard returns its first rows after the cursor and
+    the page is the newest of them.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        page_size = api_settings.PAGE_SIZE or 20
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        return min(max(requested, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            cursor = parse_datetime(created), uuid.UUID(pk)
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if cursor[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, rule):
+        payload = json.dumps([rule.created.isoformat(), str(rule.pk)])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-created', '-pk')
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            created, pk = cursor
+            # The redundant created <= cursor bound gives the index a start position
+            queryset = queryset.filter(created__lte=created).exclude(created=created, pk__gte=pk)
+
+        rules = list(islice(
+            merge_shards(
+                [shard[:page_size + 1] for shard in on_each_shard(queryset)],
+                key=attrgetter('created', 'pk'),
+                reverse=True,
+            ),
+            page_size + 1,
+        ))
+        self.has_next = len(rules) > page_size
+        self.page = rules[:page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results per page (at most {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+        ]
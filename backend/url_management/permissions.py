@@ -1,6 +1,14 @@
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
 
+class IsOwner(BasePermission):
+    """
+    Allows access to an object only to its owner.
+    """
+    def has_object_permission(self, request, view, obj):
+        return obj.owner_id == request.user.pk
+
+
 class IsOwnerOrReadOnly(BasePermission):
     """
     Allows editing/deleting an object only if the user is the owner.
@@ -1,8 +1,43 @@
 from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.validators import URLValidator
+from django.utils import timezone
 from rest_framework import serializers
 
-from .models import RedirectRule
+from .models import RedirectRule, TrafficBucket
+from .traffic import BUCKET_SIZES, bucket_floor
+
+
+class _InvalidItem:
+    def __init__(self, errors):
+        self.errors = errors
+
+
+class RedirectRuleListSerializer(serializers.ListSerializer):
+    """
+    Validates a batch of rules item by item.
+
+    Invalid items do not reject the whole batch: they are left out of
+    ``validated_data`` and their errors are collected in ``item_errors``,
+    keyed by their position in the input.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.item_errors = {}
+
+    def run_child_validation(self, data):
+        try:
+            return super().run_child_validation(data)
+        except serializers.ValidationError as exc:
+            return _InvalidItem(exc.detail)
+
+    def to_internal_value(self, data):
+        results = super().to_internal_value(data)
+        self.item_errors = {
+            index: result.errors
+            for index, result in enumerate(results)
+            if isinstance(result, _InvalidItem)
+        }
+        return [result for result in results if not isinstance(result, _InvalidItem)]
 
 
 class RedirectRuleSerializer(serializers.ModelSerializer):
@@ -20,9 +55,12 @@ class RedirectRuleSerializer(serializers.ModelSerializer):
             'modified',
             'redirect_url',
             'is_private',
+            'redirect_status',
+            'cache_max_age',
             'redirect_identifier',
         ]
         read_only_fields = ['id', 'created', 'modified', 'redirect_identifier']
+        list_serializer_class = RedirectRuleListSerializer
 
     def validate_redirect_url(self, value):
         """Validate that redirect_url is a proper URL"""
@@ -32,3 +70,71 @@ class RedirectRuleSerializer(serializers.ModelSerializer):
         except DjangoValidationError:
             raise serializers.ValidationError("Invalid URL format")
         return value
+
+
+class BulkItemErrorSerializer(serializers.Serializer):
+    index = serializers.IntegerField()
+    errors = serializers.DictField()
+
+
+class RedirectRuleBulkResultSerializer(serializers.Serializer):
+    created = RedirectRuleSerializer(many=True)
+    errors = BulkItemErrorSerializer(many=True)
+
+
+class RedirectRuleClicksSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RedirectRule
+        fields = ['id', 'redirect_identifier', 'hits']
+        read_only_fields = fields
+
+
+class TrafficQuerySerializer(serializers.Serializer):
+    """Validates the time range of a stats query"""
+    # Upper bound on the buckets returned by one query (a month of hours)
+    MAX_BUCKETS = 744
+    DEFAULT_BUCKETS = {
+        TrafficBucket.Granularity.HOUR: 24,
+        TrafficBucket.Granularity.DAY: 30,
+    }
+
+    granularity = serializers.ChoiceField(
+        choices=TrafficBucket.Granularity.choices, default=TrafficBucket.Granularity.HOUR
+    )
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        """Aligns the range to whole buckets: [start, end)"""
+        granularity = attrs['granularity']
+        step = BUCKET_SIZES[granularity]
+        end = attrs.get('end') or timezone.now()
+        floor = bucket_floor(end, granularity)
+        end = floor if floor == end else floor + step
+        start = attrs.get('start')
+        if start is None:
+            start = end - step * self.DEFAULT_BUCKETS[granularity]
+        start = bucket_floor(start, granularity)
+
+        if start >= end:
+            raise serializers.ValidationError("start must be before end")
+        if (end - start) / step > self.MAX_BUCKETS:
+            raise serializers.ValidationError(
+                f"The range spans more than {self.MAX_BUCKETS} buckets"
+            )
+        attrs.update(start=start, end=end)
+        return attrs
+
+
+class TrafficBucketSerializer(serializers.Serializer):
+    start = serializers.DateTimeField()
+    hits = serializers.IntegerField()
+
+
+class RedirectRuleStatsSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    granularity = serializers.CharField()
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    total = serializers.IntegerField()
+    buckets = TrafficBucketSerializer(many=True)
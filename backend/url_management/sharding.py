@@ -0,0 +1,180 @@
+"""
+Optional sharding of redirect rules across databases.
+
+Rules and their traffic buckets are spread over the databases listed in
+``DATABASE_SHARDS['ALIASES']`` by a jump consistent hash of their
+``redirect_identifier``, so a redirect is resolved with a single lookup on
+one shard. Everything else about a rule lives elsewhere: owners, the
+identifier allocator and the rest of the schema stay on ``default``.
+
+Queries that do not name an identifier cannot be routed and must visit
+every shard: ``on_each_shard`` splits a queryset per shard,
+``get_from_shards`` looks a rule up by any other field and
+``merge_shards`` merges per-shard results that share an ordering.
+Unsaved rules are written to the shard of their identifier, loaded ones
+back to the database they were read from.
+
+Growing from ``n`` to ``n + 1`` shards moves about ``1/(n + 1)`` of the
+rules, all to the new shard. List the former aliases in
+``DATABASE_SHARDS['PREVIOUS_ALIASES']`` (``default`` when sharding is
+first enabled) while ``reshard_redirect_rules`` moves them: lookups
+missing on the new shard fall back to the former one meanwhile.
+
+Without shards every function here leaves routing to the other routers.
+The admin only sees rules stored on ``default``.
+"""
+import hashlib
+import heapq
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import RedirectRule, TrafficBucket
+
+__all__ = [
+    "ShardRouter",
+    "get_shards",
+    "is_sharded",
+    "jump_hash",
+    "shard_for",
+    "previous_shard_for",
+    "group_by_shard",
+    "on_each_shard",
+    "get_from_shards",
+    "merge_shards",
+    "atomic_on",
+]
+
+# Apps migrated on shards: the rules, and what their migration history
+# depends on
+SHARD_APPS = frozenset(["url_management", "auth", "contenttypes"])
+
+
+def get_shards():
+    return settings.DATABASE_SHARDS["ALIASES"]
+
+
+def is_sharded():
+    return bool(settings.DATABASE_SHARDS["ALIASES"])
+
+
+def jump_hash(key, buckets):
+    """
+    Lamping and Veach's jump consistent hash of a 64-bit ``key`` to
+    ``range(buckets)``. Adding a bucket only moves keys to the new one.
+    """
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for(redirect_identifier, aliases=None):
+    """The shard of ``redirect_identifier`` among ``aliases`` (the current shards)"""
+    aliases = aliases or get_shards()
+    digest = hashlib.blake2b(redirect_identifier.encode(), digest_size=8).digest()
+    return aliases[jump_hash(int.from_bytes(digest, "big"), len(aliases))]
+
+
+def previous_shard_for(redirect_identifier):
+    """The shard of ``redirect_identifier`` before the resharding in progress, or None"""
+    previous = settings.DATABASE_SHARDS["PREVIOUS_ALIASES"]
+    return shard_for(redirect_identifier, previous) if previous else None
+
+
+def group_by_shard(items, key=None):
+    """
+    Groups identifiers, or items whose identifier is ``key(item)``, by the
+    database they are written to. Without shards that is the single
+    database of the router.
+    """
+    if not is_sharded():
+        return {router.db_for_write(RedirectRule): list(items)} if items else {}
+    groups = {}
+    for item in items:
+        alias = shard_for(key(item) if key else item)
+        groups.setdefault(alias, []).append(item)
+    return groups
+
+
+def on_each_shard(queryset):
+    """``queryset`` on every shard, or alone without shards"""
+    if not is_sharded():
+        return [queryset]
+    return [queryset.using(alias) for alias in get_shards()]
+
+
+def get_from_shards(queryset, **lookup):
+    """Like ``queryset.get(**lookup)``, trying the shards in turn"""
+    for shard_queryset in on_each_shard(queryset):
+        try:
+            return shard_queryset.get(**lookup)
+        except queryset.model.DoesNotExist:
+            pass
+    raise queryset.model.DoesNotExist(
+        f"{queryset.model._meta.object_name} matching query does not exist."
+    )
+
+
+def merge_shards(querysets, key, reverse=False):
+    """
+    Merges the rows of querysets sorted by ``key`` into one sorted iterator.
+
+    Slice the querysets to the number of rows needed: each is fetched
+    whole when the merge first reads from it.
+    """
+    if len(querysets) == 1:
+        return iter(querysets[0])
+    return heapq.merge(*querysets, key=key, reverse=reverse)
+
+
+@contextmanager
+def atomic_on(aliases):
+    """One transaction (or savepoint) per database; the first commits last"""
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+class ShardRouter:
+    """
+    Routes rules and traffic buckets that are known to the router through
+    the ``instance`` hint: saves, deletes and related managers. Other
+    queries fall through to the next router.
+    """
+
+    def _db_for_instance(self, model, **hints):
+        if model not in (RedirectRule, TrafficBucket) or not is_sharded():
+            return None
+        instance = hints.get("instance")
+        if isinstance(instance, RedirectRule):
+            if not instance._state.adding and instance._state.db:
+                return instance._state.db
+            if instance.redirect_identifier:
+                return shard_for(instance.redirect_identifier)
+        elif isinstance(instance, TrafficBucket):
+            # Set from the rule when the bucket was created
+            return instance._state.db
+        return None
+
+    db_for_read = _db_for_instance
+    db_for_write = _db_for_instance
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not connections[db].settings_dict.get("SHARD"):
+            return None
+        return app_label in SHARD_APPS
+
+
+@receiver(pre_delete, sender=User)
+def _delete_sharded_rules(sender, instance, using, **kwargs):
+    """Cascades to the rules on the shards, which the deletion does not reach"""
+    for alias in get_shards():
+        RedirectRule.objects.using(alias).filter(owner_id=instance.pk).delete()
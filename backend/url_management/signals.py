@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent after rules inserted with bulk_create (which skips post_save) have
+# been committed. Provides ``redirect_identifiers``.
+redirect_rules_created = Signal()
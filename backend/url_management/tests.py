@@ -1,13 +1,35 @@
 import json
+import pkgutil
+import random
+import threading
+import time
 import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from importlib import import_module
+from io import StringIO
 from pathlib import Path
 
 import pytest
+from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.db.migrations.operations import AddIndex, RemoveIndex
+from django.test import AsyncClient, override_settings
 from rest_framework import status
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-from .models import RedirectRule
+from . import bulk, migrations
+from .formats import iter_json
+from .identifiers import RandomAllocator, SequenceAllocator, _Permutation
+from .management.commands import load_redirect_rules
+from .models import RedirectRule, TrafficBucket
+from .operations import AddIndexConcurrently, RemoveIndexConcurrently
+from .serializers import RedirectRuleSerializer
+from .sharding import jump_hash, shard_for
+from .traffic import add_traffic
 
 
 def load_fixture(filename):
@@ -56,17 +78,205 @@ def test_bulk_create_redirect_rules(bulk_create_redirect_rules):
     assert len(set(identifiers)) == len(identifiers)
 
 
-# @pytest.mark.django_db
-# def test_list_multiple_redirect_rules(auth_client, bulk_create_redirect_rules):
-#     """Test listing multiple redirect rules"""
-#     response = auth_client.get("/url/")
-#     assert response.status_code == status.HTTP_200_OK
-#     results = response.json()["results"]
-#     assert len(results) == 15  # Updated according to the number of rules in JSON
+@pytest.mark.django_db
+def test_list_multiple_redirect_rules(auth_client, bulk_create_redirect_rules):
+    """Test listing multiple redirect rules"""
+    response = auth_client.get("/url/")
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()["results"]
+    assert len(results) == 15  # Updated according to the number of rules in JSON
+
+    # Check sorting by created (default)
+    created_dates = [result["created"] for result in results]
+    assert created_dates == sorted(created_dates, reverse=True)
+
+
+@pytest.mark.django_db
+def test_bulk_endpoint_creates_rules(auth_client, user, redirect_rules_data):
+    """Tests creating the fixture rules with one request"""
+    data = redirect_rules_data["redirect_rules"]
+    response = auth_client.post("/url/bulk/", data, format="json")
+    assert response.status_code == status.HTTP_201_CREATED
+    created = response.json()["created"]
+    assert response.json()["errors"] == []
+    assert [rule["redirect_url"] for rule in created] == [rule["redirect_url"] for rule in data]
+    assert RedirectRule.objects.filter(owner=user).count() == len(data)
+    assert len({rule["redirect_identifier"] for rule in created}) == len(data)
+
+
+@pytest.mark.django_db
+def test_bulk_endpoint_reports_item_errors(auth_client):
+    """Tests that invalid items are reported without failing the batch"""
+    data = [
+        {"redirect_url": "https://example.com/1/", "is_private": False},
+        {"redirect_url": "invalid-url"},
+        {"redirect_url": "https://example.com/2/", "is_private": True},
+        {"is_private": True},
+    ]
+    response = auth_client.post("/url/bulk/", data, format="json")
+    assert response.status_code == status.HTTP_207_MULTI_STATUS
+    body = response.json()
+    assert len(body["created"]) == 2
+    assert [error["index"] for error in body["errors"]] == [1, 3]
+    assert "redirect_url" in body["errors"][0]["errors"]
+
+    response = auth_client.post("/url/bulk/", data[1:2], format="json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert RedirectRule.objects.count() == 2
+
+
+def test_bulk_item_errors_are_per_serializer():
+    """Tests that a batch never reports the errors of another"""
+    invalid = RedirectRuleSerializer(data=[{"redirect_url": "invalid-url"}], many=True)
+    invalid.is_valid()
+    valid = RedirectRuleSerializer(data=[{"redirect_url": "https://example.com/"}], many=True)
+    assert valid.item_errors == {}
+    assert valid.is_valid()
+    assert list(invalid.item_errors) == [0]
+    assert valid.item_errors == {}
+
+
+@pytest.mark.django_db
+@override_settings(REDIRECT_RULES_BULK={"MAX_ITEMS": 2, "BATCH_SIZE": 1})
+def test_bulk_endpoint_validates_batch(auth_client, api_client):
+    """Tests the batch-level checks of the bulk endpoint"""
+    rule = {"redirect_url": "https://example.com/"}
+    response = auth_client.post("/url/bulk/", [rule] * 3, format="json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = auth_client.post("/url/bulk/", rule, format="json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = api_client.post("/url/bulk/", [rule], format="json")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    response = auth_client.post("/url/bulk/", [rule] * 2, format="json")
+    assert response.status_code == status.HTTP_201_CREATED
+
+
+@pytest.mark.django_db
+def test_random_allocator_skips_taken(redirect_rule, monkeypatch):
+    """Tests that the legacy allocator draws colliding candidates again"""
+    allocator = RandomAllocator()
+    candidates = iter([redirect_rule.redirect_identifier, "aaaaaaaa", "aaaaaaaa", "bbbbbbbb"])
+    monkeypatch.setattr(allocator, "candidate", lambda: next(candidates))
+    assert sorted(allocator.allocate(2)) == ["aaaaaaaa", "bbbbbbbb"]
+
+
+@pytest.mark.django_db
+def test_sequence_allocator_is_collision_free(django_assert_num_queries):
+    """Tests identifiers from reserved sequence blocks"""
+    allocator = SequenceAllocator(block_size=100)
+    identifiers = allocator.allocate(60)
+    # Served from the reserved block
+    with django_assert_num_queries(0):
+        identifiers += allocator.allocate(30)
+    # One update and one read reserve the next block
+    with django_assert_num_queries(2):
+        identifiers += allocator.allocate(30)
+    identifiers += allocator.allocate()
+    assert len(set(identifiers)) == 121
+    assert all(len(identifier) == 8 for identifier in identifiers)
+    # Never in the namespace of the old 8 hex digit identifiers
+    assert not any(identifier[0] in "0123456789abcdef" for identifier in identifiers)
+    assert sorted(map(allocator.decode, identifiers)) == list(range(121))
+    assert allocator.decode("0123abcd") is None
+    assert not allocator.owns("short")
+
+
+def test_identifier_permutation_is_bijective():
+    """Tests the keyed permutation on a range that is not a power of two"""
+    permutation = _Permutation(1000, b"key")
+    values = [permutation.forward(number) for number in range(1000)]
+    assert sorted(values) == list(range(1000))
+    assert values != list(range(1000))
+    assert [permutation.backward(value) for value in values] == list(range(1000))
+
+
+@pytest.mark.django_db
+@override_settings(REDIRECT_IDENTIFIERS={
+    "ALLOCATOR": "url_management.identifiers.SequenceAllocator",
+    "ALPHABET": "abcdefghijklmnopqrstuvwxyz",
+    "LENGTH": 5,
+    "BLOCK_SIZE": 10,
+    "LEGACY_ALPHABET": "0123456789abcdef",
+})
+def test_configured_identifier_format(auth_client):
+    """Tests the length and alphabet settings"""
+    response = auth_client.post("/url/", {"redirect_url": "https://example.com/"})
+    identifier = response.json()["redirect_identifier"]
+    assert len(identifier) == 5
+    assert identifier[0] in "ghijklmnopqrstuvwxyz"
+    assert set(identifier) <= set("abcdefghijklmnopqrstuvwxyz")
 
-#     # Check sorting by created (default)
-#     created_dates = [result["created"] for result in results]
-#     assert created_dates == sorted(created_dates, reverse=True)
+
+@pytest.mark.django_db
+def test_sequence_allocator_reserves_imported_identifiers():
+    """Tests that identifiers loaded from an export are not handed out again"""
+    allocator = SequenceAllocator(block_size=10)
+    allocator.allocate()
+    imported = allocator.encode(500)
+    allocator.reserve([imported, "0123abcd"])
+    assert allocator.decode(allocator.allocate()[0]) > 500
+
+    other = SequenceAllocator(block_size=10)
+    assert other.decode(other.allocate()[0]) > 500
+
+
+@pytest.mark.skipif(connection.vendor == "postgresql", reason="Reserves from a sequence instead")
+@pytest.mark.django_db(transaction=True)
+def test_sequence_allocator_reservations_do_not_interleave():
+    """Tests that another process cannot move the counter between the update and the read"""
+    first, second = SequenceAllocator(block_size=10), SequenceAllocator(block_size=10)
+    first.allocate()
+    first._block.clear()
+    blocks = {}
+    other_done = threading.Event()
+
+    def reserve_in_other_process():
+        try:
+            while True:
+                try:
+                    blocks["second"] = list(second._reserve_numbers(10))
+                    break
+                except OperationalError:
+                    # Locked by the first reservation
+                    time.sleep(0.01)
+        finally:
+            connections.close_all()
+            other_done.set()
+
+    thread = threading.Thread(target=reserve_in_other_process)
+
+    def pause_after_update(execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if sql.startswith("UPDATE") and not thread.is_alive() and not other_done.is_set():
+            thread.start()
+            # Long enough for the other reservation, unless it waits for ours
+            other_done.wait(0.5)
+        return result
+
+    with connection.execute_wrapper(pause_after_update):
+        blocks["first"] = list(first._reserve_numbers(10))
+    thread.join(5)
+    assert blocks["first"] and blocks["second"]
+    assert not set(blocks["first"]) & set(blocks["second"])
+
+
+@pytest.mark.django_db
+@override_settings(REDIRECT_IDENTIFIERS={"ALLOCATOR": "url_management.identifiers.RandomAllocator"})
+def test_legacy_random_allocator(auth_client):
+    """Tests that the random hex identifiers can still be configured"""
+    response = auth_client.post("/url/", {"redirect_url": "https://example.com/"})
+    int(response.json()["redirect_identifier"], 16)
+
+
+@pytest.mark.django_db
+def test_bulk_create_rules_retries_lost_identifiers(user, redirect_rule, monkeypatch):
+    """Tests that a batch racing a concurrent insert gets new identifiers"""
+    allocations = iter([[redirect_rule.redirect_identifier], ["cccccccc"]])
+    monkeypatch.setattr(bulk, "allocate_identifiers", lambda count: next(allocations))
+    rule = RedirectRule(owner=user, redirect_url="https://example.com/race/")
+    bulk.bulk_create_rules([rule])
+    assert RedirectRule.objects.get(pk=rule.pk).redirect_identifier == "cccccccc"
 
 
 @pytest.fixture
@@ -106,12 +316,44 @@ def redirect_rule(user):
     )
 
 
-# @pytest.mark.django_db
-# def test_list_redirect_rules(auth_client, redirect_rule):
-#     """Tests retrieval of redirect rules"""
-#     response = auth_client.get("/url/")
-#     assert response.status_code == status.HTTP_200_OK
-#     assert len(response.json()["results"]) > 0
+@pytest.mark.django_db
+def test_list_redirect_rules(auth_client, redirect_rule):
+    """Tests retrieval of redirect rules"""
+    response = auth_client.get("/url/")
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()["results"]) > 0
+
+
+@pytest.mark.django_db
+def test_list_redirect_rules_keyset_pages(auth_client, user, other_user, django_assert_num_queries):
+    """Tests walking all pages, including rules created at the same instant"""
+    created = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rules = [RedirectRule.objects.create(owner=user, redirect_url=f"https://example.com/{i}")
+             for i in range(7)]
+    # Ties on created are broken by id
+    RedirectRule.objects.filter(pk__in=[rule.pk for rule in rules[:4]]).update(created=created)
+    RedirectRule.objects.create(owner=other_user, redirect_url="https://example.com/other")
+
+    seen = []
+    url = "/url/?page_size=3"
+    while url:
+        # No COUNT(*): one query per page
+        with django_assert_num_queries(1):
+            response = auth_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert "count" not in response.json()
+        seen += [rule["id"] for rule in response.json()["results"]]
+        url = response.json()["next"]
+
+    expected = RedirectRule.objects.filter(owner=user).order_by("-created", "-id")
+    assert seen == [str(rule.pk) for rule in expected]
+
+
+@pytest.mark.django_db
+def test_list_redirect_rules_invalid_cursor(auth_client, redirect_rule):
+    """Tests that a malformed cursor is rejected"""
+    response = auth_client.get("/url/", {"cursor": "not-a-cursor"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
 
 
 @pytest.mark.django_db
@@ -257,3 +499,455 @@ def test_update_redirect_rule_validation(auth_client, redirect_rule):
     response = auth_client.patch(f"/url/{redirect_rule.id}/", data)
     assert response.status_code == status.HTTP_400_BAD_REQUEST
     assert "redirect_url" in response.json()
+
+
+@pytest.mark.django_db
+def test_redirect_status_and_cache_max_age(auth_client, redirect_rule):
+    """Tests choosing the redirect status and how long it may be cached"""
+    assert redirect_rule.redirect_status == 302
+    assert redirect_rule.cache_max_age is None
+
+    data = {"redirect_status": 308, "cache_max_age": 3600}
+    response = auth_client.patch(f"/url/{redirect_rule.id}/", data)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["redirect_status"] == 308
+    assert response.json()["cache_max_age"] == 3600
+
+    for data in (
+        {"redirect_status": 303},
+        {"cache_max_age": -1},
+        {"cache_max_age": RedirectRule.MAX_CACHE_AGE + 1},
+    ):
+        response = auth_client.patch(f"/url/{redirect_rule.id}/", data)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(response.json()) == set(data)
+
+
+@pytest.mark.django_db
+def test_redirect_rule_clicks(auth_client, redirect_rule):
+    """Tests reading the click count of an own rule"""
+    RedirectRule.objects.filter(pk=redirect_rule.pk).update(hits=7)
+    response = auth_client.get(f"/url/{redirect_rule.id}/clicks/")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "id": str(redirect_rule.id),
+        "redirect_identifier": redirect_rule.redirect_identifier,
+        "hits": 7,
+    }
+
+
+@pytest.mark.django_db
+def test_redirect_rule_clicks_other_user(other_user, api_client, redirect_rule):
+    """Tests that click counts are visible only to the owner"""
+    api_client.force_authenticate(user=other_user)
+    response = api_client.get(f"/url/{redirect_rule.id}/clicks/")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def _hour(*args):
+    """Hours since the epoch of a UTC datetime"""
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp()) // 3600
+
+
+@pytest.mark.django_db
+def test_add_traffic_rolls_up_hours_and_days(redirect_rule):
+    """Tests that hits are added to hourly and daily buckets incrementally"""
+    identifier = redirect_rule.redirect_identifier
+    add_traffic({(identifier, _hour(2025, 1, 1, 10)): 2, (identifier, _hour(2025, 1, 1, 11)): 3})
+    add_traffic({(identifier, _hour(2025, 1, 1, 10)): 1, ("missing", _hour(2025, 1, 1, 10)): 4})
+
+    buckets = {
+        (bucket.granularity, bucket.start.hour): bucket.hits
+        for bucket in TrafficBucket.objects.all()
+    }
+    assert buckets == {("hour", 10): 3, ("hour", 11): 3, ("day", 0): 6}
+
+
+@pytest.mark.django_db
+def test_redirect_rule_stats(auth_client, redirect_rule):
+    """Tests time-range queries over the traffic buckets"""
+    identifier = redirect_rule.redirect_identifier
+    add_traffic({(identifier, _hour(2025, 1, 1, 10)): 2, (identifier, _hour(2025, 1, 2, 1)): 5})
+
+    response = auth_client.get(
+        f"/url/{redirect_rule.id}/stats/",
+        {"start": "2025-01-01T09:30:00Z", "end": "2025-01-01T12:00:00Z"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["start"] == "2025-01-01T09:00:00Z"
+    assert data["total"] == 2
+    assert [bucket["hits"] for bucket in data["buckets"]] == [0, 2, 0]
+
+    response = auth_client.get(
+        f"/url/{redirect_rule.id}/stats/",
+        {"granularity": "day", "start": "2025-01-01", "end": "2025-01-03"},
+    )
+    assert [bucket["hits"] for bucket in response.json()["buckets"]] == [2, 5]
+
+
+@pytest.mark.django_db
+def test_redirect_rule_stats_validation(auth_client, other_user, api_client, redirect_rule):
+    """Tests range validation and owner-only access of the stats API"""
+    url = f"/url/{redirect_rule.id}/stats/"
+    response = auth_client.get(url, {"start": "2025-01-02T00:00:00Z", "end": "2025-01-01T00:00:00Z"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = auth_client.get(url, {"start": "2024-01-01T00:00:00Z", "end": "2025-01-01T00:00:00Z"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = auth_client.get(url)
+    assert len(response.json()["buckets"]) == 24
+
+    api_client.force_authenticate(user=other_user)
+    assert api_client.get(url).status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+def test_compact_redirect_traffic(redirect_rule):
+    """Tests that compaction drops old hourly buckets but keeps daily totals"""
+    identifier = redirect_rule.redirect_identifier
+    add_traffic({(identifier, _hour(2020, 1, 1, 10)): 2, (identifier, _hour(2020, 1, 1, 11)): 3})
+    out = StringIO()
+    call_command("compact_redirect_traffic", "--hourly-days", "7", stdout=out)
+
+    assert "Deleted 2 hourly and 0 daily" in out.getvalue()
+    assert list(TrafficBucket.objects.values_list("granularity", "hits")) == [("day", 5)]
+
+
+def test_iter_json_streams_items(redirect_rules_data):
+    """Tests incremental JSON parsing across chunk boundaries"""
+    fixture_path = Path(__file__).parent / "tests" / "fixtures" / "redirect_rules.json"
+    with open(fixture_path) as f:
+        items = list(iter_json(f, chunk_size=7))
+    assert items == redirect_rules_data["redirect_rules"]
+
+    document = '{"version": [1, {"a": "]"}], "redirect_rules": [12345, {"x": 1} ] , "z": 0}'
+    assert list(iter_json(StringIO(document), chunk_size=3)) == [12345, {"x": 1}]
+    assert list(iter_json(StringIO(" [ ] "), chunk_size=1)) == []
+    with pytest.raises(ValueError):
+        list(iter_json(StringIO('{"other": []}')))
+
+
+def test_iter_json_fails_early_on_malformed_items():
+    """Tests that a malformed item does not buffer the rest of the stream"""
+    class CountingIO(StringIO):
+        size = 0
+
+        def read(self, size=-1):
+            data = super().read(size)
+            self.size += len(data)
+            return data
+
+    document = CountingIO(
+        '[{"a": 0}, {"a": tru}, '
+        + ", ".join(f'{{"a": {i}}}' for i in range(100000))
+        + "]"
+    )
+    items = iter_json(document, chunk_size=64, max_value_size=1024)
+    assert next(items) == {"a": 0}
+    with pytest.raises(ValueError, match="Malformed JSON value"):
+        next(items)
+    assert document.size < 2048
+
+    # Items larger than a chunk are still read whole
+    large = {"url": "x" * 5000}
+    assert list(iter_json(StringIO(f"[{json.dumps(large)}]"), chunk_size=64)) == [large]
+
+
+@pytest.mark.django_db
+def test_load_redirect_rules_json(user):
+    """Tests loading the JSON fixture in batches"""
+    out = StringIO()
+    call_command(
+        "load_redirect_rules", "--username", user.username, "--batch-size", "4",
+        "--no-copy", stdout=out,
+    )
+    assert "Successfully created 15 redirect rules" in out.getvalue()
+    assert "15 records read, 15 rules created" in out.getvalue()
+    assert RedirectRule.objects.filter(owner=user).count() == 15
+    assert not Path("url_management/tests/fixtures/redirect_rules.json.checkpoint").exists()
+
+
+@pytest.mark.django_db
+def test_load_redirect_rules_ndjson_and_csv(user, tmp_path):
+    """Tests the NDJSON and CSV formats, kept identifiers and invalid records"""
+    ndjson = tmp_path / "rules.ndjson"
+    ndjson.write_text(
+        '{"redirect_url": "https://example.com/a", "redirect_identifier": "old00001"}\n'
+        '\n'
+        '{"redirect_url": "not a url"}\n'
+        '{"redirect_url": "https://example.com/b", "is_private": true}\n'
+    )
+    csv_file = tmp_path / "rules.csv"
+    csv_file.write_text(
+        "redirect_url,is_private,redirect_identifier\n"
+        "https://example.com/c,true,\n"
+        "https://example.com/d,,old/0002\n"
+        "https://example.com/e,0,old00003\n"
+    )
+    for path in (ndjson, csv_file):
+        out, err = StringIO(), StringIO()
+        call_command(
+            "load_redirect_rules", "--username", user.username, "--file", str(path),
+            stdout=out, stderr=err,
+        )
+        assert "Successfully created 2 redirect rules" in out.getvalue()
+        assert "Skipped 1 invalid records" in out.getvalue()
+        assert "Record 2" in err.getvalue()
+
+    rules = dict(RedirectRule.objects.values_list("redirect_url", "is_private"))
+    assert rules == {
+        "https://example.com/a": False,
+        "https://example.com/b": True,
+        "https://example.com/c": True,
+        "https://example.com/e": False,
+    }
+    assert set(RedirectRule.objects.values_list("redirect_identifier", flat=True)) >= {
+        "old00001", "old00003",
+    }
+
+
+@pytest.mark.django_db
+def test_load_redirect_rules_resumes(user, tmp_path, monkeypatch):
+    """Tests resuming a load that failed part way through"""
+    path = tmp_path / "rules.ndjson"
+    path.write_text("".join(
+        json.dumps({"redirect_url": f"https://example.com/{i}"}) + "\n" for i in range(10)
+    ))
+    insert = load_redirect_rules.bulk_create_rules
+    calls = []
+
+    def flaky_insert(rules):
+        calls.append(len(rules))
+        if len(calls) == 3:
+            raise RuntimeError("connection lost")
+        return insert(rules)
+
+    monkeypatch.setattr(load_redirect_rules, "bulk_create_rules", flaky_insert)
+    args = ["load_redirect_rules", "--username", user.username, "--file", str(path),
+            "--batch-size", "3", "--no-copy"]
+    with pytest.raises(CommandError, match="--resume"):
+        call_command(*args, stdout=StringIO())
+    assert RedirectRule.objects.count() == 6
+
+    call_command(*args, "--resume", stdout=StringIO())
+    assert RedirectRule.objects.count() == 10
+    assert sorted(RedirectRule.objects.values_list("redirect_url", flat=True)) == sorted(
+        f"https://example.com/{i}" for i in range(10)
+    )
+    assert not Path(f"{path}.checkpoint").exists()
+
+
+@pytest.mark.django_db
+def test_load_redirect_rules_resume_after_commit(user, tmp_path):
+    """Tests that a batch committed before its checkpoint was updated is skipped"""
+    path = tmp_path / "rules.ndjson"
+    path.write_text("".join(
+        json.dumps({"redirect_url": f"https://example.com/{i}"}) + "\n" for i in range(4)
+    ))
+    committed = RedirectRule.objects.create(owner=user, redirect_url="https://example.com/0")
+    Path(f"{path}.checkpoint").write_text(json.dumps({
+        "file": str(path.resolve()),
+        "records": 0,
+        "pending": {"records": 1, "marker": str(committed.pk)},
+    }))
+    out = StringIO()
+    call_command(
+        "load_redirect_rules", "--username", user.username, "--file", str(path),
+        "--resume", stdout=out,
+    )
+    assert "Resuming after 1 records" in out.getvalue()
+    assert RedirectRule.objects.count() == 4
+
+
+@pytest.mark.django_db
+def test_export_redirect_rules_command(user, other_user, tmp_path):
+    """Tests exporting rules and loading the CSV export back"""
+    RedirectRule.objects.create(owner=user, redirect_url="https://example.com/1", is_private=True)
+    RedirectRule.objects.create(owner=other_user, redirect_url="https://example.com/2")
+
+    out = StringIO()
+    call_command("export_redirect_rules", "--chunk-size", "1", stdout=out)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert sorted(line["redirect_url"] for line in lines) == [
+        "https://example.com/1", "https://example.com/2",
+    ]
+
+    path = tmp_path / "rules.csv"
+    err = StringIO()
+    call_command(
+        "export_redirect_rules", "--username", user.username, "--format", "csv",
+        "--output", str(path), stdout=StringIO(), stderr=err,
+    )
+    assert "Exported 1 redirect rules" in err.getvalue()
+    exported = RedirectRule.objects.get(owner=user)
+    exported.delete()
+    call_command("load_redirect_rules", "--username", user.username, "--file", str(path),
+                 stdout=StringIO())
+    loaded = RedirectRule.objects.get(owner=user)
+    assert (loaded.redirect_identifier, loaded.is_private) == (exported.redirect_identifier, True)
+
+
+@pytest.mark.django_db
+def test_export_api_streams_own_rules(auth_client, user, other_user):
+    """Tests the owner-scoped streaming export"""
+    for i in range(3):
+        RedirectRule.objects.create(owner=user, redirect_url=f"https://example.com/{i}")
+    RedirectRule.objects.create(owner=other_user, redirect_url="https://example.com/other")
+
+    response = auth_client.get("/url/export/")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.streaming
+    assert response["Content-Type"] == "application/x-ndjson"
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    assert len(lines) == 3
+    assert {json.loads(line)["redirect_url"] for line in lines} == {
+        f"https://example.com/{i}" for i in range(3)
+    }
+
+    response = auth_client.get("/url/export/", {"output": "csv"})
+    rows = b"".join(response.streaming_content).decode().splitlines()
+    assert rows[0].startswith("id,created,modified,redirect_url")
+    assert len(rows) == 4
+
+    assert auth_client.get("/url/export/", {"output": "xml"}).status_code == 400
+
+
+@pytest.mark.django_db(transaction=True)
+def test_export_api_streams_under_asgi(user):
+    """Tests that the export is streamed asynchronously under ASGI"""
+    RedirectRule.objects.create(owner=user, redirect_url="https://example.com/async")
+    headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+
+    async def download():
+        response = await AsyncClient().get("/url/export/", headers=headers)
+        assert response.is_async
+        return b"".join([block async for block in response.streaming_content])
+
+    line = json.loads(async_to_sync(download)())
+    assert line["redirect_url"] == "https://example.com/async"
+
+
+SHARDS = ["shard_0", "shard_1"]
+
+
+@pytest.fixture
+def shards(settings):
+    """Spreads the rules over the two stand-in shards"""
+    settings.DATABASE_SHARDS = {"ALIASES": SHARDS, "PREVIOUS_ALIASES": []}
+    return SHARDS
+
+
+def test_jump_hash_only_moves_keys_to_new_buckets():
+    """Tests the balance and the minimal movement of the shard hash"""
+    rng = random.Random(0)
+    keys = [rng.getrandbits(64) for _ in range(3000)]
+    before = [jump_hash(key, 3) for key in keys]
+    after = [jump_hash(key, 4) for key in keys]
+    assert all(800 < count < 1200 for count in Counter(before).values())
+    moved = [bucket for old, bucket in zip(before, after) if old != bucket]
+    assert set(moved) == {3}
+    assert 600 < len(moved) < 900
+
+
+@pytest.mark.django_db(databases=["default", *SHARDS])
+def test_sharded_rules_api(shards, auth_client, user, other_user):
+    """Tests creating, listing and managing rules spread over shards"""
+    ids = [
+        auth_client.post("/url/", {"redirect_url": f"https://example.com/{i}"}).json()["id"]
+        for i in range(12)
+    ]
+    response = auth_client.post(
+        "/url/bulk/", [{"redirect_url": f"https://example.com/bulk/{i}"} for i in range(8)],
+        format="json",
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    ids += [rule["id"] for rule in response.json()["created"]]
+    RedirectRule.objects.create(owner=other_user, redirect_url="https://example.com/other")
+
+    assert not RedirectRule.objects.using("default").exists()
+    for alias in shards:
+        identifiers = RedirectRule.objects.using(alias).values_list("redirect_identifier", flat=True)
+        assert identifiers
+        assert {shard_for(identifier) for identifier in identifiers} == {alias}
+
+    # Pages merge the shards newest first
+    listed, url = [], "/url/?page_size=3"
+    while url:
+        body = auth_client.get(url).json()
+        listed += [rule["id"] for rule in body["results"]]
+        url = body["next"]
+    created = {}
+    for alias in shards:
+        created.update(RedirectRule.objects.using(alias).values_list("id", "created"))
+    assert listed == [
+        str(pk) for pk in sorted(
+            (uuid.UUID(pk) for pk in ids), key=lambda pk: (created[pk], pk), reverse=True
+        )
+    ]
+
+    lines = b"".join(auth_client.get("/url/export/").streaming_content).decode().splitlines()
+    assert len(lines) == 20
+
+    rule_id = ids[0]
+    response = auth_client.patch(f"/url/{rule_id}/", {"redirect_url": "https://example.com/new"})
+    assert response.status_code == status.HTTP_200_OK
+    assert auth_client.get(f"/url/{rule_id}/clicks/").json()["hits"] == 0
+    assert auth_client.get(f"/url/{rule_id}/stats/").json()["total"] == 0
+    assert auth_client.delete(f"/url/{rule_id}/").status_code == status.HTTP_204_NO_CONTENT
+    assert auth_client.delete(f"/url/{rule_id}/").status_code == status.HTTP_404_NOT_FOUND
+
+    # Deleting an owner reaches the shards
+    user.delete()
+    remaining = [RedirectRule.objects.using(alias).get() for alias in shards
+                 if RedirectRule.objects.using(alias).exists()]
+    assert [rule.owner_id for rule in remaining] == [other_user.pk]
+
+
+@pytest.mark.django_db(databases=["default", *SHARDS])
+def test_reshard_redirect_rules(settings, user):
+    """Tests moving the rules from default onto shards and back to one shard"""
+    rules = [
+        RedirectRule.objects.create(owner=user, redirect_url=f"https://example.com/{i}")
+        for i in range(20)
+    ]
+    add_traffic({(rules[0].redirect_identifier, 480000): 3})
+
+    settings.DATABASE_SHARDS = {"ALIASES": SHARDS, "PREVIOUS_ALIASES": ["default"]}
+    out = StringIO()
+    call_command("reshard_redirect_rules", "--dry-run", stdout=out)
+    assert "Would move 20 of 20 redirect rules" in out.getvalue()
+    assert RedirectRule.objects.using("default").count() == 20
+
+    call_command("reshard_redirect_rules", "--batch-size", "7", stdout=out)
+    assert "Moved 20 of 20 redirect rules" in out.getvalue()
+    assert not RedirectRule.objects.using("default").exists()
+    for rule in rules:
+        assert RedirectRule.objects.using(shard_for(rule.redirect_identifier)).filter(pk=rule.pk).exists()
+    moved = TrafficBucket.objects.using(shard_for(rules[0].redirect_identifier))
+    assert sorted(moved.values_list("granularity", "hits")) == [("day", 3), ("hour", 3)]
+
+    # Shrinking to one shard moves the rules of the removed one
+    on_second = RedirectRule.objects.using("shard_1").count()
+    settings.DATABASE_SHARDS = {"ALIASES": ["shard_0"], "PREVIOUS_ALIASES": SHARDS}
+    out = StringIO()
+    call_command("reshard_redirect_rules", stdout=out)
+    assert f"Moved {on_second} of 20 redirect rules" in out.getvalue()
+    assert RedirectRule.objects.using("shard_0").count() == 20
+    assert TrafficBucket.objects.using("shard_0").count() == 2
+
+
+def test_index_migrations_do_not_block_writes():
+    """Tests that indexes on existing tables are built concurrently"""
+    for module in pkgutil.iter_modules(migrations.__path__):
+        name = module.name
+        migration = import_module(f"{migrations.__name__}.{name}").Migration
+        indexes = [
+            operation for operation in migration.operations
+            if isinstance(operation, (AddIndex, RemoveIndex))
+        ]
+        if indexes:
+            assert not migration.atomic, name
+            assert all(
+                isinstance(operation, (AddIndexConcurrently, RemoveIndexConcurrently))
+                for operation in indexes
+            ), name
@@ -0,0 +1,87 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone as django_timezone
+
+from .models import RedirectRule, TrafficBucket
+from .sharding import on_each_shard
+
+__all__ = ["BUCKET_SIZES", "bucket_floor", "add_traffic", "compact_traffic"]
+
+BUCKET_SIZES = {
+    TrafficBucket.Granularity.HOUR: timedelta(hours=1),
+    TrafficBucket.Granularity.DAY: timedelta(days=1),
+}
+
+
+def bucket_floor(moment, granularity):
+    """Returns the start of the bucket containing ``moment`` (UTC)"""
+    moment = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if granularity == TrafficBucket.Granularity.DAY:
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def _upsert_sql(connection):
+    quote = connection.ops.quote_name
+    bucket = quote(TrafficBucket._meta.db_table)
+    return (
+        f"INSERT INTO {bucket} ({quote('rule_id')}, {quote('granularity')}, "
+        f"{quote('start')}, {quote('hits')}) "
+        f"SELECT {quote('id')}, %s, %s, %s FROM {quote(RedirectRule._meta.db_table)} "
+        f"WHERE {quote('redirect_identifier')} = %s "
+        f"ON CONFLICT ({quote('rule_id')}, {quote('granularity')}, {quote('start')}) "
+        f"DO UPDATE SET {quote('hits')} = {bucket}.{quote('hits')} + excluded.{quote('hits')}"
+    )
+
+
+def add_traffic(counts, batch_size=500, using=DEFAULT_DB_ALIAS):
+    """
+    Adds hits to the hourly and daily buckets of their rules.
+
+    ``counts`` maps ``(redirect_identifier, hour)`` pairs, ``hour`` being
+    whole hours since the epoch, to a number of hits. Both granularities
+    are maintained incrementally with additive upserts, so concurrent
+    writers never lose counts and no raw events need to be kept. Hits of
+    identifiers without a rule in the ``using`` database are ignored.
+    """
+    buckets = Counter()
+    for (redirect_identifier, hour), hits in counts.items():
+        buckets[redirect_identifier, TrafficBucket.Granularity.HOUR, hour * 3600] += hits
+        buckets[redirect_identifier, TrafficBucket.Granularity.DAY, hour // 24 * 86400] += hits
+
+    connection = connections[using]
+    adapt = connection.ops.adapt_datetimefield_value
+    rows = [
+        (granularity.value, adapt(datetime.fromtimestamp(seconds, tz=timezone.utc)), hits, redirect_identifier)
+        for (redirect_identifier, granularity, seconds), hits in buckets.items()
+    ]
+    sql = _upsert_sql(connection)
+    with transaction.atomic(using=using, savepoint=False), connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+
+
+def compact_traffic(hourly_days, daily_days=None, now=None):
+    """
+    Deletes hourly buckets older than ``hourly_days`` and, if given, daily
+    buckets older than ``daily_days``.
+
+    Daily buckets are kept up to date alongside the hourly ones, so old
+    hours can be dropped without losing totals. Returns the number of
+    deleted hourly and daily buckets.
+    """
+    now = now or django_timezone.now()
+    deleted = []
+    for granularity, days in (
+        (TrafficBucket.Granularity.HOUR, hourly_days),
+        (TrafficBucket.Granularity.DAY, daily_days),
+    ):
+        if days is None:
+            deleted.append(0)
+            continue
+        cutoff = bucket_floor(now - timedelta(days=days), TrafficBucket.Granularity.DAY)
+        queryset = TrafficBucket.objects.filter(granularity=granularity, start__lt=cutoff)
+        deleted.append(sum(shard.delete()[0] for shard in on_each_shard(queryset)))
+    return tuple(deleted)
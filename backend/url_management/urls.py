@@ -1,8 +1,14 @@
 from django.urls import path
 
-from .views import RedirectRuleCreateAPI, RedirectRuleManageAPI
+from .views import (RedirectRuleBulkCreateAPI, RedirectRuleClicksAPI,
+                    RedirectRuleExportAPI, RedirectRuleListCreateAPI,
+                    RedirectRuleManageAPI, RedirectRuleStatsAPI)
 
 urlpatterns = [
-    path('', RedirectRuleCreateAPI.as_view(), name='redirect-rule-create'),
+    path('', RedirectRuleListCreateAPI.as_view(), name='redirect-rule-create'),
+    path('bulk/', RedirectRuleBulkCreateAPI.as_view(), name='redirect-rule-bulk-create'),
+    path('export/', RedirectRuleExportAPI.as_view(), name='redirect-rule-export'),
     path('<uuid:id>/', RedirectRuleManageAPI.as_view(), name='redirect-rule-manage'),
+    path('<uuid:id>/clicks/', RedirectRuleClicksAPI.as_view(), name='redirect-rule-clicks'),
+    path('<uuid:id>/stats/', RedirectRuleStatsAPI.as_view(), name='redirect-rule-stats'),
 ]
@@ -1,20 +1,76 @@
-from drf_spectacular.utils import OpenApiResponse, extend_schema
-from rest_framework import generics
+from itertools import chain
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, StreamingHttpResponse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, OpenApiResponse, extend_schema
+from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
+from .bulk import bulk_create_rules
+from .formats import CONTENT_TYPES, EXPORT_FIELDS, EXPORT_FORMATS, iter_export
 from .models import RedirectRule
-from .permissions import IsOwnerOrReadOnly
-from .serializers import RedirectRuleSerializer
+from .pagination import KeysetPagination
+from .permissions import IsOwner, IsOwnerOrReadOnly
+from .serializers import (RedirectRuleBulkResultSerializer,
+                          RedirectRuleClicksSerializer, RedirectRuleSerializer,
+                          RedirectRuleStatsSerializer, TrafficQuerySerializer)
+from .sharding import get_from_shards, on_each_shard
+from .traffic import BUCKET_SIZES
+
+__all__ = [
+    "RedirectRuleListCreateAPI",
+    "RedirectRuleCreateAPI",
+    "RedirectRuleBulkCreateAPI",
+    "RedirectRuleManageAPI",
+    "RedirectRuleClicksAPI",
+    "RedirectRuleStatsAPI",
+    "RedirectRuleExportAPI",
+]
+
 
-__all__ = ["RedirectRuleCreateAPI", "RedirectRuleManageAPI"]
+class ShardedObjectMixin:
+    """Looks the object up on every shard, as the URL does not name one"""
+
+    def get_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = get_from_shards(
+                queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
 
 
 @extend_schema(tags=["urls"])
-class RedirectRuleCreateAPI(generics.CreateAPIView):
-    """API for creating new redirect rules"""
+class RedirectRuleListCreateAPI(generics.ListCreateAPIView):
+    """API for listing and creating redirect rules"""
 
     permission_classes = [IsAuthenticated]
     serializer_class = RedirectRuleSerializer
+    pagination_class = KeysetPagination
+
+    @extend_schema(
+        summary="List redirect rules",
+        description=(
+            "List the redirect rules of the current user, newest first. "
+            "Follow the `next` link to get the following page."
+        ),
+        responses={
+            200: RedirectRuleSerializer(many=True),
+            401: OpenApiResponse(description="Unauthorized"),
+            404: OpenApiResponse(description="Invalid cursor"),
+        },
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
     @extend_schema(
         summary="Create a redirect rule",
@@ -29,13 +85,68 @@ class RedirectRuleCreateAPI(generics.CreateAPIView):
     def post(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
 
+    def get_queryset(self):
+        return RedirectRule.objects.filter(owner=self.request.user)
+
     def perform_create(self, serializer):
         """Sets the owner of the redirect rule to the current user"""
         serializer.save(owner=self.request.user)
 
 
+# Former name, from before the view also listed rules
+RedirectRuleCreateAPI = RedirectRuleListCreateAPI
+
+
+@extend_schema(tags=["urls"])
+class RedirectRuleBulkCreateAPI(generics.GenericAPIView):
+    """API for creating many redirect rules in one request"""
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = RedirectRuleSerializer
+
+    @extend_schema(
+        summary="Create redirect rules in bulk",
+        description=(
+            "Create a list of redirect rules for the current user. Each item is "
+            "validated on its own: valid items are created even if others fail, "
+            "and the errors are reported with the position of the failed item. "
+            "Returns 201 if every item was created, 207 if only some were."
+        ),
+        request=RedirectRuleSerializer(many=True),
+        responses={
+            201: RedirectRuleBulkResultSerializer,
+            207: RedirectRuleBulkResultSerializer,
+            400: OpenApiResponse(description="Invalid data"),
+            401: OpenApiResponse(description="Unauthorized"),
+        },
+    )
+    def post(self, request, *args, **kwargs):
+        options = settings.REDIRECT_RULES_BULK
+        serializer = self.get_serializer(
+            data=request.data, many=True, max_length=options["MAX_ITEMS"]
+        )
+        serializer.is_valid(raise_exception=True)
+        rules = bulk_create_rules(
+            [RedirectRule(owner=request.user, **data) for data in serializer.validated_data],
+            batch_size=options["BATCH_SIZE"],
+        )
+
+        errors = [
+            {"index": index, "errors": detail}
+            for index, detail in sorted(serializer.item_errors.items())
+        ]
+        if not errors:
+            status_code = status.HTTP_201_CREATED
+        elif rules:
+            status_code = status.HTTP_207_MULTI_STATUS
+        else:
+            status_code = status.HTTP_400_BAD_REQUEST
+        result = RedirectRuleBulkResultSerializer({"created": rules, "errors": errors})
+        return Response(result.data, status=status_code)
+
+
 @extend_schema(tags=["urls"])
-class RedirectRuleManageAPI(generics.UpdateAPIView, generics.DestroyAPIView):
+class RedirectRuleManageAPI(ShardedObjectMixin, generics.UpdateAPIView, generics.DestroyAPIView):
     """API for updating and deleting specific redirect rules"""
 
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
@@ -87,3 +198,148 @@ class RedirectRuleManageAPI(generics.UpdateAPIView, generics.DestroyAPIView):
 
     def get_queryset(self):
         return RedirectRule.objects.all()
+
+
+@extend_schema(tags=["urls"])
+class RedirectRuleClicksAPI(ShardedObjectMixin, generics.RetrieveAPIView):
+    """API for reading the click count of a redirect rule"""
+
+    permission_classes = [IsAuthenticated, IsOwner]
+    serializer_class = RedirectRuleClicksSerializer
+    lookup_field = 'id'
+
+    @extend_schema(
+        summary="Get redirect rule clicks",
+        description=(
+            "Number of redirects served for a rule. Clicks are buffered by "
+            "the redirector and flushed every few seconds. Available only to the owner."
+        ),
+        responses={
+            200: RedirectRuleClicksSerializer,
+            401: OpenApiResponse(description="Unauthorized"),
+            403: OpenApiResponse(description="Not the owner"),
+            404: OpenApiResponse(description="Not found"),
+        },
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return RedirectRule.objects.only('id', 'owner_id', 'redirect_identifier', 'hits')
+
+
+@extend_schema(tags=["urls"])
+class RedirectRuleStatsAPI(ShardedObjectMixin, generics.GenericAPIView):
+    """API for reading the traffic of a redirect rule over time"""
+
+    permission_classes = [IsAuthenticated, IsOwner]
+    serializer_class = RedirectRuleStatsSerializer
+    lookup_field = 'id'
+
+    @extend_schema(
+        summary="Get redirect rule traffic",
+        description=(
+            "Hits per hour or day (UTC) in the half-open range [start, end), "
+            "read from pre-aggregated buckets. Defaults to the last 24 hours or "
+            "30 days. Buckets without traffic are returned with zero hits. "
+            "Hourly buckets are kept for a limited time. Available only to the owner."
+        ),
+        parameters=[TrafficQuerySerializer],
+        responses={
+            200: RedirectRuleStatsSerializer,
+            400: OpenApiResponse(description="Invalid range"),
+            401: OpenApiResponse(description="Unauthorized"),
+            403: OpenApiResponse(description="Not the owner"),
+            404: OpenApiResponse(description="Not found"),
+        },
+    )
+    def get(self, request, *args, **kwargs):
+        rule = self.get_object()
+        query = TrafficQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        granularity, start, end = (
+            query.validated_data[key] for key in ('granularity', 'start', 'end')
+        )
+
+        hits = dict(
+            # Through the rule, so that its buckets are read from its database
+            rule.traffic.filter(
+                granularity=granularity, start__gte=start, start__lt=end
+            ).values_list('start', 'hits')
+        )
+        buckets = []
+        step, moment = BUCKET_SIZES[granularity], start
+        while moment < end:
+            buckets.append({'start': moment, 'hits': hits.get(moment, 0)})
+            moment += step
+
+        serializer = self.get_serializer({
+            'id': rule.id,
+            'granularity': granularity,
+            'start': start,
+            'end': end,
+            'total': sum(hits.values()),
+            'buckets': buckets,
+        })
+        return Response(serializer.data)
+
+    def get_queryset(self):
+        return RedirectRule.objects.only('id', 'owner_id')
+
+
+async def _aiter_blocks(blocks):
+    """Pulls blocks in a worker thread so ASGI streams them one by one"""
+    next_block = sync_to_async(next)
+    while True:
+        block = await next_block(blocks, None)
+        if block is None:
+            return
+        yield block
+
+
+@extend_schema(tags=["urls"])
+class RedirectRuleExportAPI(generics.GenericAPIView):
+    """API for downloading all redirect rules of the current user"""
+
+    permission_classes = [IsAuthenticated]
+    # Rows fetched from the database cursor at a time
+    chunk_size = 2000
+
+    @extend_schema(
+        summary="Export redirect rules",
+        description=(
+            "Stream every redirect rule of the current user as NDJSON (default) "
+            "or CSV. The file can be loaded back with load_redirect_rules."
+        ),
+        parameters=[
+            OpenApiParameter("output", OpenApiTypes.STR, enum=EXPORT_FORMATS),
+        ],
+        responses={
+            (200, "application/x-ndjson"): OpenApiTypes.STR,
+            (200, "text/csv"): OpenApiTypes.STR,
+            400: OpenApiResponse(description="Unknown output format"),
+            401: OpenApiResponse(description="Unauthorized"),
+        },
+    )
+    def get(self, request, *args, **kwargs):
+        # Not "format": DRF reserves it for choosing a renderer
+        fmt = request.query_params.get("output", "ndjson")
+        if fmt not in EXPORT_FORMATS:
+            return Response(
+                {"output": [f"Choose one of: {', '.join(EXPORT_FORMATS)}"]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        rows = chain.from_iterable(
+            queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=self.chunk_size)
+            for queryset in on_each_shard(
+                RedirectRule.objects.filter(owner=request.user).order_by()
+            )
+        )
+        blocks = iter_export(rows, fmt)
+        if isinstance(request._request, ASGIRequest):
+            # Django would read a sync iterator into memory before sending it
+            blocks = _aiter_blocks(blocks)
+        response = StreamingHttpResponse(blocks, content_type=CONTENT_TYPES[fmt])
+        response["Content-Disposition"] = f'attachment; filename="redirect-rules.{fmt}"'
+        return response
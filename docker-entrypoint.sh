@@ -35,11 +35,33 @@ function wait_for() {
 echo "Waiting till postgres database engine be available."
 wait_for ${DB_HOST:-my_project_db} ${DB_PORT:-5432} ${MAX_WAIT_TIMEOUT}
 
-# Apply database migrations
-python manage.py migrate
+# One-shot steps, e.g. `docker compose run --rm my_project_app migrate`
+case "$1" in
+    migrate)
+        exec python manage.py migrate --noinput
+        ;;
+    collectstatic)
+        exec python manage.py collectstatic --noinput
+        ;;
+    "")
+        ;;
+    *)
+        exec "$@"
+        ;;
+esac
 
-# Collect static files
-python manage.py collectstatic --noinput
+# Opt-in on start; production runs them once per release instead
+if [ "${RUN_MIGRATIONS:-false}" == "true" ]; then
+    python manage.py migrate --noinput
+fi
+if [ "${COLLECT_STATIC:-false}" == "true" ]; then
+    python manage.py collectstatic --noinput
+fi
 
-# Start the Django server
-python manage.py runserver 0.0.0.0:${BIND_PORT:-8000}
\ No newline at end of file
+if [ "${SERVER_MODE:-development}" == "production" ]; then
+    # Preforked uvicorn workers (WEB_WORKERS, WEB_KEEP_ALIVE, WEB_BACKLOG, ...)
+    exec python -m main_app.server
+fi
+
+# Start the Django development server
+exec python manage.py runserver 0.0.0.0:${BIND_PORT:-8000}